@@ -25,7 +25,13 @@ attributes and methods:
     def config(self):       # Things to do during program initialization.
                             # Note this method runs only once after the
                             # program starts
-    def acquire(self):      # Acquisition body
+    def acquire(self):      # Acquisition body. May also be defined as
+                            # 'async def acquire(self)', see async_driver.py
+    def acquire_point(point, parameters):
+                            # Static method computing one point of a
+                            # parallel sweep, see sweep.py, or method
+                            # measuring one point of an adaptive sweep, see
+                            # adaptive.py
     def save(self):         # Things to do when acquisition stops, e.g.,
                             # saving data
     def exit(self):         # Things to do when exiting the application
@@ -44,20 +50,138 @@ related parameters can be used with flexibility:
     self.__pause_request__  # Request to pause the application
     self.__stop_request__   # Request to stop the application
     self.__exit_request__   # Request to exit the application
+    self.run_snapshot       # Inputs and parameters of the current run,
+                            # frozen when it starts: read their values
+                            # with self.value('input_str'), see controls.py
+
+The following optional attributes tune how the framework handles the data:
+
+    self.acquisition_mode   # 'point': acquire() returns a dictionary of
+                            # single values or lists (default). 'block':
+                            # acquire() returns a dictionary of equal-length
+                            # 1-D NumPy arrays, or a structured array, holding
+                            # many samples per call. 'sweep': the points of
+                            # a grid of inputs are computed in parallel by
+                            # acquire_point(). 'adaptive': acquire_point()
+                            # is called where the outputs change most
+    self.sample_period      # Period (s) acquire() is called at in the Run
+                            # state, on drift-free monotonic deadlines, see
+                            # scheduler.py. None: as fast as possible
+    self.timestamp_column   # Column of the outputs receiving the time (s
+                            # since the start of the run) of each acquire()
+                            # call. None: no time stamps
+    self.sweep_inputs       # Names of the swept inputs, outermost first.
+                            # None: all inputs
+    self.sweep_workers      # Number of worker processes of a sweep. None:
+                            # the number of CPUs
+    self.sweep_ordered      # Stream the points of a sweep in grid order
+                            # instead of completion order
+    self.adaptive_output    # Output refined by an adaptive sweep. None: the
+                            # first one returned by acquire_point()
+    self.adaptive_tolerance # Change of the output (relative to its range)
+                            # below which an adaptive sweep stops refining
+    self.adaptive_max_points
+                            # Max number of points per adaptive curve. None:
+                            # the size of the grid
+    self.cache_results      # Cache the results of acquire_point() across
+                            # runs, for deterministic computations, see
+                            # result_cache.py
+    self.cache_dir          # Directory of the on-disk tier of the cache.
+                            # None: memory tier only
+    self.cache_memory_size  # Size limits (bytes) of the memory and disk
+    self.cache_disk_size    # tiers of the cache
+    self.cache_version      # Part of the cache keys: bump it when the code
+                            # of acquire_point() changes
+    self.async_workers      # Number of threads running the blocking calls
+                            # of a coroutine acquire(), see run_blocking()
+    self.pipeline_size      # Capacity of each queue between acquire() and
+                            # the processing, persistence and plotting stages
+    self.backpressure       # Policy of each queue when full: 'block',
+                            # 'drop-oldest' or 'drop-newest'
+    self.stream_interval    # Max time (s) acquired rows wait before they are
+                            # streamed to the outputs
+    self.stream_max_rows    # Number of waiting rows that triggers an early
+                            # stream
+    self.output_capacity    # Number of rows the outputs are preallocated
+                            # for, see output_store.py
+    self.max_live_rows      # Max number of rows kept in the outputs. Older
+                            # rows are spilled to disk. None: keep all rows
+    self.spill_dir          # Directory of the on-disk spill store. None: a
+                            # temporary directory, removed at exit
+    self.record_dir         # Directory where every run is recorded on disk
+                            # while it runs. None: no recording
+    self.record_chunk_rows  # Number of rows per chunk of a recording
+    self.message_log_size   # Number of messages kept in the status bar
+    self.instrumentation    # Time the stages of the data path and the
+                            # states, see diagnostics() and instrumentation.py
+    self.diagnostics_panel  # Show the figures of the instrumentation next to
+                            # the status bar (enables the instrumentation)
+    self.replay_path        # Recording (see record_dir) replayed through the
+                            # outputs instead of acquiring, see replay.py.
+                            # None: acquire from the instruments
+    self.replay_speed       # Replay speed relative to the acquisition. None:
+                            # show the whole recording at once, decimated
+    self.replay_time_column # Column holding the time (s) of each row. None:
+                            # use the times the chunks were written
+    self.broadcast_port     # Port serving the data patches of the outputs to
+                            # any number of viewers as server-sent events,
+                            # see broadcast.py. None: no broadcast
+    self.broadcast_host     # Address the broadcast listens on. Default:
+                            # '127.0.0.1'; set '0.0.0.0' on trusted networks
+                            # only, there is no authentication
+    self.broadcast_origins  # Origins of the pages allowed to follow the
+                            # broadcast. None: the Flask app on localhost
+    self.aggregator_address # (host, port) the application listens on for
+                            # worker processes acquiring for it, see
+                            # distributed.py and run_worker(). None: acquire
+                            # in this process
+    self.worker_count       # Number of workers a run of the aggregator waits
+                            # for. On a worker: number of workers of the run
+    self.worker_index       # On a worker: its rank in the run, to take its
+                            # share of the inputs. None: not a worker
+    self.worker_column      # Column of the outputs receiving the id of the
+                            # worker of each row. None: no such column
+    self.worker_authkey     # Shared secret of the aggregator and its workers
+                            # (bytes). None: only on loopback addresses
 """
 
 
 from __future__ import print_function
 from threading import Thread
-from bokeh.models import ColumnDataSource
-from acquisition_app_UI import AcquisitionAPPUI
 from acquisition_app_statemachine import AcquisitionAPPStateMachine
-import copy
+from statemachine import Requests
+from stream_buffer import StreamBuffer
+from data_store import ChunkStore
+from output_store import OutputStore
+from parse_cache import ParseCache, is_pure
+from pipeline import Pipeline
+from message_log import MessageLog
+from instrumentation import Instrumentation
+from broadcast import Broadcaster, BroadcastServer, DEFAULT_ORIGINS
+from scheduler import FixedRateScheduler
+from controls import ControlSchema
+from functools import partial
 import numpy as np
+import os
+import tempfile
 import time
 import sys
 
 
+def request_property(name):
+    """
+    Return a property mapping a UI event variable, e.g., __stop_request__, to
+    flag name of the application's thread-safe requests.
+    """
+    def getter(self):
+        return self.__requests__.get(name)
+
+    def setter(self, value):
+        self.__requests__.set(name, value)
+
+    return property(getter, setter)
+
+
 class AcquisitionAPP(object):
     """
     Create a simple browser-based data acquisition application.
@@ -76,6 +200,32 @@ class AcquisitionAPP(object):
     a list input instead of three separate inputs for start, stop, and step.
     """
 
+    # UI events related variables. They are backed by thread-safe request
+    # flags the state machine blocks on, so setting one wakes it up at once
+    __run_request__ = request_property('run')
+    __pause_request__ = request_property('pause')
+    __stop_request__ = request_property('stop')
+    __exit_request__ = request_property('exit')
+
+    @property
+    def __message__(self):
+        """
+        Messages of the status bar: a bounded log of the latest entries, see
+        message_log.py. Append to it with
+        self.__message__ += "<p><font color='red'>Error: ...</font><p>".
+        """
+        if self.__messages__ is None:
+            self.__messages__ = MessageLog(self.message_log_size)
+        return self.__messages__
+
+    @__message__.setter
+    def __message__(self, value):
+        # += hands the log itself back: the message is already in it
+        if value is not self.__message__:
+            self.__message__.clear()
+            if value:
+                self.__message__ += value
+
     def __init__(self, app_name):
         """
         Define a few application level parameters.
@@ -113,11 +263,111 @@ class AcquisitionAPP(object):
         # Cosmetics for the control panel
         self.ctrl_panel_ncols = 1       # Number of columns
 
+        # Acquisition mode. In 'block' mode acquire() returns NumPy arrays of
+        # many samples that are passed to the outputs without conversion
+        self.acquisition_mode = 'point'
+
+        # Fixed-rate acquisition. Instead of sleeping in acquire(), declare
+        # the sample period: missed deadlines are counted, see scheduler.py
+        self.sample_period = None       # None: call acquire() back to back
+        self.timestamp_column = None    # e.g., 't', which empty_data must hold
+
+        # Parallel sweep ('sweep' mode): the points of the grid of the swept
+        # inputs are computed by acquire_point() in worker processes
+        self.sweep_inputs = None        # None: all inputs, in order
+        self.sweep_workers = None       # None: the number of CPUs
+        self.sweep_ordered = False      # True: stream the points in grid order
+
+        # Adaptive sweep ('adaptive' mode): the last of the swept inputs is
+        # measured where the output changes most, see adaptive.py
+        self.adaptive_output = None     # None: first output of acquire_point()
+        self.adaptive_tolerance = 0.05  # Stop once every interval changes less
+        self.adaptive_max_points = None # Per curve. None: the size of the grid
+
+        # Result cache of acquire_point() ('sweep' and 'adaptive' modes) for
+        # deterministic computations: only missing points are computed
+        self.cache_results = False
+        self.cache_dir = None           # None: memory tier only
+        self.cache_memory_size = 64 * 2**20     # Bytes
+        self.cache_disk_size = 2**30            # Bytes
+        self.cache_version = 0          # Bump it when acquire_point() changes
+
+        # Number of threads for the blocking calls of a coroutine acquire(),
+        # see run_blocking(). None: the default of ThreadPoolExecutor
+        self.async_workers = None
+
+        # Pipeline between acquire() and the outputs, see pipeline.py. Each
+        # stage has a bounded queue; when one is full, 'block' waits for room
+        # while 'drop-oldest'/'drop-newest' drop rows (shown in the status bar)
+        self.pipeline_size = 10000
+        self.backpressure = {'raw': 'block', 'persistence': 'block',
+                             'plot': 'block'}
+
+        # Streaming of the acquired data to the outputs. Rows from many
+        # acquire() calls are merged into one outputs.stream() patch
+        self.stream_interval = 0.1      # Max time (s) a row waits for a flush
+        self.stream_max_rows = 1000     # Flush earlier once this many rows wait
+
+        # Server-side store of the outputs, preallocated for output_capacity
+        # rows and grown by doubling when a run needs more, see output_store.py
+        self.output_capacity = 100000
+
+        # Retention of the outputs. Only the latest max_live_rows rows are kept
+        # in the live plot source; older rows are spilled to an append-only
+        # store on disk, see to_df()
+        self.max_live_rows = None       # None: keep everything in the outputs
+        self.spill_dir = None           # None: use a temporary directory,
+                                        # removed in the Exit state
+
+        # Recording. When record_dir is set, every run is persisted in chunks
+        # by a background writer thread while it runs, see recorder.py
+        self.record_dir = None          # None: no recording
+        self.record_chunk_rows = 10000  # Rows per chunk written to disk
+        self.record_path = None         # Recording of the latest run
+
+        # Replay of a recording instead of an acquisition, see replay.py.
+        # config(), acquire(), save() and exit() are not called then
+        self.replay_path = None         # None: acquire from the instruments
+        self.replay_speed = 1.0         # None: the whole recording at once
+        self.replay_time_column = None  # None: times the chunks were written
+
+        # Per-stage timings, see diagnostics(). Disabled: no overhead
+        self.instrumentation = False
+        self.diagnostics_panel = False  # True: show them next to the status bar
+
+        # Broadcast of the data patches to many viewers, see broadcast.py.
+        # Each patch is encoded once; viewers that are behind get a snapshot
+        self.broadcast_port = None      # None: no broadcast
+        self.broadcast_backlog = 64     # Patches kept for viewers behind
+        self.broadcast_host = '127.0.0.1'   # No authentication: widen it on
+                                            # trusted networks only
+        self.broadcast_origins = None   # None: the Flask app on localhost
+
+        # Distributed acquisition, see distributed.py. Workers run config(),
+        # acquire() and exit() and send their rows to the aggregator, which
+        # owns the outputs, the plots and the persistence
+        self.aggregator_address = None  # e.g., ('0.0.0.0', 5008). None: no
+                                        # workers
+        self.worker_count = 1           # Workers a run waits for
+        self.worker_index = None        # Set on the workers, see run_worker()
+        self.worker_column = None       # e.g., 'Station'
+        self.worker_authkey = None      # Required beyond localhost
+
+        # Compiled and evaluated pythonic strings, see parse()
+        self.__parse_cache__ = ParseCache(globals())
+
+        # Controls, see controls.py. Edits of the control panel update the
+        # schema; a run only reads the snapshot taken when it starts
+        self.__controls__ = None
+        self.run_snapshot = None
+
         # State control and status bar related variables
+        self.message_log_size = 100     # Number of messages kept
+        self.__messages__ = None        # Created on first use, see __message__
         self.__state_name__ = None
-        self.__message__ = ""
 
         # UI events related variables
+        self.__requests__ = Requests(['run', 'pause', 'stop', 'exit'])
         self.__run_request__ = False
         self.__just_started__ = False
         self.__pause_request__ = False
@@ -125,8 +375,27 @@ class AcquisitionAPP(object):
         self.__exit_request__ = False
 
         # Bokeh server related variables
+        self.headless = False           # True: no UI, see run_headless()
         self.__doc__ = None
         self.__session__ = None
+        self.__store__ = None           # Data of the outputs, see to_df()
+        self.__stream_buffer__ = None
+        self.__spill__ = None
+        self.__spill_dir_created__ = False  # spill_dir made by prepare()
+        self.__recorder__ = None
+        self.__pipeline__ = None
+        self.__block_checked__ = False
+        self.__views__ = []             # Decimated views of the outputs
+        self.__async_driver__ = None    # Runs coroutine acquire() methods
+        self.__sweep_runner__ = None    # Runs acquire_point() in 'sweep' mode
+        self.__adaptive_sweep__ = None  # Plans the points in 'adaptive' mode
+        self.__result_cache__ = None    # Results of acquire_point(), if enabled
+        self.__replayer__ = None        # Reads the recording being replayed
+        self.__scheduler__ = None       # Deadlines of a fixed sample period
+        self.__metrics__ = None         # Instrumentation, if enabled
+        self.__broadcaster__ = None     # Broadcast of the patches, if enabled
+        self.__aggregator__ = None      # Accepts the workers, if enabled
+        self.__worker_link__ = None     # Connection to the aggregator, if any
 
     def config(self):
         """
@@ -139,7 +408,8 @@ class AcquisitionAPP(object):
         Data acquisition during the Run state.
 
         Note: at the very beginning (self.__just_started__ == True), one may
-        need to initialize the inputs.
+        need to initialize the inputs. Their values, parsed when Run was
+        pressed, are returned by self.value('input_str').
 
         Note: set "self.__stop_request__ = True" at the end of the acquisition.
         This tells the state machine to jump out of the Run state.
@@ -151,7 +421,16 @@ class AcquisitionAPP(object):
         In order to be successfully appended to the outputs (which is in the
         form of ColumnDataSource, the return value must be a dictionary.
 
+        In block mode (self.acquisition_mode = 'block'), return many samples
+        at once as a dictionary of equal-length 1-D NumPy arrays or as a
+        structured array, e.g., {'x1': x1_block, 'y1': np.sin(x1_block)}.
+
         Need to return None in case of errors.
+
+        acquire() may also be a coroutine ('async def acquire(self)'). It is
+        then run on an asyncio loop, so the reads of several instruments can
+        be overlapped with asyncio.gather(). Wrap blocking calls with
+        'await self.run_blocking(func, *args)' to overlap them too.
         """
 
         # The following code is good for single-step acquisition
@@ -199,6 +478,23 @@ class AcquisitionAPP(object):
         data = {'x1': x1_single, 'x2': x2_single, 'y1': y1_single, 'y2': y2_single}
         return data
 
+    @staticmethod
+    def acquire_point(point, parameters):
+        """
+        Compute one point of a parallel sweep ('sweep' acquisition mode) and
+        return its outputs as a dictionary of single values.
+
+        point is a dictionary of the values of the swept inputs, parameters
+        the dictionary of the pythonic strings of self.parameters. This runs
+        in a worker process: it has no access to the application, and its
+        arguments and result must be picklable. See sweep.py.
+
+        In 'adaptive' acquisition mode, it is called in the application's
+        process instead, and may be defined as a regular method using the
+        instruments. See adaptive.py.
+        """
+        assert False, "AcquisitionAPP.acquire_point() not implemented!"
+
     def save(self):
         """
         Things to do when the Stop state has been reached.
@@ -239,20 +535,140 @@ class AcquisitionAPP(object):
         tabs = Tabs(tabs=[tab1, tab2])
         return tabs
 
+    def async_driver(self):
+        """
+        Return the asyncio driver running coroutine acquire() methods,
+        creating it on first use.
+        """
+        if self.__async_driver__ is None:
+            from async_driver import AsyncDriver
+            self.__async_driver__ = AsyncDriver(self.async_workers)
+        return self.__async_driver__
+
+    def run_blocking(self, func, *args, **kwargs):
+        """
+        Return an awaitable running the blocking call func(*args, **kwargs)
+        in a thread pool. Use it in a coroutine acquire() to overlap blocking
+        instrument reads with asyncio.gather().
+        """
+        return self.async_driver().run_blocking(func, *args, **kwargs)
+
+    def sweep_runner(self):
+        """
+        Return the process pool running the points of a sweep, creating it on
+        first use.
+        """
+        if self.__sweep_runner__ is None:
+            from sweep import SweepRunner
+            self.__sweep_runner__ = SweepRunner(self, self.sweep_workers)
+        return self.__sweep_runner__
+
+    def adaptive_sweep(self):
+        """
+        Return the planner of the points of an adaptive sweep, creating it on
+        first use.
+        """
+        if self.__adaptive_sweep__ is None:
+            from adaptive import AdaptiveSweep
+            self.__adaptive_sweep__ = AdaptiveSweep(self)
+        return self.__adaptive_sweep__
+
+    def result_cache(self):
+        """
+        Return the cache of the results of acquire_point(), creating it on
+        first use, or None if cache_results is not set.
+        """
+        if not self.cache_results:
+            return
+        if self.__result_cache__ is None:
+            from result_cache import ResultCache
+            self.__result_cache__ = ResultCache(self.cache_memory_size,
+                                                self.cache_dir,
+                                                self.cache_disk_size)
+        return self.__result_cache__
+
+    def cache_key(self, point, parameters):
+        """
+        Return the key of the result of acquire_point(point, parameters) in
+        the result cache. The parameters are parsed, so equal values written
+        differently share their results.
+        """
+        from result_cache import ResultCache
+        snapshot = self.run_snapshot
+        parsed = {}
+        for key, string in parameters.items():
+            try:
+                if snapshot is not None and \
+                        snapshot.parameters.get(key) == string:
+                    parsed[key] = snapshot.value(key)   # Once per run
+                else:
+                    parsed[key] = self.__parse_cache__.evaluate(
+                                    string, {'self': self})
+            except:
+                parsed[key] = string    # acquire_point() reports the error
+        return ResultCache.key(type(self).__name__, self.app_name,
+                               self.cache_version, point, parsed)
+
+    def replayer(self):
+        """
+        Return the reader of the recording in replay_path, opening it on first
+        use. Raise ValueError if it is not a recording.
+        """
+        if self.__replayer__ is None:
+            from replay import Replayer
+            self.__replayer__ = Replayer(self.replay_path,
+                                speed=self.replay_speed,
+                                time_column=self.replay_time_column,
+                                max_rows=self.max_live_rows or
+                                         self.output_capacity)
+        return self.__replayer__
+
+    def seek(self, t):
+        """
+        Replay the recording from t seconds after its first row: the rows
+        before are shown at once, then the replay goes on at replay_speed.
+        A replay going on is restarted.
+        """
+        self.replayer().seek(t)
+        if self.__state_name__ in ("Run", "Pause"):
+            self.__pause_request__ = False
+            self.__stop_request__ = True
+        self.__run_request__ = True
+
+    def decimated_source(self, fig, x, y, columns=()):
+        """
+        Return a ColumnDataSource holding a decimated version of columns x and
+        y of the outputs, to be plotted in fig instead of self.outputs, e.g.,
+
+            fig.circle(x='x1', y='y1', source=self.decimated_source(fig, 'x1',
+                                                                    'y1'))
+
+        For each pixel column of fig, only the points with the smallest and
+        largest y are kept, so large runs stay fast to plot. The full data
+        remain in self.outputs, on the server only. The source is updated as
+        new rows arrive and when the x-range of fig changes on zoom or pan.
+        columns are the other columns the glyph needs, e.g., ['color'].
+        """
+        from decimation import DecimatedView
+        view = DecimatedView(self, x, y, width=fig.plot_width,
+                             columns=columns)
+        view.attach(fig.x_range)
+        self.__views__.append(view)
+        return view.source
+
     def parse(self, string):
         """
         Try to execute the pythonic string command and produce a message in
         case of errors.
 
+        The string is compiled only once. Side-effect-free strings, e.g.,
+        'np.linspace(0, 1, 100)', are also evaluated only once; the arrays,
+        lists, sets and dictionaries returned for them are copies.
+
         Return None if an error is detected.
         """
-        rlt = None
         try:
-            # exec is more versatile than eval. It accepts multi-line pythonic
-            # strings but has no return
-            ldict = locals()
-            exec("rlt = " + string, globals(), ldict)
-            rlt = ldict['rlt']
+            rlt = self.__parse_cache__.evaluate(string, {'self': self})
         except:
             error_message = "Pythonic string '{}' cannot be executed.".format(
                             string)
@@ -263,19 +679,257 @@ class AcquisitionAPP(object):
         else:
             return rlt
 
+    def update_control(self, name, string):
+        """
+        Change the pythonic string of input or parameter name, e.g., when its
+        text box is edited. It takes effect at the next Run.
+        """
+        old = self.__controls__.update(name, string)
+        if old != string:
+            # Drop the cached old string and check the new one right away
+            self.__parse_cache__.invalidate(old)
+            self.validate(string)
+
+    def snapshot_controls(self):
+        """
+        Freeze the controls for the run starting, see controls.py, and make
+        self.inputs and self.parameters copies of the strings of the
+        snapshot. Called when Run is pressed. Nothing is parsed here.
+        """
+        self.run_snapshot = self.__controls__.snapshot(
+            lambda string: self.__parse_cache__.evaluate(string,
+                                                         {'self': self}))
+        self.inputs = self.run_snapshot.inputs.copy()
+        self.parameters = self.run_snapshot.parameters.copy()
+
+    def value(self, name):
+        """
+        Return the value of input or parameter name frozen for the current
+        run, parsed the first time it is asked, and produce a message in
+        case of errors.
+
+        Return None if an error is detected.
+        """
+        try:
+            return self.run_snapshot.value(name)
+        except:
+            error_message = "Pythonic string '{}' cannot be executed.".format(
+                            self.inputs.get(name, self.parameters.get(name)))
+            # Append message
+            self.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                            error_message)
+            return
+
+    def validate(self, string):
+        """
+        Check a pythonic string when its control is edited, so errors show up
+        before the Run button is pressed. Side-effect-free strings are
+        evaluated (and cached), other strings are only compiled.
+
+        Return False and produce a message if the string is not valid.
+        """
+        try:
+            if is_pure(string):
+                self.__parse_cache__.evaluate(string)
+            else:
+                self.__parse_cache__.compile(string)
+        except:
+            error_message = "Pythonic string '{}' is not valid.".format(string)
+            # Append message
+            self.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                            error_message)
+            return False
+        return True
+
+    def diagnostics(self):
+        """
+        Return the figures of the instrumentation as a dictionary, or None if
+        it is disabled: per-stage timing summaries (s), time spent in each
+        state (s), rows acquired and streamed per second, the state of the
+        stream buffer and of the pipeline queues, the counters of the
+        fixed-rate scheduler and of the result cache, and the numbers of
+        viewers of the broadcast and of workers.
+        """
+        if self.__metrics__ is None:
+            return
+        snapshot = self.__metrics__.snapshot()
+        snapshot['stream buffer'] = self.__stream_buffer__.stats()
+        snapshot['queue depths'] = {'processing': len(self.__pipeline__.raw),
+                                    'plotting': len(self.__pipeline__.plot)}
+        snapshot['dropped'] = self.__pipeline__.n_dropped()
+        if self.__scheduler__ is not None:
+            snapshot['schedule'] = self.__scheduler__.stats()
+        if self.__result_cache__ is not None:
+            snapshot['cache'] = self.__result_cache__.stats()
+        if self.__broadcaster__ is not None:
+            snapshot['viewers'] = self.__broadcaster__.n_viewers
+        if self.__aggregator__ is not None:
+            snapshot['workers'] = self.__aggregator__.stats()
+        return snapshot
+
+    def to_df(self):
+        """
+        Return the complete data of the current run as a pandas DataFrame,
+        i.e., the rows spilled to disk followed by the rows in the outputs.
+
+        Use it in save() instead of self.outputs.to_df(): the rows are read
+        from the server-side store of the outputs without copying them into
+        lists first. If the run was recorded, the data are read back from the
+        recording.
+        """
+        import pandas as pd
+        if self.__recorder__ is not None:
+            return self.__recorder__.store.to_df()
+        live = self.__store__.to_df()
+        if self.__spill__ is None or len(self.__spill__) == 0:
+            return live
+        spilled = pd.DataFrame(self.__spill__.read(),
+                               columns=self.__spill__.columns)
+        return pd.concat([spilled, live[spilled.columns]], ignore_index=True)
+
+    def new_record_path(self):
+        """
+        Return a new directory under record_dir for the recording of a run.
+        """
+        now = time.time()
+        self.record_path = os.path.join(self.record_dir,
+                            "{}_{}_{:03d}".format(self.app_name,
+                                time.strftime("%Y%m%d_%H%M%S",
+                                              time.localtime(now)),
+                                int(now * 1000) % 1000))
+        return self.record_path
+
+    def prepare(self):
+        """
+        Create the outputs and the helpers handling the acquired data. Called
+        by run() before the UI and the state machine are started.
+        """
+        self.__controls__ = ControlSchema(self.inputs, self.parameters)
+        if self.instrumentation or self.diagnostics_panel:
+            self.__metrics__ = Instrumentation()
+        if self.replay_path is not None:
+            self.replayer()     # Fail now if it is not a recording
+        elif self.acquisition_mode in ('sweep', 'adaptive') and \
+                type(self).acquire_point is AcquisitionAPP.acquire_point:
+            # Fail now rather than in the worker processes of the sweep
+            raise ValueError("The '{}' acquisition mode needs acquire_point() "
+                             "to be defined".format(self.acquisition_mode))
+        if self.aggregator_address is not None:
+            if self.replay_path is not None:
+                raise ValueError("An aggregator cannot replay a recording")
+            from distributed import Aggregator
+            self.__aggregator__ = Aggregator(self, self.aggregator_address,
+                                             authkey=self.worker_authkey)
+        if self.sample_period is not None:
+            self.__scheduler__ = FixedRateScheduler(self.sample_period,
+                                                    requests=self.__requests__)
+        self.__store__ = OutputStore(self.empty_data,
+                                     capacity=self.output_capacity,
+                                     rollover=self.max_live_rows)
+        if self.headless:
+            self.outputs = None     # Nothing is plotted: Bokeh is not loaded
+        else:
+            from bokeh.models import ColumnDataSource
+            # List columns: Bokeh appends each patch to NumPy columns by
+            # copying them whole, but extends lists in place
+            self.outputs = ColumnDataSource({key: [] for key in
+                                             self.__store__.columns})
+        self.__spill_dir_created__ = self.spill_dir is None
+        if self.__spill_dir_created__:
+            self.spill_dir = tempfile.mkdtemp(prefix=self.app_name + '_spill_')
+        self.__spill__ = ChunkStore(self.spill_dir)
+        self.__spill__.clear()
+        if self.broadcast_port is not None:
+            self.__broadcaster__ = Broadcaster(self.__store__.views,
+                                               backlog=self.broadcast_backlog,
+                                               rollover=self.max_live_rows)
+        if self.__worker_link__ is None:
+            self.__stream_buffer__ = StreamBuffer(self,
+                            sink=partial(AcquisitionAPPStateMachine.__update__,
+                                         self),
+                            interval=self.stream_interval,
+                            max_rows=self.stream_max_rows)
+        else:
+            # The rows go to the aggregator, which batches them by itself
+            self.__stream_buffer__ = StreamBuffer(self,
+                                                  sink=self.__worker_link__.send,
+                                                  max_rows=1)
+        self.__pipeline__ = Pipeline(self, AcquisitionAPPStateMachine.__normalize__,
+                                     size=self.pipeline_size,
+                                     policies=self.backpressure)
+
+    def run_headless(self, inputs=None, parameters=None):
+        """
+        Run one acquisition without UI, Bokeh session or server, e.g., for
+        unattended batch sweeps, and return its data as a pandas DataFrame.
+        See headless.py for the command line.
+
+        The state machine calls config(), acquire(), save() and exit() as
+        usual, in the calling thread. inputs and parameters are dictionaries
+        of pythonic strings overriding those of the application.
+
+        Bokeh is not loaded and self.outputs is None: use self.to_df() in
+        save(). If record_dir is set, the rows only go to the recording.
+        """
+        for controls, overrides in [(self.inputs, inputs),
+                                    (self.parameters, parameters)]:
+            for key, value in (overrides or {}).items():
+                if key not in controls:
+                    raise ValueError("Unknown input or parameter '{}'".format(
+                                     key))
+                controls[key] = value
+        self.headless = True
+        self.prepare()
+        inst_acq_app_SM = AcquisitionAPPStateMachine(self)
+        self.__run_request__ = True
+        # Initialization, Idle, Run, Stop, then Idle blocks
+        inst_acq_app_SM.run_until_blocked()
+        data = self.to_df()
+        self.__exit_request__ = True
+        inst_acq_app_SM.run_until_blocked()
+        return data
+
+    def run_worker(self, address, timeout=30):
+        """
+        Run as a worker of the aggregator listening at address (host, port),
+        waiting up to timeout seconds for it, until the aggregator exits. See
+        distributed.py and the --worker option of headless.py.
+
+        config(), acquire() and exit() are called as usual, without UI; the
+        Run, Pause, Stop and Exit requests come from the aggregator, and the
+        rows are sent to it. save() is called on the aggregator only.
+        """
+        from distributed import WorkerLink
+        self.headless = True
+        self.__worker_link__ = WorkerLink(self, address,
+                                          authkey=self.worker_authkey,
+                                          timeout=timeout)
+        self.prepare()
+        self.__worker_link__.start()
+        AcquisitionAPPStateMachine(self).runAll()
+        self.__worker_link__.close()
+
     def run(self, app_name="acquisition_app"):
         """
         Run the application.
 
         Two threads will be created: one for UI and the other for state machine.
         """
-        self.outputs = ColumnDataSource(copy.deepcopy(self.empty_data))
+        # Bokeh widgets and client sessions are only loaded by the UI
+        from acquisition_app_UI import AcquisitionAPPUI
+        self.prepare()
         inst_acq_app_UI = AcquisitionAPPUI(self)
         inst_acq_app_SM = AcquisitionAPPStateMachine(self)
         thread_UI = Thread(target=inst_acq_app_UI.create_UI)
         thread_UI.start()
         thread_SM = Thread(target=inst_acq_app_SM.runAll)
         thread_SM.start()
+        if self.__broadcaster__ is not None:
+            BroadcastServer({self.app_name: self.__broadcaster__},
+                            port=self.broadcast_port,
+                            host=self.broadcast_host,
+                            origins=self.broadcast_origins or
+                            DEFAULT_ORIGINS).start()
 
 
 if __name__ == '__main__':
@@ -8,7 +8,7 @@ This module creates the application UI.
 
 from functools import partial
 from bokeh.layouts import column, row, widgetbox, layout
-from bokeh.models.widgets import Button, TextInput, Toggle, Div
+from bokeh.models.widgets import Button, TextInput, Toggle, Div, Slider
 from bokeh.client import push_session, pull_session, session
 from bokeh.document import Document
 from tornado import gen
@@ -17,11 +17,25 @@ from tornado import gen
 class AcquisitionAPPUI(object):
     """AcquisitionAPP UI"""
 
-    def __init__(self, inst_app):
+    def __init__(self, inst_app, connect=True, doc=None):
         """
         Set up the connection with the Bokeh server.
+
+        If doc is given, the UI is built in this document, which is served by
+        a Bokeh server running in the same process (see app_host.py), and no
+        client session is opened.
+
+        With connect=False, no document or session is created. Only the event
+        handlers can be used then, e.g., to drive the application from a
+        script or a benchmark.
         """
         self.inst_app = inst_app    # A reference to application class instance
+        if doc is not None:
+            self.inst_app.__doc__ = doc
+            self.inst_app.__doc__.title = self.inst_app.app_name
+            return
+        if not connect:
+            return
         self.inst_app.__doc__ = Document()
         self.inst_app.__doc__.title = self.inst_app.app_name
         self.inst_app.__session__ = push_session(self.inst_app.__doc__,
@@ -38,14 +52,13 @@ class AcquisitionAPPUI(object):
         Create text box inputs for receiving pythonic strings.
         """
         self.controls = {}  # A dictionary of TextInput instances
-        for key, value in self.inst_app.inputs.items():
-            self.controls[key] = TextInput(value=value, title=key, width=width,
-                                                        height=height)
-            self.controls[key].on_change('value', self.__update_inputs__)
-        for key, value in self.inst_app.parameters.items():
-            self.controls[key] = TextInput(value=value, title=key, width=width,
-                                                        height=height)
-            self.controls[key].on_change('value', self.__update_parameters__)
+        schema = self.inst_app.__controls__
+        for key in schema.names():
+            self.controls[key] = TextInput(value=schema[key].string, title=key,
+                                           width=width, height=height)
+            # Each text box only updates its own control
+            self.controls[key].on_change('value',
+                                         partial(self.__update_control__, key))
 
         # For better viewing experience, divide to ncols columns
         tmp = list(self.controls.values())
@@ -60,13 +73,8 @@ class AcquisitionAPPUI(object):
 
         self.ctrl_panel = row(tmp_panel_list)
 
-    def __update_inputs__(self, attrname, old, new):
-        for key, value in self.controls.items():
-            self.inst_app.inputs[key] = value.value
-
-    def __update_parameters__(self, attrname, old, new):
-        for key, value in self.controls.items():
-            self.inst_app.parameters[key] = value.value
+    def __update_control__(self, key, attrname, old, new):
+        self.inst_app.update_control(key, new)
 
     def create_state_ctrls(self, btn_width=70, btn_container_width=90,
                             layout='row'):
@@ -90,6 +98,17 @@ class AcquisitionAPPUI(object):
         else:
             self.state_ctrls = column(tmp)
 
+    def create_replay_ctrls(self, width=400):
+        """
+        Create a slider choosing the point in time a replay starts from. The
+        replay restarts from there whenever the slider moves.
+        """
+        duration = max(self.inst_app.replayer().duration, 1e-3)
+        self.replay_slider = Slider(start=0, end=duration, value=0,
+                                    step=duration / 1000, width=width,
+                                    title="Replay from (s)")
+        self.replay_slider.on_change('value', lambda attr, old, new:
+                                     self.inst_app.seek(new))
 
     def create_status_bar(self, status_bar_width=600):
         """
@@ -97,16 +116,76 @@ class AcquisitionAPPUI(object):
         callback is added to keep its value updated
         """
         self.status_bar = Div(text="", width = status_bar_width)
+        self.__status_key__ = None  # What the status bar text was made of
         self.inst_app.__doc__.add_periodic_callback(
                                     self.__update_status_bar__, 150)
 
     @gen.coroutine
     def __update_status_bar__(self):
-        """Update the status bar"""
-        tmp = "<p><i>State: {}</i><p><p>{}<p>".format(
-                    self.inst_app.__state_name__, self.inst_app.__message__)
+        """
+        Update the status bar. The text is only rebuilt, and sent to the
+        browser, when the state, the messages, the drop counts, the missed
+        deadlines, the result cache statistics or the workers changed.
+        """
+        dropped = ()
+        if self.inst_app.__pipeline__ is not None:
+            dropped = tuple(sorted(
+                        self.inst_app.__pipeline__.n_dropped().items()))
+        missed = 0
+        if self.inst_app.__scheduler__ is not None:
+            missed = self.inst_app.__scheduler__.n_missed
+        cache = ()
+        if self.inst_app.__result_cache__ is not None:
+            cache = tuple(sorted(
+                        self.inst_app.__result_cache__.stats().items()))
+        workers = None
+        if self.inst_app.__aggregator__ is not None:
+            workers = self.inst_app.__aggregator__.stats()
+        key = (self.inst_app.__state_name__,
+               self.inst_app.__message__.version, dropped, missed, cache,
+               None if workers is None else tuple(sorted(workers.items())))
+        if key == self.__status_key__:
+            return
+        self.__status_key__ = key
+        tmp = "<p><i>State: {}</i><p>{}".format(
+                    self.inst_app.__state_name__,
+                    self.inst_app.__message__.to_html())
+        # Make rows dropped by the pipeline visible
+        dropped = ["{}: {}".format(stage, n) for stage, n in dropped if n]
+        if dropped:
+            tmp += "<p><font color='orange'>Dropped: {}</font><p>".format(
+                    ", ".join(dropped))
+        if missed:
+            tmp += "<p><font color='orange'>Missed deadlines: {}</font>" \
+                   "<p>".format(missed)
+        if cache:
+            stats = dict(cache)
+            tmp += "<p>Cache: {} hits ({} in memory, {} on disk), {} " \
+                   "misses<p>".format(
+                    stats['hits (memory)'] + stats['hits (disk)'],
+                    stats['hits (memory)'], stats['hits (disk)'],
+                    stats['misses'])
+        if workers is not None:
+            tmp += "<p>Workers: {} connected, {} running<p>".format(
+                    workers['connected'], workers['running'])
         self.status_bar.text = tmp
 
+    def create_diagnostics_panel(self, width=400):
+        """
+        Add a text field displaying the figures of the instrumentation, see
+        instrumentation.py. It is updated every second.
+        """
+        self.diagnostics_bar = Div(text="", width=width)
+        self.inst_app.__doc__.add_periodic_callback(
+                                    self.__update_diagnostics_panel__, 1000)
+
+    @gen.coroutine
+    def __update_diagnostics_panel__(self):
+        """Update the diagnostics panel, only sending changed text"""
+        tmp = self.inst_app.__metrics__.to_html()
+        if tmp != self.diagnostics_bar.text:
+            self.diagnostics_bar.text = tmp
+
     def create_UI(self):
         """
         Create the UI.
@@ -117,13 +196,22 @@ class AcquisitionAPPUI(object):
         Structure:
         ---intro_text_bar---
         ctrl_panel   figs
-        state_ctrls
-        status_bar
+        state_ctrls  replay_slider (when replaying)
+        status_bar   diagnostics_bar (optional)
         """
         self.create_intro_text_bar(text=self.inst_app.intro_text)
         self.create_ctrl_panel(ncols=self.inst_app.ctrl_panel_ncols)
         self.create_state_ctrls()
+        state_row = [self.state_ctrls]
+        if self.inst_app.replay_path is not None:
+            self.create_replay_ctrls()
+            state_row.append(widgetbox(self.replay_slider))
         self.create_status_bar()
+        status_row = [self.status_bar]
+        if self.inst_app.diagnostics_panel and \
+                self.inst_app.__metrics__ is not None:
+            self.create_diagnostics_panel()
+            status_row.append(self.diagnostics_bar)
 
         # Create figs using application class function
         figs = self.inst_app.create_figs()
@@ -131,11 +219,13 @@ class AcquisitionAPPUI(object):
         UI = layout([
                         [self.intro_text_bar],
                         [self.ctrl_panel, figs],
-                        [self.state_ctrls],
-                        [self.status_bar]
+                        state_row,
+                        status_row
                     ])
 
         self.inst_app.__doc__.add_root(UI)
+        if self.inst_app.__session__ is None:
+            return      # The document is served in-process
         # Open the document in a browser
         # self.inst_app.__session__.show(browser=self.inst_app.browser)
         self.inst_app.__session__.loop_until_closed() # run forever
@@ -7,7 +7,8 @@ This module defines the application state machine.
 Five states have been defined:
 Initialization:     Good for configuring instrument. It runs only once at the
                     very beginning
-Idle:               Waiting for inputs
+Idle:               Waiting for inputs. The state machine blocks on the
+                    application's request flags until Run or Exit is requested
 Run:                Take measurement. This state runs indefinitely until a
                     __stop_request__ is issued
 Stop:               The target state after a __stop_request__ is issued. Good
@@ -19,13 +20,11 @@ Exit:               Reset the instrument, close any open sessions, and exit the
 
 from __future__ import print_function
 from statemachine import State, StateMachine
-from random import random
-from tornado import gen
-from bokeh.models import ColumnDataSource
-from functools import partial
-from threading import Lock
+from recorder import Recorder
+import inspect
+import numpy as np
+import shutil
 import time
-import copy
 
 
 class Initialization(State):
@@ -39,7 +38,10 @@ class Initialization(State):
     def run(self):
         self.inst_app.__state_name__ = self.__state_name__
         ### Things to do during Initialization state, e.g., instrument configuration ###
-        self.inst_app.config()
+        if self.inst_app.replay_path is None and \
+                self.inst_app.__aggregator__ is None:
+            # A replay or an aggregator does not use the instruments
+            self.inst_app.config()
         ################################################################################
     def next(self):
         return self.inst_sm.idle
@@ -52,9 +54,17 @@ class Idle(State):
         self.inst_sm = inst_sm
         self.inst_app = inst_sm.inst_app    # A reference to application class instance
 
+    def ready(self):
+        if self.inst_app.__run_request__ or self.inst_app.__exit_request__:
+            return True
+        self.inst_app.__state_name__ = self.__state_name__
+        return False
+
     def run(self):
         self.inst_app.__state_name__ = self.__state_name__
-        time.sleep(0.2)
+        # Block until there is something to do
+        self.inst_app.__requests__.wait(lambda flags: flags['run'] or
+                                                      flags['exit'])
     def next(self):
         if self.inst_app.__exit_request__ == True:
             self.inst_app.__exit_request__ = False
@@ -63,8 +73,40 @@ class Idle(State):
             self.inst_app.__run_request__ = False
             self.inst_app.__just_started__ = True
             # Reset data
-            self.inst_app.outputs.data = copy.deepcopy(self.inst_app.empty_data)
-            self.inst_app.__message__ = ""
+            self.inst_app.__stream_buffer__.clear()
+            self.inst_app.__spill__.clear()
+            self.inst_app.__pipeline__.reset_counters()
+            self.inst_app.__recorder__ = None
+            if self.inst_app.__scheduler__ is not None:
+                self.inst_app.__scheduler__.start()
+            if self.inst_app.__result_cache__ is not None:
+                self.inst_app.__result_cache__.reset_stats()
+            if self.inst_app.replay_path is not None:
+                self.inst_app.replayer().start()
+            elif self.inst_app.record_dir is not None:
+                self.inst_app.__recorder__ = Recorder(
+                                self.inst_app.new_record_path(),
+                                chunk_rows=self.inst_app.record_chunk_rows,
+                                queue_size=self.inst_app.pipeline_size,
+                                policy=self.inst_app.backpressure.get(
+                                                'persistence', 'block'))
+            self.inst_app.__block_checked__ = False
+            broadcaster = self.inst_app.__broadcaster__
+            if broadcaster is None:
+                self.inst_app.__store__.reset()
+            else:
+                # Viewers read snapshots of the store with the lock held
+                with broadcaster.lock:
+                    self.inst_app.__store__.reset()
+                    broadcaster.reset()
+            if self.inst_app.outputs is not None:
+                self.inst_app.outputs.data = {key: [] for key in
+                                              self.inst_app.__store__.columns}
+            for view in self.inst_app.__views__:
+                view.reset()
+            self.inst_app.__message__.clear()
+            # Edits of the controls during the run apply to the next one
+            self.inst_app.snapshot_controls()
             return self.inst_sm.run
         else:
             return self.inst_sm.idle
@@ -77,12 +119,20 @@ class Run(State):
         self.inst_sm = inst_sm
         self.inst_app = inst_sm.inst_app    # A reference to application class instance
 
+    def ready(self):
+        if not self.inst_app.__pause_request__:
+            return True
+        self.inst_app.__state_name__ = "Pause"
+        return False
+
     def run(self):
         # Pause request
         if self.inst_app.__pause_request__:
             self.inst_app.__state_name__ = "Pause"
-        while self.inst_app.__pause_request__:
-            time.sleep(0.2)
+            self.inst_app.__requests__.wait(lambda flags: not flags['pause'])
+            if self.inst_app.__scheduler__ is not None:
+                # The deadlines passed during the pause were not missed
+                self.inst_app.__scheduler__.rebase()
         self.inst_app.__state_name__ = self.__state_name__
         ### Things to do during the Run state, e.g., computation, measurement, etc. ###
         AcquisitionAPPStateMachine.__acquire__(self.inst_app)
@@ -105,11 +155,35 @@ class Stop(State):
     def run(self):
         self.inst_app.__state_name__ = self.__state_name__
         ### Things to do during the Stop state, e.g., stopping equipment, saving data ###
-        if not self.inst_app.__just_started__:
-            # Don't save if the program just started
+        if self.inst_app.__aggregator__ is not None:
+            # Collect the last rows of the workers
+            self.inst_app.__aggregator__.stop()
+        # Wait for the pipeline to process what has been acquired
+        self.inst_app.__pipeline__.drain()
+        recorder = self.inst_app.__recorder__
+        if recorder is not None:
+            # Only the last partial chunk is left to be written
+            recorder.finalize()
+            if recorder.error is not None:
+                self.inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                            "Recording failed: {}".format(recorder.error))
+        if self.inst_app.replay_path is not None or \
+                self.inst_app.__worker_link__ is not None:
+            # Nothing new to save in a replay. The rows of a worker are saved
+            # by the aggregator
+            self.inst_app.__stream_buffer__.drain()
+        elif not self.inst_app.__just_started__:
+            # Don't save if the program just started. Make sure the buffered
+            # rows have reached the outputs first
+            if not self.inst_app.__stream_buffer__.drain():
+                self.inst_app.__message__ += "<p><font color='orange'>Warning: {}</font><p>".format(
+                            "The last rows did not reach the outputs in time "
+                            "and may be missing from the saved data")
             self.inst_app.save()
         else:
             self.inst_app.__just_started__ = not self.inst_app.__just_started__
+        if self.inst_app.__worker_link__ is not None:
+            self.inst_app.__worker_link__.stopped()
         #################################################################################
     def next(self):
         return self.inst_sm.idle
@@ -126,9 +200,27 @@ class Exit(State):
     def run(self):
         self.inst_app.__state_name__ = self.__state_name__
         ### Things to do during the Exit state, e.g., equipment reset ###
-        time.sleep(1)
-        self.inst_app.__session__.close()   # Close Bokeh session
-        self.inst_app.exit()
+        if self.inst_app.__doc__ is not None:
+            time.sleep(1)   # Let the status bar show the Exit state
+        if self.inst_app.__session__ is not None:
+            self.inst_app.__session__.close()   # Close Bokeh session
+        if self.inst_app.replay_path is None and \
+                self.inst_app.__aggregator__ is None:
+            self.inst_app.exit()
+        if self.inst_app.__aggregator__ is not None:
+            self.inst_app.__aggregator__.close()    # The workers exit too
+        self.inst_app.__pipeline__.close()
+        if self.inst_app.__async_driver__ is not None:
+            self.inst_app.__async_driver__.close()
+            self.inst_app.__async_driver__ = None
+        if self.inst_app.__sweep_runner__ is not None:
+            self.inst_app.__sweep_runner__.close()
+            self.inst_app.__sweep_runner__ = None
+        if self.inst_app.__spill_dir_created__:
+            # The temporary spill directory made by prepare()
+            shutil.rmtree(self.inst_app.spill_dir, ignore_errors=True)
+            self.inst_app.spill_dir = None
+            self.inst_app.__spill_dir_created__ = False
         #################################################################
     def next(self):
         return None
@@ -146,37 +238,190 @@ class AcquisitionAPPStateMachine(StateMachine):
         self.stop = Stop(self)
         self.exit = Exit(self)
         super(AcquisitionAPPStateMachine, self).__init__(self.initialization)
+        if inst_app.__metrics__ is not None:
+            self.observer = inst_app.__metrics__.record_state
 
     @staticmethod
-    @gen.coroutine
     def __update__(inst_app, new_data):
-        """Append new data to the outputs"""
-        inst_app.outputs.stream(new_data)
+        """
+        Append new data to the outputs. Called by the stream buffer with the
+        rows of many acquisition cycles merged into one patch.
+
+        The rows are written to the preallocated store of the outputs (see
+        output_store.py), which the server reads them back from, and streamed
+        to the browser.
+
+        If the application sets max_live_rows, only that many rows are kept
+        in the outputs. The rows falling out of the window are spilled to the
+        on-disk store, unless the run is being recorded.
+
+        If broadcast_port is set, the patch is also encoded once for all the
+        viewers of the broadcast (see broadcast.py).
+
+        Finally, the decimated views of the outputs are updated.
+        """
+        metrics = inst_app.__metrics__
+        if metrics is not None:
+            t_start = time.perf_counter()
+        broadcaster = inst_app.__broadcaster__
+        if broadcaster is None:
+            evicted = inst_app.__store__.append(new_data)
+        else:
+            # Viewers read snapshots of the store with the lock held
+            with broadcaster.lock:
+                evicted = inst_app.__store__.append(new_data)
+                broadcaster.publish(new_data)
+        if evicted is not None and inst_app.__recorder__ is None and \
+                inst_app.replay_path is None:
+            # A recording already holds every row
+            inst_app.__spill__.append(evicted)
+        if not inst_app.headless:
+            inst_app.outputs.stream(new_data, rollover=inst_app.max_live_rows)
+        for view in inst_app.__views__:
+            view.update(new_data, evicted)
+        if metrics is not None:
+            metrics.record('update', time.perf_counter() - t_start)
+            metrics.count('streamed', len(next(iter(new_data.values()))))
+
+    @staticmethod
+    def __check_block__(inst_app, new_data):
+        """
+        Turn the result of acquire() in block mode into a dictionary of
+        equal-length 1-D NumPy arrays without copying them.
+
+        The column names, types and shapes are validated on the first block
+        of a run only; later blocks are only checked for equal lengths.
+
+        Return None and produce a message if the block is not valid.
+        """
+        if isinstance(new_data, np.ndarray) and new_data.dtype.names:
+            # Structured array: one view per field
+            new_data = {name: new_data[name] for name in new_data.dtype.names}
+        if type(new_data) is not dict:
+            error_message = ("acquire() needs to return a dictionary of arrays "
+                             "or a structured array in block mode")
+        elif not inst_app.__block_checked__:
+            error_message = None
+            for key, value in new_data.items():
+                if type(key) is not str:
+                    error_message = "Column name {!r} is not a string".format(
+                                    key)
+                elif not isinstance(value, np.ndarray) or value.ndim != 1:
+                    error_message = "Column '{}' is not a 1-D array".format(key)
+                if error_message is not None:
+                    break
+            inst_app.__block_checked__ = error_message is None
+        else:
+            error_message = None
+        if error_message is None and new_data:
+            lengths = set(len(value) for value in new_data.values())
+            if len(lengths) != 1:
+                error_message = "Columns have different lengths"
+        if error_message is not None:
+            inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                            error_message)
+            return
+        return new_data
 
     @staticmethod
     def __acquire__(inst_app):
-        new_data = inst_app.acquire()
+        """
+        Acquisition stage: call acquire() and hand the raw result over to the
+        pipeline, which normalizes, records and plots it in other threads.
+
+        If sample_period is set, acquire() is called at the next deadline of
+        the scheduler, and timestamp_column receives the time of the call.
+
+        An aggregator takes the rows sent by its workers instead, see
+        distributed.py.
+        """
+        metrics = inst_app.__metrics__
+        scheduler = inst_app.__scheduler__
+        aggregator = inst_app.__aggregator__
+        if scheduler is not None and inst_app.replay_path is None and \
+                aggregator is None and inst_app.acquisition_mode != 'sweep':
+            sample = scheduler.wait()
+            if sample is None:
+                # A request came before the deadline. Exit ends the run first
+                if inst_app.__exit_request__:
+                    inst_app.__stop_request__ = True
+                return
+            t_sample, lateness = sample
+            if metrics is not None:
+                metrics.record('lateness', lateness)
+        else:
+            t_sample = None
+        if metrics is not None:
+            t_start = time.perf_counter()
+        if aggregator is not None:
+            # The rows the workers acquired, see distributed.py
+            new_data = aggregator.acquire()
+            if new_data is not None and not new_data:
+                return      # No row has arrived yet
+        elif inst_app.replay_path is not None:
+            # The rows of a recording, see replay.py
+            new_data = inst_app.replayer().acquire()
+            if new_data is not None and not new_data:
+                return      # No row is due yet
+        elif inst_app.acquisition_mode == 'sweep':
+            # The points are computed by acquire_point() in worker processes
+            new_data = inst_app.sweep_runner().acquire()
+        elif inst_app.acquisition_mode == 'adaptive':
+            # acquire_point() at the point the planner proposes
+            new_data = inst_app.adaptive_sweep().acquire()
+        elif inspect.iscoroutinefunction(inst_app.acquire):
+            # async def acquire(): run it on the application's asyncio loop
+            new_data = inst_app.async_driver().run(inst_app.acquire())
+        else:
+            new_data = inst_app.acquire()
         if new_data is None:
             inst_app.__stop_request__ = True    # Escape Run state
             return
-        if type(new_data) is not dict:
+        if t_sample is not None and inst_app.timestamp_column is not None and \
+                type(new_data) is dict:
+            if inst_app.acquisition_mode == 'block' and new_data:
+                # The samples of a block share the time of the call
+                t_sample = np.full(len(next(iter(new_data.values()))),
+                                   t_sample)
+            new_data[inst_app.timestamp_column] = t_sample
+        if metrics is None:
+            inst_app.__pipeline__.put(new_data)
+            return
+        t_acquired = time.perf_counter()
+        metrics.record('acquire', t_acquired - t_start)
+        inst_app.__pipeline__.put(new_data)
+        metrics.record('handover', time.perf_counter() - t_acquired)
+
+    @staticmethod
+    def __normalize__(inst_app, new_data):
+        """
+        Processing stage: turn a raw acquire() result into a dictionary of
+        columns. Return None, and stop the run, if the result is not valid.
+        """
+        if inst_app.acquisition_mode == 'block':
+            # Arrays are passed through without per-element conversion
+            new_data = AcquisitionAPPStateMachine.__check_block__(inst_app,
+                                                                  new_data)
+            if new_data is None:
+                inst_app.__stop_request__ = True    # Escape Run state
+                return
+        elif type(new_data) is not dict:
             # Append message variable from the application instance
             inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
                             "acquire() needs to return a dictionary ")
             inst_app.__stop_request__ = True    # Escpate Run state
             return
-        for key, value in new_data.items():
-            # Make sure key is str and value is iterable
-            if type(key) is not str:
-                new_key = str(key)
-                new_data[new_key] = new_data[key]
-                del new_data[key]
-            # Put value in a list if it's a single number or string
-            if not hasattr(value, '__iter__') or type(value) is str:
-                new_data[key] = [value]
-        inst_app.__doc__.add_next_tick_callback(partial(
-                                    AcquisitionAPPStateMachine.__update__,
-                                    inst_app=inst_app, new_data=new_data))
+        else:
+            for key, value in list(new_data.items()):
+                # Make sure key is str and value is iterable
+                if type(key) is not str:
+                    del new_data[key]
+                    key = str(key)
+                    new_data[key] = value
+                # Put value in a list if it's a single number or string
+                if not hasattr(value, '__iter__') or type(value) is str:
+                    new_data[key] = [value]
+        return new_data
 
 
 if __name__ == '__main__':
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the adaptive sweep mode of AcquisitionAPP.
+
+A fixed grid such as np.linspace(-1, 1, 100) spends most of its points where
+the response is flat, and must be fine everywhere to resolve one narrow
+feature. In adaptive mode (self.acquisition_mode = 'adaptive'), the grid of
+the last swept input only sets the range and the finest resolution: the
+framework measures a few points spread over the grid, then keeps measuring
+the grid point in the middle of the interval where the response changes the
+most, until every interval changes less than self.adaptive_tolerance or
+self.adaptive_max_points points are measured:
+
+    self.acquisition_mode = 'adaptive'
+    self.sweep_inputs = ['Pulse width (ns)', 'Volt (V)']   # Volt is refined
+
+    def acquire_point(self, point, parameters):
+        # point: {'Pulse width (ns)': 10, 'Volt (V)': -0.5}
+        return {'Error rate': self.instrument.read()}
+
+The change of an interval is its length in the plot of the output against
+the input, both scaled to the range of the values: flat regions are
+covered coarsely, steep regions down to the grid spacing. The refined
+output is self.adaptive_output, by default the first one returned by
+acquire_point(). The outer swept inputs are stepped through in order, with
+one adaptive curve each.
+
+With self.cache_results set, the points found in the result cache (see
+result_cache.py) are not measured again.
+
+acquire_point() runs in the application's process, one point at a time, so
+it may be a regular method using the instruments. The rows reach the
+outputs as they are measured, not sorted along the input: plot them with
+markers rather than lines.
+"""
+
+
+from __future__ import print_function, division
+from collections import deque
+import itertools
+from sweep import sweep_axes
+import numpy as np
+
+
+class AdaptivePlanner(object):
+    """Chooses the next point of a 1-D grid where the response changes most"""
+
+    def __init__(self, grid, tolerance=0.05, max_points=None, n_initial=9):
+        """
+        grid holds the values of the input that may be measured. Refining
+        stops once no interval changes more than tolerance (the plot being
+        1 x 1), or after max_points points (default: the size of the grid).
+        The first n_initial points are spread evenly over the grid.
+        """
+        self.grid = np.unique(np.asarray(grid, dtype=float))
+        n = len(self.grid)
+        self.tolerance = tolerance
+        self.max_points = n if max_points is None else min(max_points, n)
+        self.outputs = {}       # Grid index: measured output
+        self.__initial__ = deque(np.unique(np.linspace(0, n - 1,
+                                min(n_initial, n)).round().astype(int)))
+
+    def losses(self):
+        """
+        Return the measured grid indices, sorted, and the change of each
+        interval between them. Intervals that cannot be split are 0.
+        """
+        indices = np.array(sorted(self.outputs))
+        x = self.grid[indices]
+        y = np.array([self.outputs[i] for i in indices], dtype=float)
+        finite = np.isfinite(y)
+        x_scale = max(self.grid[-1] - self.grid[0], 1e-300)
+        y_scale = np.ptp(y[finite]) if finite.any() else 0.0
+        dx = np.diff(x) / x_scale
+        dy = np.diff(np.where(finite, y, 0.0))
+        dy = np.abs(dy / y_scale) if y_scale > 0 else np.zeros_like(dx)
+        # An interval next to an invalid output is only refined along x
+        dy[~(finite[1:] & finite[:-1])] = 0.0
+        loss = np.hypot(dx, dy)
+        loss[np.diff(indices) < 2] = 0.0
+        return indices, loss
+
+    def ask(self):
+        """Return the grid index to measure next, or None when done"""
+        while self.__initial__:
+            index = int(self.__initial__.popleft())
+            if index not in self.outputs:
+                return index
+        if len(self.outputs) >= self.max_points or len(self.outputs) < 2:
+            return
+        indices, loss = self.losses()
+        worst = int(np.argmax(loss))
+        if loss[worst] <= self.tolerance:
+            return
+        return int((indices[worst] + indices[worst + 1]) // 2)
+
+    def tell(self, index, output):
+        """Record the output measured at grid index"""
+        self.outputs[index] = output
+
+
+class AdaptiveSweep(object):
+    """Runs one adaptive curve per point of the outer swept inputs"""
+
+    def __init__(self, inst_app):
+        self.inst_app = inst_app    # A reference to application class instance
+        self.__outer__ = iter(())
+        self.__point__ = None       # Values of the outer inputs
+        self.planner = None
+        self.n_points = 0
+
+    def start(self):
+        """Forget the previous sweep and return False if the grid is invalid"""
+        axes = sweep_axes(self.inst_app)
+        if axes is None:
+            return False
+        names, values = axes
+        self.name = names[-1]
+        self.grid = values[-1]
+        self.__outer__ = (dict(zip(names[:-1], point))
+                          for point in itertools.product(*values[:-1]))
+        if self.inst_app.worker_index is not None:
+            # A worker of a distributed sweep runs its share of the curves
+            self.__outer__ = itertools.islice(self.__outer__,
+                                              self.inst_app.worker_index, None,
+                                              self.inst_app.worker_count)
+        self.planner = None
+        self.n_points = 0
+        return True
+
+    def __next_curve__(self):
+        """Start the curve of the next outer point. Return False at the end."""
+        self.__point__ = next(self.__outer__, None)
+        if self.__point__ is None:
+            return False
+        self.planner = AdaptivePlanner(self.grid,
+                                       self.inst_app.adaptive_tolerance,
+                                       self.inst_app.adaptive_max_points)
+        return True
+
+    def acquire(self):
+        """
+        Acquisition cycle of the adaptive mode: measure the next point. Return
+        its row as a dictionary of lists, or None on errors.
+        """
+        inst_app = self.inst_app
+        if inst_app.__just_started__:
+            if not self.start():
+                return
+            inst_app.__just_started__ = False
+        index = None if self.planner is None else self.planner.ask()
+        while index is None:
+            if not self.__next_curve__():
+                inst_app.__stop_request__ = True    # Done with the sweep
+                return {}
+            index = self.planner.ask()
+
+        point = dict(self.__point__)
+        point[self.name] = self.planner.grid[index]
+        parameters = dict(inst_app.parameters)
+        cache = inst_app.result_cache()
+        if cache is not None:
+            key = inst_app.cache_key(point, parameters)
+            result = cache.get(key)
+        if cache is None or result is None:
+            try:
+                result = inst_app.acquire_point(point, parameters)
+            except Exception as e:
+                inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                                "Point {} failed: {!r}".format(point, e))
+                return
+            if cache is not None and type(result) is dict:
+                cache.put(key, result)
+        output = inst_app.adaptive_output
+        if output is None and type(result) is dict:
+            output = next((key for key in result if key not in point), None)
+        if type(result) is not dict or output not in result:
+            inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                            "acquire_point() needs to return a dictionary "
+                            "holding the output '{}'".format(output))
+            return
+        self.planner.tell(index, result[output])
+        self.n_points += 1
+        row = dict(point)
+        row.update(result)
+        return {key: [value] for key, value in row.items()}
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines an in-process host serving many applications from one
+Bokeh server.
+
+AcquisitionAPP.run() opens one client session to an external 'bokeh serve'
+and starts two threads per application. The host instead runs the Bokeh
+server in its own process: all applications share one IO loop, and their
+state machines share a bounded pool of worker threads. A state machine only
+holds a worker while it has something to do; an idle or paused application
+holds none, and is scheduled again when one of its request flags changes.
+
+The documents are served on the root URL of the server, one session per
+application, with the application name as session id. The Flask app
+(flask_app.py) therefore works unchanged, without 'bokeh serve':
+
+    host = AppHost([RvsH('R_vs_H'), ErrRatevsVolt('ErrRate_vs_Volt')])
+    host.start()
+"""
+
+
+from __future__ import print_function
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from acquisition_app_UI import AcquisitionAPPUI
+from acquisition_app_statemachine import AcquisitionAPPStateMachine
+from broadcast import BroadcastServer, DEFAULT_ORIGINS
+from bokeh.application import Application
+from bokeh.application.handlers import FunctionHandler
+from bokeh.models.widgets import Div
+from bokeh.server.server import Server
+
+
+class AppHost(object):
+    """Serve many AcquisitionAPP instances from one in-process Bokeh server"""
+
+    def __init__(self, apps, port=5006, max_workers=4, time_slice=0.05,
+                 allow_websocket_origin=('localhost:5000', 'localhost:5006')):
+        """
+        apps is a list of AcquisitionAPP instances. max_workers is the number
+        of threads shared by their state machines. A running state machine
+        gives its worker back every time_slice seconds, so more applications
+        than workers can run at the same time.
+        """
+        self.apps = {}
+        for inst_app in apps:
+            if inst_app.app_name in self.apps:
+                raise ValueError("Duplicate application name '{}'".format(
+                                 inst_app.app_name))
+            self.apps[inst_app.app_name] = inst_app
+        self.port = port
+        self.time_slice = time_slice
+        self.allow_websocket_origin = list(allow_websocket_origin)
+        self.__pool__ = ThreadPoolExecutor(max_workers=max_workers)
+        self.__lock__ = Lock()
+        self.__machines__ = {}      # app_name: state machine
+        self.__scheduled__ = set()  # Names of the apps queued in the pool
+        self.server = None
+        self.broadcast_servers = []
+
+    def start(self, callback=None):
+        """
+        Start the state machines and the Bokeh server, then run the IO loop
+        forever. callback, if given, is called once the server listens.
+        """
+        for inst_app in self.apps.values():
+            inst_app.prepare()
+            self.__machines__[inst_app.app_name] = \
+                                    AcquisitionAPPStateMachine(inst_app)
+            inst_app.__requests__.add_listener(
+                        lambda app_name=inst_app.app_name:
+                        self.__schedule__(app_name))
+            self.__schedule__(inst_app.app_name)
+
+        # One broadcast server per address, shared by the applications
+        # using it
+        broadcasters = {}
+        origins = {}
+        for inst_app in self.apps.values():
+            if inst_app.__broadcaster__ is not None:
+                address = (inst_app.broadcast_host, inst_app.broadcast_port)
+                broadcasters.setdefault(address, {})[
+                                inst_app.app_name] = inst_app.__broadcaster__
+                origins.setdefault(address, set()).update(
+                                inst_app.broadcast_origins or DEFAULT_ORIGINS)
+        for (host, port), apps in broadcasters.items():
+            broadcast_server = BroadcastServer(apps, port=port, host=host,
+                                               origins=origins[(host, port)])
+            broadcast_server.start()
+            self.broadcast_servers.append(broadcast_server)
+
+        handler = FunctionHandler(self.__modify_doc__)
+        self.server = Server({'/': Application(handler)}, port=self.port,
+                        allow_websocket_origin=self.allow_websocket_origin,
+                        # Keep the sessions as long as the host runs, like
+                        # the client sessions of AcquisitionAPP.run() do
+                        unused_session_lifetime_milliseconds=2**31 - 1)
+        self.server.start()
+        if callback is not None:
+            self.server.io_loop.add_callback(callback)
+        self.server.io_loop.start()
+
+    def stop(self):
+        """Stop the IO loop, the broadcast servers and the worker pool"""
+        if self.server is not None:
+            self.server.io_loop.stop()
+        for broadcast_server in self.broadcast_servers:
+            broadcast_server.stop()
+        self.__pool__.shutdown(wait=False)
+
+    def __modify_doc__(self, doc):
+        """Build the UI of the application named after the session id"""
+        app_name = doc.session_context.id
+        inst_app = self.apps.get(app_name)
+        if inst_app is None:
+            doc.add_root(Div(text="No application named '{}'".format(
+                                  app_name)))
+            return
+        AcquisitionAPPUI(inst_app, doc=doc).create_UI()
+
+    def __schedule__(self, app_name):
+        """Queue the state machine of app_name unless it is queued already"""
+        with self.__lock__:
+            if app_name in self.__scheduled__ or \
+                    app_name not in self.__machines__:
+                return
+            self.__scheduled__.add(app_name)
+        self.__pool__.submit(self.__step__, app_name)
+
+    def __step__(self, app_name):
+        """Run a state machine in a worker until it blocks or its slice ends"""
+        inst_SM = self.__machines__[app_name]
+        try:
+            alive = inst_SM.run_until_blocked(self.time_slice)
+        except Exception as e:
+            # Like an unhandled exception in the thread of runAll(), this
+            # terminates the state machine
+            inst_SM.inst_app.__message__ += \
+                "<p><font color='red'>Error: {}</font><p>".format(e)
+            alive = False
+        with self.__lock__:
+            self.__scheduled__.discard(app_name)
+            if not alive:
+                del self.__machines__[app_name]
+                return
+        # A request may have arrived while the slice ended: check again
+        if inst_SM.curr_state.ready():
+            self.__schedule__(app_name)
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the driver running coroutine acquire() methods.
+
+An application may define acquire() as 'async def'. The state machine then
+runs it to completion on a private asyncio loop, so one acquisition cycle can
+overlap the reads of many instruments with asyncio.gather(). Blocking driver
+calls (e.g., PyVISA reads) are moved to a thread pool with run_blocking(), so
+they can be overlapped as well:
+
+    async def acquire(self):
+        v1, v2 = await asyncio.gather(self.run_blocking(self.dmm1.read),
+                                      self.run_blocking(self.dmm2.read))
+        return {'V1': v1, 'V2': v2}
+"""
+
+
+from __future__ import print_function
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+
+
+class AsyncDriver(object):
+    """Private asyncio loop and thread pool of an application"""
+
+    def __init__(self, max_workers=None):
+        """
+        max_workers is the number of threads available to run_blocking(),
+        i.e., the number of blocking calls that can overlap.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def run(self, coro):
+        """Run coroutine coro to completion and return its result"""
+        return self.loop.run_until_complete(coro)
+
+    def run_blocking(self, func, *args, **kwargs):
+        """
+        Return an awaitable running func(*args, **kwargs) in the thread pool.
+        Must be called from a coroutine running on the loop.
+        """
+        return self.loop.run_in_executor(self.executor,
+                                         partial(func, *args, **kwargs))
+
+    def close(self):
+        """Close the loop and the thread pool"""
+        self.executor.shutdown(wait=False)
+        self.loop.close()
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Benchmark of the adaptive sweep mode.
+
+A simulated instrument answers every point after a latency with the error
+rate of the ErrRatevsVolt example, whose switching around 0 V is a few
+hundredths of a volt wide. For grids of np.linspace(-1, 1, n) points, the
+benchmark runs the sweep headlessly twice:
+
+grid:       every point of the grid, in order ('point' acquisition mode)
+adaptive:   the points chosen by the planner ('adaptive' mode), see
+            adaptive.py
+
+It reports the number of points measured, the acquisition time, and the
+largest error of the curve interpolated from the measured points against
+the response on the grid, i.e., at the resolution of the grid.
+
+Usage:
+    python benchmarks/bench_adaptive.py [latency]
+"""
+
+
+from __future__ import print_function, division
+import sys
+import time
+import common
+from acquisition_app import AcquisitionAPP
+import numpy as np
+
+
+def error_rate(voltage):
+    """Response of the ErrRatevsVolt example"""
+    return np.where(voltage < 0, (np.tanh(20 * voltage + 0.5) + 1) / 2,
+                    (np.tanh(0.5 - 20 * voltage) + 1) / 2)
+
+
+class SweepApp(AcquisitionAPP):
+    """Application measuring error_rate() over a grid of voltages"""
+    def __init__(self, app_name, mode, n_points, latency):
+        super(SweepApp, self).__init__(app_name)
+        self.acquisition_mode = mode
+        self.latency = latency
+        self.inputs = {'Volt (V)': 'np.linspace(-1, 1, {})'.format(n_points)}
+        self.parameters = {}
+        self.empty_data = {'Volt (V)': [], 'Error rate': []}
+
+    def config(self):
+        pass
+
+    def acquire_point(self, point, parameters):
+        time.sleep(self.latency)        # Fake acquisition wait time
+        return {'Error rate': float(error_rate(point['Volt (V)']))}
+
+    def acquire(self):
+        if self.__just_started__:
+            self.voltage = self.parse(self.inputs['Volt (V)'])
+            self.idx = 0
+            self.__just_started__ = False
+        point = {'Volt (V)': self.voltage[self.idx]}
+        data = dict(point, **self.acquire_point(point, self.parameters))
+        self.idx += 1
+        if self.idx == len(self.voltage):
+            self.__stop_request__ = True
+        return data
+
+    def save(self):
+        pass
+
+    def exit(self):
+        pass
+
+
+def run_once(mode, n_points, latency):
+    inst_app = SweepApp("adaptive_benchmark", mode, n_points, latency)
+    t_start = time.perf_counter()
+    data = inst_app.run_headless().sort_values('Volt (V)')
+    elapsed = time.perf_counter() - t_start
+    grid = np.linspace(-1, 1, n_points)
+    interpolated = np.interp(grid, data['Volt (V)'], data['Error rate'])
+    return len(data), elapsed, np.abs(interpolated - error_rate(grid)).max()
+
+
+def main(latency=5e-3):
+    print("Acquisition latency {:g} s per point".format(latency))
+    print("{:>8}{:>10}{:>10}{:>10}{:>12}{:>10}".format("Grid", "Mode",
+          "points", "time (s)", "max error", "speedup"))
+    for n_points in [100, 1000, 5000]:
+        t_grid = None
+        for mode in ['point', 'adaptive']:
+            n, elapsed, error = run_once(mode, n_points, latency)
+            t_grid = t_grid or elapsed
+            print("{:>8}{:>10}{:>10}{:>10.2f}{:>12.4f}{:>10.1f}".format(
+                  n_points, 'grid' if mode == 'point' else mode, n, elapsed,
+                  error, t_grid / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Benchmark of coroutine acquire() methods reading many instruments.
+
+Each acquisition cycle reads N simulated instruments with a fixed latency,
+either one after the other from a plain acquire(), concurrently from an
+'async def acquire()' with asyncio.gather(), or concurrently through the
+thread-pool shim (run_blocking) around the blocking reads. The wall time per
+cycle is reported: N x latency for sequential reads, about 1 x latency for
+overlapped reads.
+
+Usage:
+    python benchmarks/bench_async_acquire.py [latency_ms] [n_cycles]
+"""
+
+
+from __future__ import print_function, division
+import sys
+from common import TrackedApp, wait_for_state, start, stop
+from simulated_instruments import SimulatedInstrument
+import asyncio
+
+
+class MultiInstrumentApp(TrackedApp):
+    """Application reading n_instruments instruments per cycle"""
+    def __init__(self, app_name, n_instruments, latency, n_cycles):
+        super(MultiInstrumentApp, self).__init__(app_name)
+        self.instruments = [SimulatedInstrument("inst{}".format(i), latency)
+                            for i in range(n_instruments)]
+        self.n_cycles = n_cycles
+        self.empty_data = {inst.name: [] for inst in self.instruments}
+
+    def next_cycle(self):
+        if self.__just_started__:
+            self.cycle = 0
+            self.__just_started__ = False
+        self.cycle += 1
+        if self.cycle >= self.n_cycles:
+            self.__stop_request__ = True
+
+    def to_data(self, values):
+        return {inst.name: value
+                for inst, value in zip(self.instruments, values)}
+
+
+class SequentialApp(MultiInstrumentApp):
+    def acquire(self):
+        self.next_cycle()
+        return self.to_data([inst.read() for inst in self.instruments])
+
+
+class GatherApp(MultiInstrumentApp):
+    async def acquire(self):
+        self.next_cycle()
+        values = await asyncio.gather(*[inst.read_async()
+                                        for inst in self.instruments])
+        return self.to_data(values)
+
+
+class ShimApp(MultiInstrumentApp):
+    def __init__(self, *args):
+        super(ShimApp, self).__init__(*args)
+        self.async_workers = len(self.instruments)
+
+    async def acquire(self):
+        self.next_cycle()
+        values = await asyncio.gather(*[self.run_blocking(inst.read)
+                                        for inst in self.instruments])
+        return self.to_data(values)
+
+
+def run_once(app_class, n_instruments, latency, n_cycles):
+    """Return the wall time (s) per acquisition cycle"""
+    inst_app = app_class("async_benchmark", n_instruments, latency, n_cycles)
+    inst_UI, thread_SM = start(inst_app)
+    since = inst_app.mark()
+    inst_UI.on_run_handler()
+    t_run = wait_for_state(inst_app, "Run", since)
+    t_stop = wait_for_state(inst_app, "Stop", since)
+    stop(inst_app, inst_UI, thread_SM)
+    return (t_stop - t_run) / n_cycles
+
+
+def main(latency_ms=10, n_cycles=20):
+    latency = latency_ms / 1e3
+    cases = [("sequential", SequentialApp), ("async gather", GatherApp),
+             ("run_blocking", ShimApp)]
+    print("Wall time per cycle (ms), instrument latency {} ms".format(
+          latency_ms))
+    print("{:>6}".format("N") + "".join("{:>16}".format(name)
+                                        for name, app_class in cases))
+    results = {}
+    for n_instruments in [1, 2, 4, 8, 16]:
+        results[n_instruments] = {name: run_once(app_class, n_instruments,
+                                                 latency, n_cycles)
+                                  for name, app_class in cases}
+        print("{:>6}".format(n_instruments) + "".join(
+              "{:>16.1f}".format(results[n_instruments][name] * 1e3)
+              for name, app_class in cases))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Throughput benchmark of the per-point and block acquisition modes.
+
+For sample rates from 1e3 to 1e6 samples per second, an application whose
+acquire() returns pre-generated data immediately is run through the state
+machine (without a Bokeh server). In point mode acquire() returns one sample
+per call; in block mode it returns 10 ms worth of samples per call. The
+benchmark reports the time the framework needs to handle one second of data:
+above 1000 ms the mode cannot keep up with the rate.
+
+Usage:
+    python benchmarks/bench_block_throughput.py [max_samples]
+"""
+
+
+from __future__ import print_function, division
+import sys
+from common import TrackedApp, wait_for_state, start, stop
+import numpy as np
+import time
+
+
+class ThroughputApp(TrackedApp):
+    """Application returning n_samples pre-generated samples"""
+    def __init__(self, app_name, mode, n_samples, block_size):
+        super(ThroughputApp, self).__init__(app_name)
+        self.acquisition_mode = mode
+        self.n_samples = n_samples
+        self.block_size = block_size
+        self.empty_data = {'x': [], 'y': []}
+        self.x = np.arange(n_samples, dtype=float)
+        self.y = np.sin(self.x)
+
+    def acquire(self):
+        if self.__just_started__:
+            self.idx = 0
+            self.__just_started__ = False
+        if self.acquisition_mode == 'block':
+            stop = min(self.idx + self.block_size, self.n_samples)
+            data = {'x': self.x[self.idx:stop], 'y': self.y[self.idx:stop]}
+        else:
+            stop = self.idx + 1
+            data = {'x': self.x[self.idx], 'y': self.y[self.idx]}
+        self.idx = stop
+        if self.idx >= self.n_samples:
+            self.__stop_request__ = True
+        return data
+
+
+def run_once(mode, rate, max_samples):
+    """
+    Return the time (s) the framework needs to handle one second of data at
+    rate samples per second.
+    """
+    n_samples = int(min(rate, max_samples))
+    block_size = max(int(rate * 0.01), 1)
+    inst_app = ThroughputApp("throughput_benchmark", mode, n_samples,
+                             block_size)
+    inst_UI, thread_SM = start(inst_app)
+    since = inst_app.mark()
+    t_start = time.perf_counter()
+    inst_UI.on_run_handler()
+    elapsed = wait_for_state(inst_app, "Idle", since) - t_start
+    n_rows = len(inst_app.outputs.data['x'])
+    stop(inst_app, inst_UI, thread_SM)
+    assert n_rows == n_samples, "{} rows streamed instead of {}".format(
+                                n_rows, n_samples)
+    return elapsed * rate / n_samples
+
+
+def main(max_samples=200000):
+    print("Time to handle 1 s of data (ms); >1000 ms cannot keep up")
+    print("{:>12}{:>14}{:>14}".format("rate (S/s)", "point", "block"))
+    results = {}
+    for rate in [1e3, 1e4, 1e5, 1e6]:
+        results[rate] = {mode: run_once(mode, rate, max_samples)
+                         for mode in ['point', 'block']}
+        print("{:>12.0e}{:>14.2f}{:>14.2f}".format(rate,
+                results[rate]['point'] * 1e3, results[rate]['block'] * 1e3))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
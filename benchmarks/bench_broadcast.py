@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Benchmark of the broadcast of the outputs to many viewers.
+
+A publisher thread, standing for the IO loop of an application, appends
+100-row patches to an output store and publishes them to a BroadcastServer
+at a fixed rate. N viewers follow the server-sent events over HTTP; one of
+them reads very slowly. For each number of viewers, the time spent
+publishing a patch and the rows received by the fast and slow viewers are
+reported, once the fast viewers caught up with the last patch (they all run
+in this process, so with many of them, reading the events takes a while).
+The publish time should not grow with the number of viewers, and the slow
+viewer should only fall behind itself.
+
+Usage:
+    python benchmarks/bench_broadcast.py [n_patches]
+"""
+
+
+from __future__ import print_function, division
+import json
+import sys
+import time
+import urllib.request
+from threading import Thread
+import common
+from broadcast import Broadcaster, BroadcastServer
+from output_store import OutputStore
+import numpy as np
+
+
+PORT = 5017
+
+
+def follow(url, result, delay, deadlines, kind, last):
+    """
+    Count the rows a viewer ends up with, sleeping delay s per message, until
+    it got the patch last['seq'] or deadlines[kind] is passed
+    """
+    stream = urllib.request.urlopen(url, timeout=5)
+    try:
+        for line in stream:
+            if time.perf_counter() > deadlines[kind] or \
+                    result['seq'] >= last.get('seq', float('inf')):
+                break
+            if not line.startswith(b"data: "):
+                continue
+            message = json.loads(line[6:].decode('utf-8'))
+            result['seq'] = message['seq']
+            n_rows = len(message['data']['x'])
+            if message['type'] == 'snapshot':
+                result['rows'] = n_rows
+                result['snapshots'] += 1
+            else:
+                result['rows'] += n_rows
+                result['patches'] += 1
+            time.sleep(delay)
+    finally:
+        stream.close()
+
+
+def run(n_viewers, n_patches, patch_rows=100, rate=200.0):
+    store = OutputStore({'x': [], 'y': []})
+    broadcaster = Broadcaster(store.views, backlog=16)
+    server = BroadcastServer({'bench': broadcaster}, port=PORT, keepalive=1)
+    server.start()
+    url = "http://localhost:{}/bench".format(PORT)
+    deadlines = {'slow': float('inf'), 'fast': float('inf')}
+    last = {}
+    results = [{'rows': 0, 'snapshots': 0, 'patches': 0, 'seq': 0}
+               for i in range(n_viewers)]
+    viewers = [Thread(target=follow, args=(url, result,
+                      0.05 if i == 0 else 0.0, deadlines,
+                      'slow' if i == 0 else 'fast', last))
+               for i, result in enumerate(results)]
+    for viewer in viewers:
+        viewer.daemon = True
+        viewer.start()
+    while broadcaster.n_viewers < n_viewers:
+        time.sleep(0.01)
+
+    publish_times = []
+    for i in range(n_patches):
+        x = np.arange(i * patch_rows, (i + 1) * patch_rows, dtype=float)
+        new_data = {'x': x, 'y': np.sin(x)}
+        t_start = time.perf_counter()
+        with broadcaster.lock:
+            store.append(new_data)
+            broadcaster.publish(new_data)
+        publish_times.append(time.perf_counter() - t_start)
+        time.sleep(1 / rate)
+    last['seq'] = broadcaster.seq
+    total_rows = len(store)
+    # Let the fast viewers catch up; the slow one stops after 1 s
+    deadlines['slow'] = time.perf_counter() + 1.0
+    deadlines['fast'] = time.perf_counter() + 30.0
+    for viewer in viewers:
+        viewer.join(31)
+    server.stop()
+    fast = [result['rows'] for result in results[1:]]
+    return (np.median(publish_times) * 1e3,
+            np.percentile(publish_times, 99) * 1e3,
+            min(fast) if fast else total_rows, results[0], total_rows)
+
+
+def main(n_patches=400):
+    print("{} patches of 100 rows, one slow viewer".format(n_patches))
+    print("{:>8}{:>16}{:>16}{:>18}{:>24}".format("Viewers", "publish p50 ms",
+          "publish p99 ms", "fast viewer rows", "slow viewer rows (snap)"))
+    for n_viewers in [1, 4, 16, 64]:
+        p50, p99, fast_rows, slow, total_rows = run(n_viewers, n_patches)
+        print("{:>8}{:>16.3f}{:>16.3f}{:>18}{:>24}".format(n_viewers, p50,
+              p99, "{}/{}".format(fast_rows, total_rows),
+              "{} ({})".format(slow['rows'], slow['snapshots'])))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
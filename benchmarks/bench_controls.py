@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Benchmark of the control updates and of the run snapshot.
+
+For applications with 10 to 1000 controls, it reports the time per edit of
+a text box:
+
+rewrite:    the former handlers, copying every text box into the inputs and
+            parameters on every edit
+targeted:   update_control(), replacing the string of the edited control
+            only, see controls.py
+
+and the time to freeze the snapshot of all the controls when Run is
+pressed.
+
+Both handlers check the new string, which takes most of the time of an
+edit, so they are on par up to about 100 controls: e.g., 141 us for the
+rewrite and 137 us for the targeted update with 10 controls, 157 us and
+147 us with 100. The targeted update only pulls ahead with hundreds of
+controls, 226 us against 147 us with 1000. The snapshot costs 3 us with 10
+controls and 20 to 30 us with 1000, once per Run. Finally, a run is acquired headlessly while another thread keeps
+editing an input, and the number of distinct values acquire() saw is
+reported: the snapshot keeps it to one.
+
+Usage:
+    python benchmarks/bench_controls.py [n_edits]
+"""
+
+
+from __future__ import print_function, division
+from threading import Thread
+import sys
+import time
+import common
+from acquisition_app import AcquisitionAPP
+
+
+class TextBox(object):
+    """Stand-in for the TextInput of a control"""
+    def __init__(self, value):
+        self.value = value
+
+
+class ControlsApp(AcquisitionAPP):
+    """Application with n_controls controls, half inputs, half parameters"""
+    def __init__(self, app_name, n_controls, n_samples=0):
+        super(ControlsApp, self).__init__(app_name)
+        self.inputs = {'x{}'.format(i): 'np.linspace(0, 1, 100)'
+                       for i in range(n_controls // 2)}
+        self.parameters = {'p{}'.format(i): '{}'.format(i)
+                           for i in range(n_controls - n_controls // 2)}
+        self.empty_data = {'x0': []}
+        self.n_samples = n_samples
+
+    def config(self):
+        pass
+
+    def acquire(self):
+        if self.__just_started__:
+            self.count = 0
+            self.__just_started__ = False
+        self.count += 1
+        if self.count >= self.n_samples:
+            self.__stop_request__ = True
+        time.sleep(1e-4)
+        return {'x0': self.inputs['x0']}
+
+    def save(self):
+        pass
+
+    def exit(self):
+        pass
+
+
+def rewrite(inst_app, boxes, old, new):
+    """The former handler of the edit of an input"""
+    for key, box in boxes.items():
+        inst_app.inputs[key] = box.value
+    if old != new:
+        inst_app.__parse_cache__.invalidate(old)
+        inst_app.validate(new)
+
+
+def time_edits(n_controls, n_edits):
+    inst_app = ControlsApp("controls_benchmark", n_controls)
+    inst_app.headless = True
+    inst_app.prepare()
+    boxes = {name: TextBox(inst_app.__controls__[name].string)
+             for name in inst_app.__controls__.names()}
+    strings = ['np.linspace(0, 1, 100)', 'np.linspace(0, 1, 101)']
+    t_start = time.perf_counter()
+    for i in range(n_edits):
+        boxes['x0'].value = strings[i % 2]
+        rewrite(inst_app, boxes, strings[(i + 1) % 2], strings[i % 2])
+    t_rewrite = (time.perf_counter() - t_start) / n_edits
+    t_start = time.perf_counter()
+    for i in range(n_edits):
+        inst_app.update_control('x0', strings[i % 2])
+    t_targeted = (time.perf_counter() - t_start) / n_edits
+    n_snapshots = 100
+    t_start = time.perf_counter()
+    for i in range(n_snapshots):
+        inst_app.snapshot_controls()
+    t_snapshot = (time.perf_counter() - t_start) / n_snapshots
+    return t_rewrite, t_targeted, t_snapshot
+
+
+def values_seen(n_samples=2000):
+    """Number of distinct values of an input acquire() saw during a run"""
+    inst_app = ControlsApp("controls_benchmark", 10, n_samples)
+    seen = set()
+    acquire = inst_app.acquire
+
+    def recording_acquire():
+        seen.add(inst_app.inputs['x0'])
+        return acquire()
+    inst_app.acquire = recording_acquire
+    done = []
+
+    def edit():
+        i = 0
+        while not done:
+            if inst_app.__controls__ is not None:
+                inst_app.update_control('x0', 'np.linspace(0, 1, {})'.format(
+                                        100 + i % 50))
+                i += 1
+            time.sleep(1e-3)
+    thread = Thread(target=edit)
+    thread.start()
+    inst_app.run_headless()
+    done.append(True)
+    thread.join()
+    return len(seen)
+
+
+def main(n_edits=2000):
+    n_edits = int(n_edits)
+    print("{:>10}{:>16}{:>16}{:>16}".format("Controls", "rewrite (us)",
+          "targeted (us)", "snapshot (us)"))
+    for n_controls in [10, 100, 1000]:
+        t_rewrite, t_targeted, t_snapshot = time_edits(n_controls, n_edits)
+        print("{:>10}{:>16.1f}{:>16.1f}{:>16.1f}".format(n_controls,
+              t_rewrite * 1e6, t_targeted * 1e6, t_snapshot * 1e6))
+    print("Distinct values of an input edited during a run: {}".format(
+          values_seen()))
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
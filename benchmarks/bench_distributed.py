@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Scaling benchmark of the distributed acquisition.
+
+A sweep of n points, each taking a fixed instrument latency, is acquired by
+1, 2, 4, ... worker processes on localhost, each taking its share of the
+points (see distributed.py). The aggregator runs headlessly and merges the
+rows of the workers. The acquisition time (from the first to the last row,
+as time stamped by the workers), the rows per second and the speedup over
+one worker are reported; the speedup should grow almost
+linearly with the number of workers, as each worker waits on its own
+instrument. Every row is checked to reach the aggregator exactly once.
+
+Usage:
+    python benchmarks/bench_distributed.py [n_points] [latency_ms]
+"""
+
+
+from __future__ import print_function, division
+from multiprocessing import Process
+import socket
+import sys
+import time
+import common
+from acquisition_app import AcquisitionAPP
+import numpy as np
+
+
+class StationApp(AcquisitionAPP):
+    """Application measuring a response point by point at each station"""
+    def __init__(self, app_name, n_points, latency):
+        super(StationApp, self).__init__(app_name)
+        self.inputs = {'x': 'np.linspace(0, 1, {})'.format(n_points)}
+        self.parameters = {'latency': repr(latency)}
+        self.empty_data = {'x': [], 'y': [], 't': [], 'Station': []}
+        self.worker_column = 'Station'
+
+    def config(self):
+        pass
+
+    def acquire(self):
+        if self.__just_started__:
+            x = self.parse(self.inputs['x'])
+            if x is None:
+                return
+            if self.worker_index is not None:
+                x = x[self.worker_index::self.worker_count]    # Our share
+            self.x = x
+            self.latency = self.parse(self.parameters['latency'])
+            self.idx = 0
+            self.__just_started__ = False
+        if self.idx == len(self.x):
+            self.__stop_request__ = True
+            return {}
+        time.sleep(self.latency)        # Fake instrument wait time
+        x = self.x[self.idx]
+        self.idx += 1
+        return {'x': x, 'y': np.sin(x), 't': time.time()}
+
+    def save(self):
+        pass
+
+    def exit(self):
+        pass
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def run_worker(port, n_points, latency):
+    StationApp("distributed_benchmark", n_points, latency).run_worker(
+                                                    ('localhost', port))
+
+
+def run_once(n_workers, n_points, latency):
+    """Return the acquisition time (s) of a run by n_workers workers"""
+    port = free_port()
+    workers = [Process(target=run_worker, args=(port, n_points, latency))
+               for i in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    inst_app = StationApp("distributed_benchmark", n_points, latency)
+    inst_app.aggregator_address = ('localhost', port)
+    inst_app.worker_count = n_workers
+    data = inst_app.run_headless()
+    for worker in workers:
+        worker.join(10)
+    assert len(data) == n_points and \
+        np.array_equal(np.sort(data['x'].values),
+                       np.linspace(0, 1, n_points)), \
+        "{} rows instead of {}".format(len(data), n_points)
+    assert data['Station'].nunique() == n_workers
+    return data['t'].max() - data['t'].min() + latency
+
+
+def main(n_points=400, latency_ms=10):
+    n_points, latency = int(n_points), latency_ms / 1000
+    print("{} points of {:g} ms".format(n_points, latency_ms))
+    print("{:>8}{:>10}{:>12}{:>10}".format("Workers", "time (s)", "rows/s",
+                                           "speedup"))
+    t_single = None
+    for n_workers in [1, 2, 4, 8]:
+        elapsed = run_once(n_workers, n_points, latency)
+        t_single = t_single or elapsed
+        print("{:>8}{:>10.2f}{:>12.0f}{:>10.1f}".format(n_workers, elapsed,
+              n_points / elapsed, t_single / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Scaling benchmark of the parallel sweep mode.
+
+A grid of independent, CPU-bound points is computed either one point per
+acquisition cycle in the state machine thread (sequential), or by
+acquire_point() in 'sweep' mode with 1, 2, 4, ... worker processes. The wall
+time of the run and the speedup over the sequential run are reported; the
+speedup should grow almost linearly up to the number of CPUs.
+
+Usage:
+    python benchmarks/bench_parallel_sweep.py [n_points] [work_ms]
+"""
+
+
+from __future__ import print_function, division
+import sys
+from common import TrackedApp, wait_for_state, start, stop
+import math
+import os
+import time
+
+
+def compute(x, work):
+    """CPU-bound fake simulation of one point, about work seconds long"""
+    total = 0.0
+    t_end = time.process_time() + work
+    while time.process_time() < t_end:
+        for i in range(1000):
+            total += math.sin(x + i)
+    return total
+
+
+class SequentialApp(TrackedApp):
+    """Application computing one point per acquisition cycle"""
+    def __init__(self, app_name, n_points, work):
+        super(SequentialApp, self).__init__(app_name)
+        self.inputs = {'x': 'np.linspace(0, 1, {})'.format(n_points)}
+        self.parameters = {'work': repr(work)}
+        self.empty_data = {'x': [], 'y': []}
+
+    def acquire(self):
+        if self.__just_started__:
+            self.x = self.parse(self.inputs['x'])
+            self.work = self.parse(self.parameters['work'])
+            self.idx = 0
+            self.__just_started__ = False
+        x = self.x[self.idx]
+        self.idx += 1
+        if self.idx == len(self.x):
+            self.__stop_request__ = True
+        return {'x': x, 'y': compute(x, self.work)}
+
+
+class SweepApp(SequentialApp):
+    """Same points, computed by worker processes"""
+    def __init__(self, app_name, n_points, work, n_workers):
+        super(SweepApp, self).__init__(app_name, n_points, work)
+        self.acquisition_mode = 'sweep'
+        self.sweep_workers = n_workers
+
+    @staticmethod
+    def acquire_point(point, parameters):
+        return {'y': compute(point['x'], float(parameters['work']))}
+
+
+def run_once(inst_app, n_points):
+    """Return the wall time (s) of a run of inst_app"""
+    inst_UI, thread_SM = start(inst_app)
+    since = inst_app.mark()
+    inst_UI.on_run_handler()
+    t_run = wait_for_state(inst_app, "Run", since)
+    t_stop = wait_for_state(inst_app, "Stop", since)
+    wait_for_state(inst_app, "Idle", since)     # The rows reached the outputs
+    n_rows = len(inst_app.to_df())
+    stop(inst_app, inst_UI, thread_SM)
+    assert n_rows == n_points, "{} rows streamed instead of {}".format(
+                               n_rows, n_points)
+    return t_stop - t_run
+
+
+def main(n_points=64, work_ms=50):
+    work = work_ms / 1e3
+    n_cpus = os.cpu_count() or 1
+    print("{} points of {} ms of CPU time each, {} CPUs".format(
+          n_points, work_ms, n_cpus))
+    print("{:<14}{:>12}{:>12}".format("Mode", "time (s)", "speedup"))
+    t_sequential = run_once(SequentialApp("sweep_benchmark", n_points, work),
+                            n_points)
+    print("{:<14}{:>12.2f}{:>12.2f}".format("sequential", t_sequential, 1))
+    results = {'sequential': t_sequential}
+    n_workers = 1
+    while n_workers <= max(n_cpus, 2):
+        elapsed = run_once(SweepApp("sweep_benchmark", n_points, work,
+                                    n_workers), n_points)
+        name = "{} worker{}".format(n_workers, "s" if n_workers > 1 else "")
+        results[name] = elapsed
+        print("{:<14}{:>12.2f}{:>12.2f}".format(name, elapsed,
+                                                t_sequential / elapsed))
+        n_workers *= 2
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
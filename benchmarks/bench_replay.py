@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Benchmark of the replay of a large recording.
+
+A recording of n_rows rows (3 float64 columns, including a time stamp) is
+written in chunks to a temporary directory. The benchmark then measures:
+
+open (ms):          Time to open the recording with a Replayer
+seek (ms):          Time to find the row at a random point in time, and to
+                    read the rows preceding it shown when a replay starts
+                    there (max_rows rows)
+at once (s):        Time to read the whole recording decimated to max_rows
+                    rows, as a replay with replay_speed = None does
+
+Usage:
+    python benchmarks/bench_replay.py [n_rows]
+"""
+
+
+from __future__ import print_function, division
+import shutil
+import sys
+import tempfile
+import time
+import common
+from data_store import ChunkStore
+from replay import Replayer
+import numpy as np
+
+
+def write_recording(path, n_rows, chunk_rows=100000):
+    store = ChunkStore(path)
+    for start in range(0, n_rows, chunk_rows):
+        t = np.arange(start, min(start + chunk_rows, n_rows)) * 1e-4
+        store.append({'t': t, 'x': np.sin(t), 'y': np.cos(3 * t)})
+
+
+def main(n_rows=5000000, n_seeks=20, max_rows=100000):
+    path = tempfile.mkdtemp(prefix='bench_replay_')
+    try:
+        write_recording(path, n_rows)
+        print("Recording of {} rows ({:.0f} MB)".format(n_rows,
+              n_rows * 3 * 8 / 2**20))
+        for time_column in [None, 't']:
+            t_start = time.perf_counter()
+            replayer = Replayer(path, time_column=time_column,
+                                max_rows=max_rows)
+            t_open = time.perf_counter() - t_start
+
+            seeks = []
+            for t in np.random.RandomState(0).uniform(0, replayer.duration,
+                                                      n_seeks):
+                t_start = time.perf_counter()
+                replayer.seek(t)
+                replayer.start()
+                replayer.acquire()      # Rows preceding the starting point
+                seeks.append(time.perf_counter() - t_start)
+
+            replayer.speed = None
+            replayer.start()
+            t_start = time.perf_counter()
+            n_shown = 0
+            while True:
+                data = replayer.acquire()
+                if data is None:
+                    break
+                n_shown += len(data['t'])
+            t_at_once = time.perf_counter() - t_start
+
+            print("time from {:<8} open {:7.2f} ms   seek p50 {:6.2f} ms   "
+                  "at once {:5.2f} s ({} rows shown)".format(
+                  'chunks' if time_column is None else "'t'", t_open * 1e3,
+                  np.median(seeks) * 1e3, t_at_once, n_shown))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
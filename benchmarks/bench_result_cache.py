@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Benchmark of the result cache.
+
+A sweep of a deterministic, slow simulation ('sweep' acquisition mode) is run
+headlessly several times, each run with a new application instance sharing
+the on-disk tier of the cache:
+
+uncached:   cache_results unset, every point is computed
+cold:       empty cache, every point is computed and cached
+warm:       same inputs and parameters, every point comes from the disk tier
+extended:   the grid doubled, half of the points come from the cache
+changed:    one parameter changed, every point is computed again
+
+It reports the wall time of each run and the hits and misses of the cache.
+
+Usage:
+    python benchmarks/bench_result_cache.py [n_points] [work_ms]
+"""
+
+
+from __future__ import print_function, division
+import shutil
+import sys
+import tempfile
+import time
+import common
+from acquisition_app import AcquisitionAPP
+
+
+class SimulationApp(AcquisitionAPP):
+    """Application sweeping a simulation taking work seconds per point"""
+    def __init__(self, app_name, n_points, work, cache_dir):
+        super(SimulationApp, self).__init__(app_name)
+        self.acquisition_mode = 'sweep'
+        self.sweep_workers = 2
+        self.inputs = {'x': 'np.linspace(0, 1, {})'.format(n_points)}
+        self.parameters = {'work': repr(work), 'gain': '1'}
+        self.empty_data = {'x': [], 'y': []}
+        self.cache_dir = cache_dir
+        self.cache_results = cache_dir is not None
+
+    def config(self):
+        pass
+
+    @staticmethod
+    def acquire_point(point, parameters):
+        time.sleep(float(parameters['work']))   # Fake simulation time
+        return {'y': float(parameters['gain']) * point['x'] ** 2}
+
+    def acquire(self):
+        pass
+
+    def save(self):
+        pass
+
+    def exit(self):
+        pass
+
+
+def run_once(n_points, work, cache_dir, parameters=None):
+    inst_app = SimulationApp("cache_benchmark", n_points, work, cache_dir)
+    t_start = time.perf_counter()
+    data = inst_app.run_headless(parameters=parameters)
+    elapsed = time.perf_counter() - t_start
+    assert len(data) == n_points, "{} rows instead of {}".format(len(data),
+                                                                 n_points)
+    cache = inst_app.result_cache()
+    return elapsed, None if cache is None else cache.stats()
+
+
+def main(n_points=200, work_ms=20):
+    n_points, work = int(n_points), work_ms / 1000
+    cache_dir = tempfile.mkdtemp(prefix='result_cache_')
+    runs = [('uncached', n_points, None, None),
+            ('cold', n_points, cache_dir, None),
+            ('warm', n_points, cache_dir, None),
+            ('extended', 2 * n_points - 1, cache_dir, None),
+            ('changed', n_points, cache_dir, {'gain': '2'})]
+    print("{} points of {:g} ms".format(n_points, work_ms))
+    print("{:<10}{:>8}{:>10}{:>10}{:>10}{:>10}".format("Run", "points",
+          "time (s)", "hits", "misses", "speedup"))
+    t_uncached = None
+    run_once(4, work, None)     # Warm-up: imports and worker start-up
+    try:
+        for name, n, path, parameters in runs:
+            elapsed, stats = run_once(n, work, path, parameters)
+            t_uncached = t_uncached or elapsed
+            hits = misses = "-"
+            if stats is not None:
+                hits = stats['hits (memory)'] + stats['hits (disk)']
+                misses = stats['misses']
+            print("{:<10}{:>8}{:>10.2f}{:>10}{:>10}{:>10.1f}".format(name, n,
+                  elapsed, hits, misses, t_uncached / elapsed))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
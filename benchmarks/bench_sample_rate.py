@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Benchmark of fixed-rate acquisition.
+
+A fast acquire() is run through the state machine (run_headless(), without a
+Bokeh server) for about one second at sample periods from 10 ms to 200 us:
+
+sleep:      acquire() calls time.sleep(period), as the example applications
+            used to do
+scheduler:  the application declares sample_period, see scheduler.py
+
+For each, the benchmark reports the achieved sample rate, the error of the
+intervals between consecutive samples (p50, p99, max) and the deadlines the
+scheduler missed.
+
+Usage:
+    python benchmarks/bench_sample_rate.py [duration]
+"""
+
+
+from __future__ import print_function, division
+import sys
+import time
+import common
+from acquisition_app import AcquisitionAPP
+import numpy as np
+
+
+class RateApp(AcquisitionAPP):
+    """Application taking n_samples fast samples"""
+    def __init__(self, app_name, period, n_samples, use_scheduler):
+        super(RateApp, self).__init__(app_name)
+        self.period = period
+        self.n_samples = n_samples
+        self.use_scheduler = use_scheduler
+        self.empty_data = {'t': [], 'y': []}
+        if use_scheduler:
+            self.sample_period = period
+            self.timestamp_column = 't'
+
+    def config(self):
+        pass
+
+    def acquire(self):
+        if self.__just_started__:
+            self.count = 0
+            self.__just_started__ = False
+        self.count += 1
+        if self.count >= self.n_samples:
+            self.__stop_request__ = True
+        if self.use_scheduler:
+            return {'y': self.count}
+        time.sleep(self.period)
+        return {'t': time.perf_counter(), 'y': self.count}
+
+    def save(self):
+        pass
+
+    def exit(self):
+        pass
+
+
+def run_once(period, duration, use_scheduler):
+    n_samples = int(duration / period)
+    inst_app = RateApp("sample_rate_benchmark", period, n_samples,
+                       use_scheduler)
+    data = inst_app.run_headless()
+    t = data['t'].values
+    errors = np.abs(np.diff(t) - period) * 1e6
+    missed = inst_app.__scheduler__.n_missed if use_scheduler else None
+    return (len(t) - 1) / (t[-1] - t[0]), errors, missed
+
+
+def main(duration=1.0):
+    print("{:<10}{:<11}{:>12}{:>12}{:>12}{:>12}{:>8}".format("Period",
+          "Method", "rate (Hz)", "p50 (us)", "p99 (us)", "max (us)",
+          "missed"))
+    for period in [1e-2, 1e-3, 5e-4, 2e-4]:
+        for use_scheduler in [False, True]:
+            rate, errors, missed = run_once(period, duration, use_scheduler)
+            print("{:<10}{:<11}{:>12.1f}{:>12.1f}{:>12.1f}{:>12.1f}{:>8}".format(
+                  "{:g} s".format(period),
+                  "scheduler" if use_scheduler else "sleep", rate,
+                  np.median(errors), np.percentile(errors, 99), errors.max(),
+                  "-" if missed is None else missed))
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
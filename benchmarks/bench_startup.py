@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Startup benchmark of the framework.
+
+Every measurement runs in a fresh Python process:
+
+import:     Time to import acquisition_app, and which heavy dependencies
+            (Bokeh, Tornado, pandas) it loaded
+headless:   Time from the start of the imports to the first acquire() call
+            of an application run with run_headless()
+ui:         Time from the start of the imports to the first acquire() call
+            of an application whose UI is built in a Bokeh document (no
+            server is needed; skipped if Bokeh is not installed)
+
+The process column is the wall time of the whole child process, including
+the start of the interpreter.
+
+Usage:
+    python benchmarks/bench_startup.py [n_repeats]
+"""
+
+
+from __future__ import print_function, division
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['bokeh', 'tornado', 'pandas']
+
+
+def child(mode):
+    """Measure one startup in this process and print the result as JSON"""
+    t_start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    from acquisition_app import AcquisitionAPP
+    result = {'import': time.perf_counter() - t_start,
+              'loaded': [name for name in HEAVY_MODULES
+                         if name in sys.modules]}
+    if mode == 'import':
+        print(json.dumps(result))
+        return
+
+    class StartupApp(AcquisitionAPP):
+        def config(self):
+            pass
+
+        def acquire(self):
+            result['first acquire'] = time.perf_counter() - t_start
+            if mode == 'ui':
+                print(json.dumps(result))
+                sys.stdout.flush()
+                os._exit(0)     # Nothing else to measure
+            return None         # Stop the run
+
+        def save(self):
+            pass
+
+        def exit(self):
+            pass
+
+    inst_app = StartupApp("startup_benchmark")
+    if mode == 'headless':
+        inst_app.run_headless()
+        print(json.dumps(result))
+        return
+
+    from threading import Thread
+    from bokeh.document import Document
+    from acquisition_app_UI import AcquisitionAPPUI
+    from acquisition_app_statemachine import AcquisitionAPPStateMachine
+    inst_app.prepare()
+    AcquisitionAPPUI(inst_app, doc=Document()).create_UI()
+    inst_app.__run_request__ = True
+    Thread(target=AcquisitionAPPStateMachine(inst_app).runAll).start()
+
+
+def run_child(mode):
+    """Return the result of a child process, or None if it failed"""
+    t_start = time.perf_counter()
+    process = subprocess.run([sys.executable, os.path.abspath(__file__),
+                              '--child', mode], stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - t_start
+    for line in reversed(process.stdout.splitlines()):
+        if line.startswith('{'):
+            result = json.loads(line)
+            result['process'] = elapsed
+            return result
+    return None
+
+
+def main(n_repeats=5):
+    print("Median startup times (ms) over {} processes".format(n_repeats))
+    print("{:<10}{:>10}{:>16}{:>10}   {}".format("Mode", "import",
+          "first acquire", "process", "heavy modules loaded"))
+    results = {}
+    for mode in ['import', 'headless', 'ui']:
+        runs = [run_child(mode) for i in range(n_repeats)]
+        if None in runs:
+            print("{:<10}{:>10}".format(mode, "failed (is Bokeh installed?)"))
+            continue
+        results[mode] = runs
+
+        def median(key):
+            values = [run[key] for run in runs if key in run]
+            return np.median(values) * 1e3 if values else float('nan')
+        print("{:<10}{:>10.0f}{:>16.0f}{:>10.0f}   {}".format(mode,
+              median('import'), median('first acquire'), median('process'),
+              ", ".join(runs[0]['loaded']) or "none"))
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        child(sys.argv[2])
+    else:
+        main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Latency benchmark of the UI events.
+
+Measures the time from calling an AcquisitionAPPUI event handler (Run, Pause,
+Stop, Exit) to the state machine reaching the corresponding state. No Bokeh
+server is needed: the UI is created without a session and the application
+acquires nothing.
+
+Usage:
+    python benchmarks/bench_state_latency.py [n_repeats]
+"""
+
+
+from __future__ import print_function, division
+import sys
+from common import TrackedApp, wait_for_state, start
+import numpy as np
+import time
+
+
+class IdleApp(TrackedApp):
+    """Application whose acquire() returns no rows"""
+    def acquire(self):
+        self.__just_started__ = False
+        time.sleep(1e-4)
+        return {}
+
+
+def measure(inst_app, handler, state_name):
+    """Return the latency (s) between calling handler and state_name"""
+    since = inst_app.mark()
+    t_start = time.perf_counter()
+    handler()
+    return wait_for_state(inst_app, state_name, since) - t_start
+
+
+def main(n_repeats=200):
+    inst_app = IdleApp(app_name="latency_benchmark")
+    inst_UI, thread_SM = start(inst_app)
+
+    latencies = {'Run': [], 'Pause': [], 'Resume': [], 'Stop': []}
+    for i in range(n_repeats):
+        latencies['Run'].append(measure(inst_app, inst_UI.on_run_handler,
+                                        "Run"))
+        latencies['Pause'].append(measure(inst_app,
+                lambda: inst_UI.on_pause_handler('active', False, True),
+                "Pause"))
+        latencies['Resume'].append(measure(inst_app,
+                lambda: inst_UI.on_pause_handler('active', True, False),
+                "Run"))
+        latencies['Stop'].append(measure(inst_app, inst_UI.on_stop_handler,
+                                         "Idle"))
+    latencies['Exit'] = [measure(inst_app, inst_UI.on_exit_handler, "Exit")]
+    thread_SM.join()
+
+    print("{:<8}{:>14}{:>14}{:>14}".format("Event", "median (ms)",
+                                           "p99 (ms)", "max (ms)"))
+    for name, values in latencies.items():
+        values = np.array(values) * 1e3
+        print("{:<8}{:>14.3f}{:>14.3f}{:>14.3f}".format(name,
+                np.median(values), np.percentile(values, 99), values.max()))
+    return latencies
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
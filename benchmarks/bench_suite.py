@@ -0,0 +1,261 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Reproducible benchmark suite of the acquisition framework.
+
+Every scenario drives an AcquisitionAPP subclass headlessly, without a Bokeh
+server or a browser, against simulated instruments with a given latency,
+jitter, number of channels and acquisition mode (per point or per block).
+The document of the application is replaced by a LoopDocument, so the
+outputs are updated on an IO loop thread as with a Bokeh server.
+
+For each scenario, the suite measures:
+
+samples per second:     Rows reaching the outputs per second of Run state
+memory growth (MB):     Resident memory after the run minus before, or
+                        n/a where it cannot be read (e.g., on Windows
+                        without psutil)
+update lag (ms):        Time from acquire() returning a row to the row
+                        reaching the outputs (p50, p99, max)
+stream lag (ms):        Delay of the flush callbacks on the IO loop, see
+                        instrumentation.py
+event latency (ms):     Time from a Run/Pause/Resume/Stop button event to the
+                        state machine reaching the state, during acquisition
+
+The results are written to a JSON file with the environment they were
+obtained in, so runs on different commits or machines can be compared.
+
+Usage:
+    python benchmarks/bench_suite.py [--out results.json] [--quick]
+                                     [--scenario NAME ...]
+"""
+
+
+from __future__ import print_function, division
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from common import TrackedApp, LoopDocument, wait_for_state, start, stop
+from simulated_instruments import SimulatedInstrument
+import numpy as np
+
+
+# name, mode, number of samples, samples per block, latency (s), jitter (s),
+# channels
+SCENARIOS = [
+    dict(name='point-fast', mode='point', n_samples=20000, block_size=1,
+         latency=0.0, jitter=0.0, channels=1),
+    dict(name='point-slow-jitter', mode='point', n_samples=500, block_size=1,
+         latency=2e-3, jitter=1e-3, channels=1),
+    dict(name='point-wide', mode='point', n_samples=10000, block_size=1,
+         latency=0.0, jitter=0.0, channels=16),
+    dict(name='block-fast', mode='block', n_samples=1000000, block_size=10000,
+         latency=0.0, jitter=0.0, channels=1),
+    dict(name='block-slow-jitter', mode='block', n_samples=200000,
+         block_size=2000, latency=5e-3, jitter=2e-3, channels=4),
+]
+
+
+def resident_memory():
+    """
+    Return the resident memory of the process in bytes, or None if it cannot
+    be read
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        import resource     # Not available on Windows
+    except ImportError:
+        return None
+    # Peak resident memory, in kB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class SuiteApp(TrackedApp):
+    """Application reading one simulated instrument"""
+    def __init__(self, app_name, scenario, seed=0):
+        super(SuiteApp, self).__init__(app_name)
+        self.scenario = scenario
+        self.acquisition_mode = scenario['mode']
+        self.instrumentation = True
+        self.instrument = SimulatedInstrument("inst", scenario['latency'],
+                                              scenario['jitter'],
+                                              scenario['channels'], seed)
+        self.channels = ['ch{}'.format(i) for i in range(scenario['channels'])]
+        self.empty_data = {key: [] for key in ['t'] + self.channels}
+        self.n_samples = scenario['n_samples']     # None: until stopped
+        self.update_lags = []
+
+    def prepare(self):
+        super(SuiteApp, self).prepare()
+        # Measure when the rows reach the outputs
+        sink = self.__stream_buffer__.sink
+
+        def timed_sink(new_data):
+            sink(new_data)
+            self.update_lags.append(time.perf_counter() -
+                                    np.asarray(new_data['t'], dtype=float))
+        self.__stream_buffer__.sink = timed_sink
+
+    def acquire(self):
+        if self.__just_started__:
+            self.count = 0
+            self.__just_started__ = False
+        if self.acquisition_mode == 'block':
+            n_samples = self.scenario['block_size']
+            if self.n_samples is not None:
+                n_samples = min(n_samples, self.n_samples - self.count)
+            values = self.instrument.read_block(n_samples)
+            data = {key: values[:, i] for i, key in enumerate(self.channels)}
+            data['t'] = np.full(n_samples, time.perf_counter())
+        else:
+            n_samples = 1
+            values = np.atleast_1d(self.instrument.read())
+            data = {key: values[i] for i, key in enumerate(self.channels)}
+            data['t'] = time.perf_counter()
+        self.count += n_samples
+        if self.n_samples is not None and self.count >= self.n_samples:
+            self.__stop_request__ = True
+        return data
+
+
+def summary_ms(values):
+    values = np.asarray(values) * 1e3
+    if len(values) == 0:
+        return None
+    return {'p50': float(np.median(values)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(values.max())}
+
+
+def measure_event(inst_app, handler, state_name):
+    since = inst_app.mark()
+    t_start = time.perf_counter()
+    handler()
+    return wait_for_state(inst_app, state_name, since) - t_start
+
+
+def run_scenario(scenario, n_repeats=5):
+    """Return the measurements of scenario as a dictionary"""
+    doc = LoopDocument()
+    inst_app = SuiteApp("benchmark_suite", scenario)
+    memory_before = resident_memory()
+    inst_UI, thread_SM = start(inst_app, doc)
+
+    # Throughput, memory and lags of a complete run
+    since = inst_app.mark()
+    inst_UI.on_run_handler()
+    t_run = wait_for_state(inst_app, "Run", since)
+    t_stop = wait_for_state(inst_app, "Stop", since)
+    wait_for_state(inst_app, "Idle", since)
+    memory_after = resident_memory()
+    n_rows = len(inst_app.__store__)
+    diagnostics = inst_app.diagnostics()
+    stream_lag = diagnostics['stages'].get('stream lag')
+    lags = np.concatenate(inst_app.update_lags) if inst_app.update_lags \
+           else []
+
+    # Latency of the UI events while acquiring
+    inst_app.n_samples = None
+    events = {'Run': [], 'Pause': [], 'Resume': [], 'Stop': []}
+    for i in range(n_repeats):
+        events['Run'].append(measure_event(inst_app, inst_UI.on_run_handler,
+                                           "Run"))
+        time.sleep(0.05)
+        events['Pause'].append(measure_event(inst_app,
+                lambda: inst_UI.on_pause_handler('active', False, True),
+                "Pause"))
+        events['Resume'].append(measure_event(inst_app,
+                lambda: inst_UI.on_pause_handler('active', True, False),
+                "Run"))
+        time.sleep(0.05)
+        events['Stop'].append(measure_event(inst_app, inst_UI.on_stop_handler,
+                                            "Idle"))
+    stop(inst_app, inst_UI, thread_SM)
+    doc.close()
+
+    return {'scenario': scenario,
+            'rows': n_rows,
+            'complete': n_rows == scenario['n_samples'],
+            'samples per second': n_rows / (t_stop - t_run),
+            'memory growth (MB)': None if memory_before is None else
+                (memory_after - memory_before) / 2**20,
+            'update lag (ms)': summary_ms(lags),
+            'stream lag (ms)': None if stream_lag is None else
+                {key: stream_lag[key] * 1e3 for key in ['p50', 'p99', 'max']},
+            'event latency (ms)': {name: summary_ms(values)
+                                   for name, values in events.items()}}
+
+
+def environment():
+    """Return a description of where the suite runs"""
+    try:
+        commit = subprocess.check_output(
+                    ['git', 'rev-parse', 'HEAD'],
+                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                    stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', default='benchmark_results.json',
+                        help="JSON file the results are written to")
+    parser.add_argument('--quick', action='store_true',
+                        help="Acquire 10 times fewer samples")
+    parser.add_argument('--scenario', nargs='*',
+                        help="Names of the scenarios to run (default: all)")
+    args = parser.parse_args(argv)
+
+    results = []
+    print("{:<20}{:>14}{:>12}{:>16}{:>16}".format("Scenario", "samples/s",
+          "memory MB", "lag p99 (ms)", "Stop p99 (ms)"))
+    for scenario in SCENARIOS:
+        if args.scenario and scenario['name'] not in args.scenario:
+            continue
+        scenario = dict(scenario)
+        if args.quick:
+            scenario['n_samples'] = max(scenario['n_samples'] // 10,
+                                        scenario['block_size'])
+        result = run_scenario(scenario)
+        results.append(result)
+        memory = result['memory growth (MB)']
+        print("{:<20}{:>14.0f}{:>12}{:>16.2f}{:>16.2f}".format(
+              scenario['name'], result['samples per second'],
+              "n/a" if memory is None else "{:.1f}".format(memory),
+              result['update lag (ms)']['p99'],
+              result['event latency (ms)']['Stop']['p99']))
+        if not result['complete']:
+            print("  Warning: {} rows reached the outputs instead of "
+                  "{}".format(result['rows'], scenario['n_samples']))
+
+    with open(args.out, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f,
+                  indent=2)
+    print("Results written to {}".format(args.out))
+    return results
+
+
+if __name__ == '__main__':
+    main()
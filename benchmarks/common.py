@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+Helpers shared by the benchmarks: driving an AcquisitionAPP without a Bokeh
+server and waiting for its state transitions.
+"""
+
+
+from __future__ import print_function, division
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from threading import Thread, Condition
+import heapq
+import itertools
+from acquisition_app import AcquisitionAPP
+from acquisition_app_statemachine import AcquisitionAPPStateMachine
+import time
+
+
+class TrackedApp(AcquisitionAPP):
+    """
+    Application recording when each state is entered, so a benchmark can
+    block until a state is reached instead of spinning (spinning would hold
+    the GIL and delay the state machine thread).
+    """
+    @property
+    def __state_name__(self):
+        return self.__state__
+
+    @__state_name__.setter
+    def __state_name__(self, value):
+        with self.__state_cond__:
+            self.__state__ = value
+            self.__history__.append((value, time.perf_counter()))
+            self.__state_cond__.notify_all()
+
+    def __init__(self, app_name):
+        self.__state_cond__ = Condition()
+        self.__history__ = []   # (state name, time entered) of every state
+        super(TrackedApp, self).__init__(app_name)
+
+    def mark(self):
+        """Return a mark to be passed to wait_for_state() as since"""
+        with self.__state_cond__:
+            return len(self.__history__)
+
+    def config(self):
+        pass
+
+    def save(self):
+        pass
+
+    def exit(self):
+        pass
+
+
+class LoopDocument(object):
+    """
+    Stand-in for the Bokeh document of an application: the callbacks the
+    framework schedules on the document (next tick, timeout, periodic) run on
+    one thread, like on the IO loop of a Bokeh server. It lets a benchmark
+    measure how late the outputs are updated without a server.
+    """
+    def __init__(self):
+        self.title = ""
+        self.__cond__ = Condition()
+        self.__callbacks__ = []     # Heap of (due time, sequence, callback)
+        self.__sequence__ = itertools.count()
+        self.__closed__ = False
+        self.__thread__ = Thread(target=self.__loop__)
+        self.__thread__.daemon = True
+        self.__thread__.start()
+
+    def __schedule__(self, callback, delay, period=None):
+        with self.__cond__:
+            heapq.heappush(self.__callbacks__,
+                           (time.perf_counter() + delay,
+                            next(self.__sequence__), callback, period))
+            self.__cond__.notify()
+        return callback
+
+    def add_next_tick_callback(self, callback):
+        return self.__schedule__(callback, 0)
+
+    def add_timeout_callback(self, callback, timeout_milliseconds):
+        return self.__schedule__(callback, timeout_milliseconds / 1e3)
+
+    def add_periodic_callback(self, callback, period_milliseconds):
+        return self.__schedule__(callback, period_milliseconds / 1e3,
+                            period_milliseconds / 1e3)
+
+    def add_root(self, model):
+        pass
+
+    def __loop__(self):
+        while True:
+            with self.__cond__:
+                while not self.__closed__ and (not self.__callbacks__ or
+                        self.__callbacks__[0][0] > time.perf_counter()):
+                    timeout = self.__callbacks__[0][0] - time.perf_counter() \
+                              if self.__callbacks__ else None
+                    self.__cond__.wait(timeout)
+                if self.__closed__:
+                    return
+                due, sequence, callback, period = heapq.heappop(
+                                                        self.__callbacks__)
+                if period is not None:
+                    heapq.heappush(self.__callbacks__,
+                                   (due + period, next(self.__sequence__),
+                                    callback, period))
+            callback()
+
+    def close(self):
+        with self.__cond__:
+            self.__closed__ = True
+            self.__cond__.notify()
+        self.__thread__.join()
+
+
+def wait_for_state(inst_app, state_name, since=0, timeout=60):
+    """
+    Block until the application enters state_name after mark since (see
+    TrackedApp.mark). Return the time the state was entered.
+    """
+    def entered():
+        for name, entered_at in inst_app.__history__[since:]:
+            if name == state_name:
+                return entered_at
+
+    with inst_app.__state_cond__:
+        if not inst_app.__state_cond__.wait_for(
+                lambda: entered() is not None, timeout):
+            raise RuntimeError("State {} not reached".format(state_name))
+        return entered()
+
+
+def start(inst_app, doc=None):
+    """
+    Start the state machine of inst_app without a Bokeh server. Return the
+    UI (usable for its event handlers only) and the state machine thread.
+
+    doc, e.g., a LoopDocument, stands in for the document of the application.
+    """
+    # Loads Bokeh: only the benchmarks driving the UI need it
+    from acquisition_app_UI import AcquisitionAPPUI
+    inst_app.prepare()
+    inst_UI = AcquisitionAPPUI(inst_app, connect=False)
+    inst_app.__doc__ = doc
+    inst_SM = AcquisitionAPPStateMachine(inst_app)
+    thread_SM = Thread(target=inst_SM.runAll)
+    thread_SM.start()
+    wait_for_state(inst_app, "Idle")
+    return inst_UI, thread_SM
+
+
+def stop(inst_app, inst_UI, thread_SM):
+    """Exit the application and wait for its state machine to terminate"""
+    inst_UI.on_exit_handler()
+    thread_SM.join()
@@ -0,0 +1,216 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the broadcast of the outputs to many viewers.
+
+Every viewer of a Bokeh document adds its own synchronization work to the
+session of the application. With self.broadcast_port set, the data patches
+are also published as server-sent events, which any number of viewers (e.g.,
+a lab monitor and remote browsers) can follow:
+
+    var source = new EventSource("http://localhost:5007/ErrRate_vs_Volt");
+    source.onmessage = function(event) { var message = JSON.parse(event.data); };
+
+The Flask app serves such a viewer at http://localhost:5000/<app_name>/live
+(templates/viewer.html): it plots the outputs without a Bokeh session.
+
+Each patch is encoded once, when it is published, into a ring of the latest
+patches shared by all viewers; a viewer only keeps its position in the ring.
+The cost of publishing does not depend on the number of viewers, and it runs
+on the IO loop, not in the acquisition thread. A viewer that falls behind
+the ring, or that just connected, gets a snapshot of the outputs instead of
+the patches it missed: slow viewers skip intermediate patches and never hold
+back the others. A snapshot is encoded once per version of the outputs, no
+matter how many viewers need it, and outside the lock of the outputs: only a
+copy of the columns is taken with it held, so viewers never stall the
+acquisition or the streaming of the outputs.
+
+The events are served on 127.0.0.1 only, to the pages of the origins allowed
+(by default, the Flask app). There is no authentication: only set
+broadcast_host to a wider address, e.g., '0.0.0.0', on a trusted network.
+
+Messages are JSON objects:
+    {"type": "snapshot", "seq": 12, "data": {column: [...]}}
+    {"type": "patch", "seq": 13, "data": {column: [...]}, "rollover": null}
+"""
+
+
+from __future__ import print_function
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Condition, Lock, Thread
+import json
+import numpy as np
+
+
+# Origins of the pages allowed to follow the events: the Flask app
+DEFAULT_ORIGINS = ('http://localhost:5000', 'http://127.0.0.1:5000')
+
+
+def encode(message):
+    """Encode a message as JSON bytes. NaN and infinities become null."""
+    data = {}
+    for key, value in message.get('data', {}).items():
+        value = np.asarray(value)
+        if value.dtype.kind == 'f' and not np.isfinite(value).all():
+            value = np.where(np.isfinite(value), value, None)
+        data[key] = value.tolist()
+    message = dict(message, data=data)
+    return json.dumps(message).encode('utf-8')
+
+
+class Broadcaster(object):
+    """Ring of encoded patches followed by many viewers"""
+
+    def __init__(self, snapshot, backlog=64, rollover=None):
+        """
+        snapshot() returns the whole outputs as a dictionary of columns. It is
+        called with lock held, so the outputs must only change with lock
+        held too. backlog is the number of patches kept for viewers that are
+        behind; rollover is the number of rows the viewers keep.
+        """
+        self.snapshot = snapshot
+        self.rollover = rollover
+        self.lock = Condition()
+        self.seq = 0                        # Version of the outputs
+        self.__ring__ = deque(maxlen=backlog)   # (seq, encoded patch)
+        self.__snapshot__ = None            # (seq, encoded snapshot)
+        self.__snapshot_lock__ = Lock()     # Held while a snapshot is encoded
+        self.n_viewers = 0
+
+    def publish(self, new_data):
+        """
+        Encode a patch once for all viewers. Call it with lock held, together
+        with the change of the outputs.
+        """
+        self.seq += 1
+        self.__ring__.append((self.seq, encode(
+                        {'type': 'patch', 'seq': self.seq, 'data': new_data,
+                         'rollover': self.rollover})))
+        self.lock.notify_all()
+
+    def reset(self):
+        """
+        Make every viewer start again from a snapshot, e.g., when a new run
+        clears the outputs. Call it with lock held.
+        """
+        self.seq += 1
+        self.__ring__.clear()
+        self.lock.notify_all()
+
+    def __encoded_snapshot__(self):
+        """
+        Return (seq, encoded snapshot) of the current version of the outputs.
+        Call it without lock held: lock is only held to copy the columns.
+        """
+        with self.__snapshot_lock__:
+            with self.lock:
+                seq = self.seq
+                if self.__snapshot__ is not None and \
+                        self.__snapshot__[0] == seq:
+                    return self.__snapshot__
+                # A copy, since the outputs change once lock is released
+                data = {key: np.array(value)
+                        for key, value in self.snapshot().items()}
+            self.__snapshot__ = (seq, encode({'type': 'snapshot', 'seq': seq,
+                                              'data': data}))
+            return self.__snapshot__
+
+    def next(self, cursor, timeout=None):
+        """
+        Return (messages, cursor): the encoded messages a viewer at position
+        cursor (None for a new viewer) has not seen yet, and its new position.
+        Block up to timeout seconds until there is one.
+        """
+        with self.lock:
+            if cursor is not None:
+                self.lock.wait_for(lambda: self.seq != cursor, timeout)
+                if self.seq == cursor:
+                    return [], cursor
+            oldest = self.__ring__[0][0] if self.__ring__ else None
+            if cursor is not None and oldest is not None and \
+                    oldest - 1 <= cursor <= self.seq:
+                return [patch for seq, patch in self.__ring__
+                        if seq > cursor], self.seq
+        # New or slow viewer: the snapshot replaces the missed patches
+        seq, snapshot = self.__encoded_snapshot__()
+        return [snapshot], seq
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class BroadcastServer(object):
+    """HTTP server of the server-sent events of many applications"""
+
+    def __init__(self, broadcasters, port=5007, host='127.0.0.1',
+                 origins=DEFAULT_ORIGINS, keepalive=15):
+        """
+        broadcasters is a dictionary {app_name: Broadcaster}. The events of an
+        application are served at http://<host>:<port>/<app_name>.
+
+        host is the address to listen on: only set a wider one, e.g.,
+        '0.0.0.0', on a trusted network. origins are the origins of the pages
+        allowed to follow the events from a browser.
+        """
+        self.broadcasters = broadcasters
+        self.port = port
+        self.origins = set(origins)
+        self.keepalive = keepalive
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.__serve__(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.__thread__ = Thread(target=self.httpd.serve_forever)
+        self.__thread__.daemon = True
+
+    def start(self):
+        self.__thread__.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __serve__(self, request):
+        """Stream the events of an application to one viewer"""
+        broadcaster = self.broadcasters.get(request.path.strip('/'))
+        if broadcaster is None:
+            request.send_error(404, "No application named '{}'".format(
+                               request.path.strip('/')))
+            return
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/event-stream')
+        request.send_header('Cache-Control', 'no-cache')
+        origin = request.headers.get('Origin')
+        if origin in self.origins:
+            request.send_header('Access-Control-Allow-Origin', origin)
+        request.end_headers()
+        with broadcaster.lock:
+            broadcaster.n_viewers += 1
+        cursor = None
+        try:
+            while True:
+                messages, cursor = broadcaster.next(cursor, self.keepalive)
+                if messages:
+                    # The messages are written in one go: a viewer that is
+                    # slow to read only delays itself
+                    request.wfile.write(b"".join(b"data: " + message +
+                                                 b"\n\n"
+                                                 for message in messages))
+                else:
+                    request.wfile.write(b": keepalive\n\n")
+                request.wfile.flush()
+        except (IOError, OSError):
+            pass        # The viewer went away
+        finally:
+            with broadcaster.lock:
+                broadcaster.n_viewers -= 1
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the controls of AcquisitionAPP and the snapshot of them
+a run uses.
+
+The text boxes of the control panel are edited in the UI thread while
+acquire() runs in the state machine thread. Each edit only replaces the
+pythonic string of its own control in the schema. When Run is pressed, the
+state machine freezes the strings of the schema into a snapshot, and the
+run only reads the snapshot: edits made during a run take effect at the
+next one, so a sweep never sees its inputs change halfway.
+
+During a run, self.inputs and self.parameters are plain copies of the
+strings of the snapshot, whose own dictionaries are read-only. A string is
+parsed only when the application asks for its value, e.g.,
+self.value('Volt (V)'), and at most once per run, so strings that are not
+meant to be parsed, such as a file path, are left alone. The values of
+side-effect-free strings are only computed once, see parse_cache.py.
+
+Most of the time of an edit goes to checking the new string, see
+AcquisitionAPP.validate(), which the former handlers did as well. Replacing
+one string instead of copying every text box only saves time with hundreds
+of controls, and the snapshot is the price of the consistent run: it copies
+the strings once per Run. See benchmarks/bench_controls.py for the figures.
+"""
+
+
+from __future__ import print_function
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from types import MappingProxyType
+
+
+KINDS = ('input', 'parameter')
+
+# One control of the panel: its kind and its pythonic string
+Control = namedtuple('Control', ['name', 'kind', 'string'])
+
+
+class RunSnapshot(object):
+    """
+    Frozen controls of a run: read-only dictionaries of the strings of the
+    inputs and of the parameters, and their values, parsed on demand.
+    """
+
+    def __init__(self, inputs, parameters, evaluate):
+        """evaluate(string) returns the value of a string or raises"""
+        self.inputs = MappingProxyType(inputs)
+        self.parameters = MappingProxyType(parameters)
+        self.__evaluate__ = evaluate
+        self.__values__ = {}    # name: value parsed during the run
+
+    def value(self, name):
+        """
+        Return the value of control name, parsing its string the first time.
+        Raise the exception of evaluate if the string cannot be parsed.
+        """
+        try:
+            return self.__values__[name]
+        except KeyError:
+            pass
+        if name in self.inputs:
+            string = self.inputs[name]
+        else:
+            string = self.parameters[name]
+        return self.__values__.setdefault(name, self.__evaluate__(string))
+
+
+class ControlSchema(object):
+    """Thread-safe inputs and parameters of an application"""
+
+    def __init__(self, inputs, parameters):
+        """inputs and parameters are dictionaries of pythonic strings"""
+        self.__lock__ = Lock()
+        self.__kinds__ = OrderedDict()      # name: kind
+        # The strings are kept per kind, so a snapshot is two dictionary
+        # copies
+        self.__strings__ = {kind: {} for kind in KINDS}
+        for kind, strings in zip(KINDS, [inputs, parameters]):
+            for name, string in strings.items():
+                if name in self.__kinds__:
+                    raise ValueError("'{}' is both an input and a "
+                                     "parameter".format(name))
+                self.__kinds__[name] = kind
+                self.__strings__[kind][name] = string
+
+    def __contains__(self, name):
+        return name in self.__kinds__
+
+    def __getitem__(self, name):
+        kind = self.__kinds__[name]
+        return Control(name, kind, self.__strings__[kind][name])
+
+    def names(self, kind=None):
+        """Return the names of the controls of kind, or of all controls"""
+        return [name for name, control_kind in self.__kinds__.items()
+                if kind is None or control_kind == kind]
+
+    def update(self, name, string):
+        """Replace the string of control name. Return the previous string."""
+        kind = self.__kinds__.get(name)
+        if kind is None:
+            raise ValueError("Unknown input or parameter '{}'".format(name))
+        strings = self.__strings__[kind]
+        with self.__lock__:
+            old = strings[name]
+            strings[name] = string
+        return old
+
+    def strings(self, kind):
+        """Return the strings of the controls of kind as a dictionary"""
+        with self.__lock__:
+            return self.__strings__[kind].copy()
+
+    def snapshot(self, evaluate):
+        """
+        Return the frozen controls for a run. evaluate(string) returns the
+        value of a string or raises; it is only called when a value is asked.
+        """
+        with self.__lock__:
+            inputs = self.__strings__['input'].copy()
+            parameters = self.__strings__['parameter'].copy()
+        return RunSnapshot(inputs, parameters, evaluate)
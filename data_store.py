@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines an append-only, chunked columnar store on disk.
+
+A store is a directory. Each appended block of rows becomes one chunk, and
+every column of a chunk is written as its own .npy file. The list of chunks is
+kept in an append-only index file, one line per chunk, so whatever has been
+appended survives a crash of the program. Chunks are memory-mapped when read
+back whenever their dtype allows it. Opening a store only reads its index,
+and reading a range of rows only touches the chunks holding them, so large
+recordings open and seek without reading their data (see replay.py).
+
+Layout:
+    columns.json            # Column names, in order
+    index.txt               # One line per chunk: "<n_rows> <time>"
+    c0000_000000.npy        # Column 0, chunk 0
+    c0001_000000.npy        # Column 1, chunk 0
+    ...
+"""
+
+
+from __future__ import print_function, division
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+
+class ChunkStore(object):
+    """Append-only chunked columnar store"""
+
+    def __init__(self, path):
+        """
+        Open the store in directory path, creating it if needed. Existing
+        chunks are kept and new chunks are appended after them.
+        """
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.columns = []
+        self.chunk_rows = []        # Number of rows of each chunk
+        self.chunk_times = []       # time.time() each chunk was appended at
+        self.__load_index__()
+
+    def __load_index__(self):
+        columns_file = os.path.join(self.path, 'columns.json')
+        if os.path.exists(columns_file):
+            with open(columns_file) as f:
+                self.columns = json.load(f)
+        index_file = os.path.join(self.path, 'index.txt')
+        if os.path.exists(index_file):
+            with open(index_file) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 2:
+                        continue    # Incomplete line of an interrupted append
+                    self.chunk_rows.append(int(fields[0]))
+                    self.chunk_times.append(float(fields[1]))
+
+    def __chunk_file__(self, column_idx, chunk_idx):
+        return os.path.join(self.path,
+                            'c{:04d}_{:06d}.npy'.format(column_idx, chunk_idx))
+
+    def __len__(self):
+        return sum(self.chunk_rows)
+
+    @property
+    def n_chunks(self):
+        return len(self.chunk_rows)
+
+    @property
+    def offsets(self):
+        """Row index each chunk starts at, followed by the number of rows"""
+        return np.concatenate([[0], np.cumsum(self.chunk_rows, dtype=np.int64)])
+
+    def chunk_of(self, row):
+        """Return the index of the chunk holding row"""
+        return int(np.searchsorted(self.offsets, row, side='right')) - 1
+
+    def append(self, data):
+        """
+        Append a dictionary of equal-length columns as one chunk.
+
+        The columns of the first chunk define the columns of the store.
+        """
+        if not self.columns:
+            self.columns = [str(key) for key in data]
+            with open(os.path.join(self.path, 'columns.json'), 'w') as f:
+                json.dump(self.columns, f)
+        values = [np.asarray(data[key]) for key in self.columns]
+        n_rows = len(values[0])
+        for key, value in zip(self.columns, values):
+            if len(value) != n_rows:
+                raise ValueError("Column '{}' has {} rows instead of {}".format(
+                                 key, len(value), n_rows))
+        if n_rows == 0:
+            return
+        chunk_idx = len(self.chunk_rows)
+        for column_idx, value in enumerate(values):
+            np.save(self.__chunk_file__(column_idx, chunk_idx), value,
+                    allow_pickle=value.dtype.hasobject)
+        # The index line is written last: a chunk only exists once it is listed
+        now = time.time()
+        with open(os.path.join(self.path, 'index.txt'), 'a') as f:
+            f.write("{} {!r}\n".format(n_rows, now))
+        self.chunk_rows.append(n_rows)
+        self.chunk_times.append(now)
+
+    def read_chunk(self, chunk_idx, columns=None):
+        """
+        Return chunk chunk_idx as a dictionary of arrays. Chunks are memory
+        mapped unless they hold Python objects.
+        """
+        columns = self.columns if columns is None else columns
+        chunk = {}
+        for key in columns:
+            filename = self.__chunk_file__(self.columns.index(key), chunk_idx)
+            try:
+                chunk[key] = np.load(filename, mmap_mode='r')
+            except ValueError:
+                # Object arrays cannot be memory-mapped
+                chunk[key] = np.load(filename, allow_pickle=True)
+        return chunk
+
+    def read(self, start=0, stop=None, columns=None):
+        """
+        Return rows [start, stop) as a dictionary of arrays.
+        """
+        columns = self.columns if columns is None else columns
+        offsets = self.offsets
+        stop = offsets[-1] if stop is None else min(stop, offsets[-1])
+        parts = {key: [] for key in columns}
+        # Only the chunks holding the rows are opened
+        first = max(self.chunk_of(start), 0)
+        for chunk_idx in range(first, self.n_chunks):
+            chunk_start, chunk_stop = offsets[chunk_idx], offsets[chunk_idx + 1]
+            if chunk_stop <= start:
+                continue
+            if chunk_start >= stop:
+                break
+            chunk = self.read_chunk(chunk_idx, columns)
+            lo = max(start - chunk_start, 0)
+            hi = min(stop, chunk_stop) - chunk_start
+            for key in columns:
+                parts[key].append(chunk[key][lo:hi])
+        return {key: np.concatenate(value) if value else np.array([])
+                for key, value in parts.items()}
+
+    def to_df(self):
+        """Return the whole store as a pandas DataFrame"""
+        import pandas as pd
+        data = self.read()
+        return pd.DataFrame(data, columns=self.columns)
+
+    def clear(self):
+        """Remove all chunks from the store"""
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        self.columns = []
+        self.chunk_rows = []
+        self.chunk_times = []
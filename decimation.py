@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines decimated views of the application outputs for large
+live plots.
+
+The full-resolution data stay on the server, in the store of the outputs
+(output_store.py). A view keeps, for each of the n pixel columns (buckets) of
+the plotted x-range, only the points with the smallest and the largest y
+value, and the plotted ColumnDataSource holds those at most 2 * n points.
+New rows are merged into the existing buckets, so the cost of an update
+depends on the plot width and on the number of new rows, not on the number
+of rows acquired. When the x-range
+changes on zoom or pan, the buckets are recomputed from the full data.
+"""
+
+
+from __future__ import print_function, division
+from bokeh.models import ColumnDataSource
+import numpy as np
+
+
+def minmax_reduce(data, x, y, start, end, n_buckets):
+    """
+    Return the points of the dictionary of columns data keeping, for each of
+    the n_buckets buckets splitting [start, end] along column x, the points
+    with the smallest and the largest column y. Points outside [start, end]
+    or with a NaN are dropped. The result is sorted along x.
+    """
+    x_values = np.asarray(data[x], dtype=float)
+    y_values = np.asarray(data[y], dtype=float)
+    inside = ((x_values >= start) & (x_values <= end) &
+              np.isfinite(x_values) & np.isfinite(y_values))
+    rows = np.flatnonzero(inside)
+    if len(rows) == 0:
+        return {key: np.asarray(value)[:0] for key, value in data.items()}
+    span = end - start if end > start else 1.0
+    bucket = ((x_values[rows] - start) / span * n_buckets).astype(int)
+    np.clip(bucket, 0, n_buckets - 1, out=bucket)
+    # Sort by bucket, then by y: the first and last row of each bucket are
+    # its minimum and maximum
+    order = np.lexsort((y_values[rows], bucket))
+    bucket = bucket[order]
+    edges = bucket[1:] != bucket[:-1]
+    first = np.concatenate([[True], edges])
+    last = np.concatenate([edges, [True]])
+    keep = rows[order[first | last]]
+    keep = keep[np.argsort(x_values[keep], kind='mergesort')]
+    return {key: np.asarray(value)[keep] for key, value in data.items()}
+
+
+class DecimatedView(object):
+    """Min/max-per-pixel view of two columns of the outputs"""
+
+    def __init__(self, inst_app, x, y, width=600, columns=()):
+        """
+        x and y are the plotted columns of the outputs, width the number of
+        buckets (usually the plot width in pixels). columns are the other
+        columns the glyphs need, e.g., 'color'.
+        """
+        self.inst_app = inst_app    # A reference to application class instance
+        self.x = x
+        self.y = y
+        self.width = width
+        self.columns = [x, y] + [key for key in columns if key not in (x, y)]
+        self.source = ColumnDataSource({key: [] for key in self.columns})
+        self.__range_scheduled__ = False
+        self.reset()
+
+    def reset(self):
+        """Forget all points, e.g., when a new run starts"""
+        self.zoomed = False         # True when the x-range is set by the user
+        self.start = None
+        self.end = None
+        self.__points__ = {key: np.array([]) for key in self.columns}
+        self.source.data = {key: [] for key in self.columns}
+
+    def __full_data__(self):
+        return self.inst_app.__store__.views(self.columns)
+
+    def __publish__(self):
+        self.source.data = dict(self.__points__)
+
+    def __recompute__(self):
+        """Recompute the buckets from the full data of the outputs"""
+        data = self.__full_data__()
+        if not self.zoomed:
+            x_values = np.asarray(data[self.x], dtype=float)
+            x_values = x_values[np.isfinite(x_values)]
+            if len(x_values) == 0:
+                return
+            self.start, self.end = x_values.min(), x_values.max()
+        self.__points__ = minmax_reduce(data, self.x, self.y, self.start,
+                                        self.end, self.width)
+        self.__publish__()
+
+    def update(self, new_data, evicted=None):
+        """
+        Merge new rows (a dictionary of columns) into the buckets. Called on
+        the Bokeh IO loop after the rows were streamed to the outputs.
+
+        evicted are the rows the outputs dropped to make room for them, if
+        any (see max_live_rows). The buckets are then recomputed from the rows
+        left, so the view never shows rows the outputs no longer hold; their
+        number is bounded by max_live_rows.
+        """
+        if evicted is not None:
+            self.__recompute__()
+            return
+        new_data = {key: np.asarray(new_data[key]) for key in self.columns}
+        x_values = np.asarray(new_data[self.x], dtype=float)
+        x_values = x_values[np.isfinite(x_values)]
+        if len(x_values) == 0:
+            return
+        x_min, x_max = x_values.min(), x_values.max()
+        if not self.zoomed and (self.start is None or x_min < self.start or
+                                x_max > self.end):
+            # The data outgrew the buckets: at least double their span on the
+            # side the data grow, so this happens only a few times per run
+            if self.start is None:
+                self.start, self.end = x_min, x_max
+            else:
+                span = self.end - self.start
+                if x_min < self.start:
+                    self.start = min(x_min, self.start - span)
+                if x_max > self.end:
+                    self.end = max(x_max, self.end + span)
+            data = self.__full_data__()
+        else:
+            data = {key: np.concatenate([self.__points__[key], new_data[key]])
+                    for key in self.columns}
+        self.__points__ = minmax_reduce(data, self.x, self.y, self.start,
+                                        self.end, self.width)
+        self.__publish__()
+
+    def attach(self, x_range):
+        """
+        Recompute the buckets whenever x_range (e.g., fig.x_range) changes
+        on zoom or pan.
+        """
+        x_range.on_change('start', lambda attr, old, new:
+                          self.__range_changed__(x_range))
+        x_range.on_change('end', lambda attr, old, new:
+                          self.__range_changed__(x_range))
+
+    def __range_changed__(self, x_range):
+        # start and end usually change together: recompute once
+        if self.__range_scheduled__ or self.inst_app.__doc__ is None:
+            return
+        self.__range_scheduled__ = True
+        self.inst_app.__doc__.add_next_tick_callback(
+                                lambda: self.set_range(x_range.start,
+                                                       x_range.end))
+
+    def set_range(self, start, end):
+        """
+        Show [start, end] along x. A range covering all the data switches
+        back to following the data.
+        """
+        self.__range_scheduled__ = False
+        if start is None or end is None or end <= start:
+            return
+        x_values = np.asarray(self.inst_app.__store__.views([self.x])[self.x],
+                              dtype=float)
+        x_values = x_values[np.isfinite(x_values)]
+        if len(x_values) and start <= x_values.min() and \
+                end >= x_values.max():
+            if not self.zoomed:
+                return      # The range follows the data: nothing to refine
+            self.zoomed = False
+        else:
+            self.zoomed = True
+            self.start, self.end = start, end
+        self.__recompute__()
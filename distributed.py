@@ -0,0 +1,427 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the distributed acquisition of AcquisitionAPP: worker
+processes, possibly on other hosts, acquire for one aggregator.
+
+The aggregator is the application with the UI. It owns the outputs, the
+plots, the broadcast and the persistence (save() and record_dir), but calls
+neither config(), acquire() nor exit(): set aggregator_address to the
+address it listens on for workers.
+
+    inst_app.aggregator_address = ('0.0.0.0', 5008)
+    inst_app.worker_authkey = b'a long random secret'
+    inst_app.worker_count = 3       # A run waits for 3 workers
+    inst_app.worker_column = 'Station'
+    inst_app.run()
+
+The workers are instances of the same application, each running the
+config(), acquire() and exit() lifecycle with its own instruments, without
+UI (see AcquisitionAPP.run_worker() and the --worker option of headless.py):
+
+    python headless.py example_apps:ErrRatevsVolt --worker aggregator:5008 \
+        --set "worker_authkey=b'a long random secret'"
+
+The Run, Pause, Stop and Exit buttons of the aggregator are sent to every
+worker. At Run, each worker gets the inputs and parameters of the
+aggregator, its rank (self.worker_index) and the number of workers of the
+run (self.worker_count). In 'sweep' mode the points of the grid, and in
+'adaptive' mode the curves, are shared out between the workers; in the
+other modes acquire() may use them to take its share of the inputs.
+
+The rows of a worker are sent every stream_interval seconds, or as soon as
+stream_max_rows rows are waiting. The aggregator merges the rows of all the
+workers into its outputs as they arrive, with the worker id in worker_column
+if set, and stops the run once every worker has stopped. Messages of the
+workers show up in the status bar of the aggregator.
+
+Messages are pickled over multiprocessing connections, authenticated with
+worker_authkey, so whoever knows it can run code on the aggregator and on
+the workers. It must be set, to the same secret on the aggregator and on
+its workers, unless the aggregator is on a loopback address; a connection
+beyond localhost without it is refused.
+"""
+
+
+from __future__ import print_function, division
+from multiprocessing.connection import Client, Listener
+from threading import Condition, Thread
+from stream_buffer import StreamBuffer
+import ipaddress
+import numpy as np
+import os
+import socket
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+# Key of the connections on loopback addresses when worker_authkey is None
+LOOPBACK_AUTHKEY = b'acquisition_app'
+
+
+def is_loopback(host):
+    """Return True if host resolves to a loopback address"""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (socket.error, ValueError):
+        return False
+
+
+def check_authkey(address, authkey):
+    """
+    Return the authkey of a connection at address (host, port): authkey
+    itself, or LOOPBACK_AUTHKEY if it is None and host is a loopback address.
+    Raise ValueError if it is None and host is not.
+    """
+    if authkey is not None:
+        return authkey
+    if is_loopback(address[0]):
+        return LOOPBACK_AUTHKEY
+    raise ValueError("Set worker_authkey to a secret shared by the "
+                     "aggregator and its workers: {} is not a loopback "
+                     "address".format(address[0]))
+
+
+class Aggregator(object):
+    """Accepts the workers of an application and merges their rows"""
+
+    def __init__(self, inst_app, address, authkey=None, poll_interval=0.05):
+        """
+        address is the (host, port) to listen on for workers; port 0 picks a
+        free port, see self.address. authkey may only be None on a loopback
+        address, see check_authkey().
+        """
+        self.inst_app = inst_app    # A reference to application class instance
+        self.poll_interval = poll_interval
+        # Many workers may connect at once, e.g., when they are started
+        self.__listener__ = Listener(tuple(address), backlog=64,
+                                     authkey=check_authkey(address, authkey))
+        self.address = self.__listener__.address
+        self.__lock__ = Condition()
+        self.__workers__ = {}       # Worker id: (connection, name)
+        self.__running__ = set()    # Ids of the workers of the current run
+        self.__inbox__ = queue.Queue()  # (worker id, message) from the workers
+        self.__next_id__ = 0
+        self.__run_id__ = 0         # Messages of earlier runs are ignored
+        self.__paused__ = False
+        self.__closed__ = False
+        thread = Thread(target=self.__accept__)
+        thread.daemon = True
+        thread.start()
+        # Forward the Pause button as soon as it is pressed
+        inst_app.__requests__.add_listener(self.__forward_pause__)
+
+    def __accept__(self):
+        """Accept the workers, one reader thread each"""
+        while not self.__closed__:
+            try:
+                conn = self.__listener__.accept()
+                kind, name = conn.recv()
+            except Exception:
+                continue    # Failed authentication, or closed
+            with self.__lock__:
+                worker_id = self.__next_id__
+                self.__next_id__ += 1
+                self.__workers__[worker_id] = (conn, name)
+                self.__lock__.notify_all()
+            self.inst_app.__message__ += "<p><font color='black'>{}</font><p>".format(
+                            "Worker {} connected: {}".format(worker_id, name))
+            thread = Thread(target=self.__read__, args=(worker_id, conn))
+            thread.daemon = True
+            thread.start()
+
+    def __read__(self, worker_id, conn):
+        """Put the messages of a worker in the inbox until it disconnects"""
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            self.__inbox__.put((worker_id, message))
+        with self.__lock__:
+            self.__workers__.pop(worker_id, None)
+        self.__inbox__.put((worker_id, ('lost',)))
+
+    def __send__(self, worker_ids, message):
+        """Send message to the workers, ignoring those disconnected"""
+        with self.__lock__:
+            conns = [self.__workers__[worker_id][0] for worker_id in worker_ids
+                     if worker_id in self.__workers__]
+        for conn in conns:
+            try:
+                conn.send(message)
+            except (OSError, ValueError):
+                pass    # Reported by its reader thread
+
+    def __forward_pause__(self):
+        paused = self.inst_app.__pause_request__
+        with self.__lock__:
+            if paused == self.__paused__:
+                return
+            self.__paused__ = paused
+            running = list(self.__running__)
+        self.__send__(running, ('pause', paused))
+
+    def stats(self):
+        """Return the numbers of connected and running workers"""
+        with self.__lock__:
+            return {'connected': len(self.__workers__),
+                    'running': len(self.__running__)}
+
+    def start(self, timeout=10):
+        """
+        Start a run on the workers connected, waiting up to timeout seconds
+        for worker_count of them. Return False if there is none.
+        """
+        inst_app = self.inst_app
+        with self.__lock__:
+            self.__lock__.wait_for(lambda: len(self.__workers__) >=
+                                   inst_app.worker_count, timeout)
+            worker_ids = sorted(self.__workers__)
+            self.__running__ = set(worker_ids)
+            self.__run_id__ += 1
+            self.__paused__ = inst_app.__pause_request__
+        if not worker_ids:
+            inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                            "No worker connected to {}:{}".format(
+                            *self.address))
+            return False
+        if len(worker_ids) < inst_app.worker_count:
+            inst_app.__message__ += "<p><font color='orange'>Warning: {}</font><p>".format(
+                            "Running with {} of {} workers".format(
+                            len(worker_ids), inst_app.worker_count))
+        inputs = dict(inst_app.inputs)
+        parameters = dict(inst_app.parameters)
+        for rank, worker_id in enumerate(worker_ids):
+            self.__send__([worker_id], ('run', self.__run_id__, rank,
+                                        len(worker_ids), inputs, parameters,
+                                        self.__paused__))
+        return True
+
+    def __collect__(self, timeout):
+        """
+        Handle the messages of the workers for up to timeout seconds. Return
+        the rows received, as a list of dictionaries of columns.
+        """
+        chunks = []
+        try:
+            items = [self.__inbox__.get(timeout=timeout)]
+        except queue.Empty:
+            return chunks
+        while True:
+            try:
+                items.append(self.__inbox__.get_nowait())
+            except queue.Empty:
+                break
+        column = self.inst_app.worker_column
+        for worker_id, message in items:
+            kind = message[0]
+            if kind in ('rows', 'stopped') and message[1] != self.__run_id__:
+                continue    # Late message of an earlier run
+            if kind == 'rows':
+                new_data = message[2]
+                if column is not None and new_data:
+                    n_rows = len(next(iter(new_data.values())))
+                    new_data[column] = np.full(n_rows, worker_id)
+                chunks.append(new_data)
+            elif kind == 'message':
+                severity, text = message[1:]
+                self.inst_app.__message__.add("Worker {}: {}".format(
+                                              worker_id, text), severity)
+            elif kind in ('stopped', 'lost'):
+                with self.__lock__:
+                    running = worker_id in self.__running__
+                    self.__running__.discard(worker_id)
+                if kind == 'lost':
+                    self.inst_app.__message__ += "<p><font color='{}'>{}</font><p>".format(
+                            'red' if running else 'black',
+                            "Worker {} disconnected".format(worker_id))
+        return chunks
+
+    def acquire(self):
+        """
+        Acquisition cycle of the aggregator. Return the rows the workers sent
+        since the last call as a dictionary of lists, or None on errors.
+        """
+        inst_app = self.inst_app
+        if inst_app.__just_started__:
+            if not self.start():
+                return
+            inst_app.__just_started__ = False
+        chunks = self.__collect__(self.poll_interval)
+        with self.__lock__:
+            if not self.__running__:
+                inst_app.__stop_request__ = True    # Every worker is done
+        if not chunks:
+            return {}
+        return StreamBuffer.merge(chunks)
+
+    def stop(self, timeout=10):
+        """
+        Stop the workers still running and hand their last rows over to the
+        pipeline. Called by the Stop state.
+        """
+        with self.__lock__:
+            running = list(self.__running__)
+        self.__send__(running, ('stop',))
+        deadline = time.time() + timeout
+        while True:
+            for new_data in self.__collect__(self.poll_interval):
+                self.inst_app.__pipeline__.put(new_data)
+            with self.__lock__:
+                if not self.__running__:
+                    return True
+            if time.time() > deadline:
+                self.inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                            "Workers {} did not stop".format(
+                            sorted(self.__running__)))
+                with self.__lock__:
+                    self.__running__.clear()
+                return False
+
+    def close(self):
+        """Make the workers exit and stop listening"""
+        self.__closed__ = True
+        with self.__lock__:
+            worker_ids = list(self.__workers__)
+        self.__send__(worker_ids, ('exit',))
+        self.__listener__.close()
+        with self.__lock__:
+            conns = [conn for conn, name in self.__workers__.values()]
+        for conn in conns:
+            conn.close()
+
+
+class WorkerLink(object):
+    """Connection of a worker to its aggregator"""
+
+    def __init__(self, inst_app, address, authkey=None, timeout=30):
+        """
+        Connect to the aggregator at address (host, port), retrying for up to
+        timeout seconds while it is not listening yet. authkey may only be
+        None on a loopback address, see check_authkey().
+        """
+        self.inst_app = inst_app    # A reference to application class instance
+        authkey = check_authkey(address, authkey)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.__conn__ = Client(tuple(address), authkey=authkey)
+                break
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.2)
+        self.name = "{}:{}".format(socket.gethostname(), os.getpid())
+        self.__conn__.send(('hello', self.name))
+        self.__cond__ = Condition()     # Held while rows are sent
+        self.__chunks__ = []            # Rows waiting to be sent
+        self.__n_pending__ = 0
+        self.__run_id__ = None          # Run of the aggregator going on
+        self.__message_time__ = 0       # Time of the last message sent
+        self.__message_version__ = None
+        self.__closed__ = False
+
+    def start(self):
+        """Start taking the commands of the aggregator, once prepared"""
+        for target in [self.__read__, self.__flush_loop__]:
+            thread = Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def __read__(self):
+        """Turn the commands of the aggregator into request flags"""
+        inst_app = self.inst_app
+        while True:
+            try:
+                message = self.__conn__.recv()
+            except (EOFError, OSError):
+                message = ('exit',)     # The aggregator is gone
+            kind = message[0]
+            if kind == 'run':
+                (self.__run_id__, inst_app.worker_index, inst_app.worker_count,
+                 inputs, parameters, paused) = message[1:]
+                for name, string in list(inputs.items()) + \
+                                    list(parameters.items()):
+                    inst_app.update_control(name, string)
+                inst_app.__pause_request__ = paused
+                inst_app.__stop_request__ = False
+                inst_app.__run_request__ = True
+            elif kind == 'pause':
+                inst_app.__pause_request__ = message[1]
+            elif kind == 'stop':
+                inst_app.__pause_request__ = False
+                if inst_app.__state_name__ in ("Run", "Pause"):
+                    inst_app.__stop_request__ = True
+                else:
+                    inst_app.__run_request__ = False
+                    self.stopped()      # Already done with the run
+            elif kind == 'exit':
+                self.__closed__ = True
+                inst_app.__pause_request__ = False
+                if inst_app.__state_name__ in ("Run", "Pause"):
+                    inst_app.__stop_request__ = True
+                inst_app.__exit_request__ = True
+                return
+
+    def send(self, new_data):
+        """
+        Sink of the stream buffer of the worker: queue the rows for the next
+        message to the aggregator.
+        """
+        n_rows = len(next(iter(new_data.values()))) if new_data else 0
+        with self.__cond__:
+            self.__chunks__.append(new_data)
+            self.__n_pending__ += n_rows
+            if self.__n_pending__ >= self.inst_app.stream_max_rows:
+                self.__cond__.notify()
+
+    def __flush_loop__(self):
+        while not self.__closed__:
+            with self.__cond__:
+                self.__cond__.wait_for(lambda: self.__n_pending__ >=
+                                       self.inst_app.stream_max_rows,
+                                       self.inst_app.stream_interval)
+            self.flush()
+
+    def flush(self):
+        """Send the waiting rows and the new messages to the aggregator"""
+        with self.__cond__:
+            chunks = self.__chunks__
+            self.__chunks__ = []
+            self.__n_pending__ = 0
+            try:
+                if chunks:
+                    self.__conn__.send(('rows', self.__run_id__,
+                                        StreamBuffer.merge(chunks)))
+                self.__send_messages__()
+            except (OSError, ValueError):
+                pass    # The aggregator is gone: the reader makes us exit
+
+    def __send_messages__(self):
+        log = self.inst_app.__message__
+        if log.version == self.__message_version__:
+            return
+        self.__message_version__ = log.version
+        for entry in log.entries():
+            if entry.time > self.__message_time__:
+                self.__conn__.send(('message', entry.severity, entry.text))
+                self.__message_time__ = entry.time
+
+    def stopped(self):
+        """Send the last rows of a run, then tell the aggregator it is done"""
+        self.flush()
+        with self.__cond__:
+            try:
+                self.__conn__.send(('stopped', self.__run_id__))
+            except (OSError, ValueError):
+                pass
+
+    def close(self):
+        self.__closed__ = True
+        self.flush()
+        self.__conn__.close()
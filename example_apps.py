@@ -8,11 +8,10 @@ This module creates two example Bokeh + Flask applications that run in parallel.
 
 
 from acquisition_app import AcquisitionAPP
+import sys
 import time
 import webbrowser
-import pandas as pd
 import numpy as np
-from bokeh.plotting import figure
 
 class RvsH(AcquisitionAPP):
     """
@@ -49,7 +48,7 @@ class RvsH(AcquisitionAPP):
 
     def save(self):
         print("Saving data")
-        tmp = self.outputs.to_df()
+        tmp = self.to_df()
         try:
             tmp.to_csv(self.parameters['Save path'])
         except:
@@ -63,6 +62,7 @@ class RvsH(AcquisitionAPP):
 
     def create_figs(self):
         # Create the figure
+        from bokeh.plotting import figure
         fig = figure(tools="pan, lasso_select, box_select, tap, wheel_zoom,"
                             " box_zoom, crosshair, hover, resize, reset",
                             plot_width=600, plot_height=400)
@@ -149,7 +149,7 @@ class ErrRatevsVolt(AcquisitionAPP):
 
     def save(self):
         print("Saving data")
-        tmp = self.outputs.to_df()
+        tmp = self.to_df()
         try:
             tmp.to_csv(self.parameters['Save path'])
         except:
@@ -196,13 +196,23 @@ if __name__ == '__main__':
     # Create two applications
     app_name = 'R_vs_H'
     app_name_list.append(app_name)
-    RvsH(app_name=app_name).run()
+    inst_RvsH = RvsH(app_name=app_name)
 
     app_name = 'ErrRate_vs_Volt'
     app_name_list.append(app_name)
-    ErrRatevsVolt(app_name=app_name).run()
+    inst_ErrRatevsVolt = ErrRatevsVolt(app_name=app_name)
 
     # Open each applications in new tabs in chrome
-    chrome_path = 'C:/Program Files (x86)/Google/Chrome/Application/chrome.exe %s'
-    for app_name in app_name_list:
-        webbrowser.get(chrome_path).open("http://localhost:5000/{}".format(app_name))
+    def open_tabs():
+        chrome_path = 'C:/Program Files (x86)/Google/Chrome/Application/chrome.exe %s'
+        for app_name in app_name_list:
+            webbrowser.get(chrome_path).open("http://localhost:5000/{}".format(app_name))
+
+    if '--host' in sys.argv:
+        # Serve both applications from this process; no 'bokeh serve' needed
+        from app_host import AppHost
+        AppHost([inst_RvsH, inst_ErrRatevsVolt]).start(callback=open_tabs)
+    else:
+        inst_RvsH.run()
+        inst_ErrRatevsVolt.run()
+        open_tabs()
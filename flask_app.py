@@ -8,12 +8,23 @@ Flask app drive module
 
 
 from flask import Flask, render_template
+import os
 from bokeh.embed import autoload_server
 from acquisition_app import AcquisitionAPP
 
 app = Flask(__name__)
+# Broadcast server of the applications, see broadcast.py
+app.config['BROADCAST_URL'] = os.environ.get('BROADCAST_URL',
+                                             'http://localhost:5007')
 
 @app.route('/<app_name>')
 def index(app_name):
     script = autoload_server(model=None, session_id = app_name)
     return render_template('index.html', bokeh_script=script)
+
+@app.route('/<app_name>/live')
+def live(app_name):
+    # Read-only viewer following the broadcast, without a Bokeh session
+    events_url = '{}/{}'.format(app.config['BROADCAST_URL'], app_name)
+    return render_template('viewer.html', app_name=app_name,
+                           events_url=events_url)
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module runs an application from the command line without UI, e.g., for
+unattended batch sweeps. No Bokeh server or session is needed.
+
+    python headless.py example_apps:ErrRatevsVolt \\
+        --input "Volt (V)=np.linspace(-1, 1, 21)" \\
+        --parameter "Pulse width (ns)=[1, 10]" \\
+        --record-dir runs --out ErrRatevsVolt.csv
+
+The application class is given as module:class. --input and --parameter
+override the pythonic strings of the application, --set any other attribute
+(its value is a Python literal, e.g., --set sweep_workers=4). The data of the
+run are recorded under --record-dir, if given, and written as CSV to --out.
+See AcquisitionAPP.run_headless().
+
+With --worker, the application acquires for an aggregator instead, until the
+aggregator exits (see distributed.py):
+
+    python headless.py example_apps:ErrRatevsVolt --worker aggregator:5008 \
+        --set "worker_authkey=b'a long random secret'"
+"""
+
+
+from __future__ import print_function
+import argparse
+import ast
+import importlib
+import sys
+import time
+
+
+def load_app_class(spec):
+    """Return the class named by spec, 'module:class'"""
+    module_name, _, class_name = spec.partition(':')
+    if not class_name:
+        raise ValueError("Application '{}' is not of the form "
+                         "module:class".format(spec))
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def parse_pairs(pairs):
+    """Turn a list of 'key=value' strings into a dictionary"""
+    result = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise ValueError("'{}' is not of the form key=value".format(pair))
+        result[key.strip()] = value.strip()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+                description="Run an acquisition application without UI")
+    parser.add_argument('app', help="Application class, as module:class")
+    parser.add_argument('--name', help="Application name (default: the "
+                                       "class name)")
+    parser.add_argument('-i', '--input', action='append', metavar='KEY=STRING',
+                        help="Override an input")
+    parser.add_argument('-p', '--parameter', action='append',
+                        metavar='KEY=STRING', help="Override a parameter")
+    parser.add_argument('--set', action='append', metavar='ATTR=LITERAL',
+                        help="Set an attribute of the application")
+    parser.add_argument('--record-dir', help="Record the run in a new "
+                                             "directory under this one")
+    parser.add_argument('--out', help="Write the data of the run as CSV")
+    parser.add_argument('--worker', metavar='HOST:PORT',
+                        help="Acquire for the aggregator at HOST:PORT")
+    args = parser.parse_args(argv)
+
+    t_start = time.time()
+    sys.path.insert(0, '')
+    try:
+        app_class = load_app_class(args.app)
+        inputs = parse_pairs(args.input)
+        parameters = parse_pairs(args.parameter)
+        attributes = {attr: ast.literal_eval(value)
+                      for attr, value in parse_pairs(args.set).items()}
+        if args.worker:
+            host, _, port = args.worker.rpartition(':')
+            aggregator_address = (host or 'localhost', int(port))
+    except (ValueError, SyntaxError, ImportError, AttributeError) as e:
+        parser.error(e)
+    inst_app = app_class(args.name or app_class.__name__)
+    unknown = (set(inputs) - set(inst_app.inputs)) | \
+              (set(parameters) - set(inst_app.parameters))
+    if unknown:
+        parser.error("Unknown inputs or parameters: {}".format(
+                     ", ".join(sorted(unknown))))
+    for attr, value in attributes.items():
+        setattr(inst_app, attr, value)
+    if args.record_dir:
+        inst_app.record_dir = args.record_dir
+    t_ready = time.time()
+
+    if args.worker:
+        inst_app.run_worker(aggregator_address)
+        return 0
+    data = inst_app.run_headless(inputs=inputs, parameters=parameters)
+    if args.out:
+        data.to_csv(args.out)
+
+    print("Started in {:.2f} s, acquired {} rows in {:.2f} s".format(
+          t_ready - t_start, len(data), time.time() - t_ready))
+    if inst_app.record_path is not None:
+        print("Recorded in {}".format(inst_app.record_path))
+    errors = [entry for entry in inst_app.__message__.entries()
+              if entry.severity == 'error']
+    for entry in errors:
+        print(entry.text, file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
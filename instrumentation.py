@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the per-stage instrumentation of an application.
+
+When self.instrumentation (or self.diagnostics_panel) is set, the framework
+times every stage a sample goes through and keeps a histogram per stage:
+
+lateness:       Delay of the acquire() calls past their deadline, with a
+                fixed sample period (see scheduler.py)
+acquire:        The acquire() call (acquire_point() rounds in 'sweep' mode)
+handover:       Handing the result to the pipeline, including backpressure
+normalize:      The processing stage normalizing the result of acquire()
+stream lag:     Delay between scheduling a flush of the stream buffer and the
+                flush running on the IO loop, beyond the flush interval
+update:         Writing a flush to the outputs and streaming it (IO loop)
+
+It also keeps the time spent in each state of the state machine and the
+number of rows per second acquired and streamed. The figures are read with
+AcquisitionAPP.diagnostics() or shown in the diagnostics panel next to the
+status bar. When the instrumentation is disabled, the framework only checks
+that it is None.
+"""
+
+
+from __future__ import print_function, division
+from bisect import bisect_left
+from collections import deque
+from threading import Lock
+import time
+
+
+class Histogram(object):
+    """Histogram of durations (s) with 4 logarithmic bins per decade"""
+
+    # Upper edges of the bins, from 1 us to 100 s
+    EDGES = [10 ** (exponent / 4) for exponent in range(-24, 9)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.EDGES) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.EDGES, value)] += 1
+        self.n += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Return the upper edge of the bin holding the q-th percentile"""
+        if self.n == 0:
+            return 0.0
+        rank = q / 100 * self.n
+        cumulated = 0
+        for idx, count in enumerate(self.counts):
+            cumulated += count
+            if cumulated >= rank and count:
+                return min(self.EDGES[idx], self.max) \
+                       if idx < len(self.EDGES) else self.max
+        return self.max
+
+    def summary(self):
+        return {'count': self.n,
+                'mean': self.total / self.n if self.n else 0.0,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'max': self.max,
+                'total': self.total}
+
+
+class Instrumentation(object):
+    """Stage timings, time per state and rates of an application"""
+
+    def __init__(self, window=5.0):
+        """window is the time span (s) the rates are averaged over"""
+        self.window = window
+        self.__lock__ = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock__:
+            self.stages = {}        # stage: Histogram
+            self.states = {}        # state name: time spent (s)
+            self.totals = {}        # counter: number of rows
+            self.__events__ = {}    # counter: deque of (time, number of rows)
+
+    def record(self, stage, duration):
+        """Add duration (s) to the histogram of stage"""
+        with self.__lock__:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.add(duration)
+
+    def record_state(self, state, duration):
+        """Add duration (s) to the time spent in state. StateMachine observer."""
+        name = type(state).__name__
+        with self.__lock__:
+            self.states[name] = self.states.get(name, 0.0) + duration
+
+    def count(self, counter, n_rows):
+        """Count n_rows rows, e.g., acquired or streamed"""
+        now = time.time()
+        with self.__lock__:
+            self.totals[counter] = self.totals.get(counter, 0) + n_rows
+            events = self.__events__.setdefault(counter, deque())
+            events.append((now, n_rows))
+            while events[0][0] < now - self.window:
+                events.popleft()
+
+    def rate(self, counter):
+        """Return the number of rows per second over the last window"""
+        now = time.time()
+        with self.__lock__:
+            events = self.__events__.get(counter, ())
+            return sum(n_rows for t, n_rows in events
+                       if t >= now - self.window) / self.window
+
+    def snapshot(self):
+        """Return all figures as a dictionary, durations in seconds"""
+        rates = {counter: self.rate(counter) for counter in list(self.totals)}
+        with self.__lock__:
+            return {'stages': {stage: histogram.summary()
+                               for stage, histogram in self.stages.items()},
+                    'states': dict(self.states),
+                    'rows': dict(self.totals),
+                    'rows per second': rates}
+
+    def to_html(self, snapshot=None):
+        """Render a snapshot for the diagnostics panel"""
+        snapshot = snapshot or self.snapshot()
+        lines = ["<table><tr><th>Stage</th><th>count</th><th>mean (ms)</th>"
+                 "<th>p99 (ms)</th><th>max (ms)</th></tr>"]
+        for stage, summary in sorted(snapshot['stages'].items()):
+            lines.append("<tr><td>{}</td><td>{}</td><td>{:.3f}</td>"
+                         "<td>{:.3f}</td><td>{:.3f}</td></tr>".format(
+                         stage, summary['count'], summary['mean'] * 1e3,
+                         summary['p99'] * 1e3, summary['max'] * 1e3))
+        lines.append("</table>")
+        lines.append("<p>Rows per second: {}</p>".format(", ".join(
+                     "{} {:.0f}".format(counter, rate) for counter, rate in
+                     sorted(snapshot['rows per second'].items()))))
+        lines.append("<p>Time per state (s): {}</p>".format(", ".join(
+                     "{} {:.1f}".format(name, seconds) for name, seconds in
+                     sorted(snapshot['states'].items()))))
+        return "".join(lines)
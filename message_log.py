@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the bounded log behind the messages of the status bar.
+
+The log keeps the latest N entries, each with a severity and a timestamp, in
+a ring. Every change increments the version of the log, so the status bar
+only re-renders and sends its text when the log (or the state) changed.
+
+AcquisitionAPP.__message__ returns the log, and the usual way of reporting an
+error keeps working:
+
+    self.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                        error_message)
+
+The HTML wrapper is parsed into an entry; its color gives the severity.
+"""
+
+
+from __future__ import print_function
+from collections import deque, namedtuple
+from threading import Lock
+import re
+import time
+
+
+Entry = namedtuple('Entry', ['time', 'severity', 'text'])
+
+# Font colors of the status bar messages and their severities
+SEVERITY_COLORS = {'error': 'red', 'warning': 'orange', 'info': 'black'}
+COLOR_SEVERITIES = {color: severity
+                    for severity, color in SEVERITY_COLORS.items()}
+
+LEGACY_MESSAGE = re.compile(r"^\s*<p>\s*<font color=['\"](\w+)['\"]>(.*)"
+                            r"</font>\s*<p>\s*$", re.DOTALL)
+
+
+class MessageLog(object):
+    """Bounded, thread-safe log of the status bar messages"""
+
+    def __init__(self, maxlen=100):
+        self.__entries__ = deque(maxlen=maxlen)
+        self.__lock__ = Lock()
+        self.version = 0        # Incremented on every change
+
+    def __len__(self):
+        return len(self.__entries__)
+
+    def add(self, text, severity='info'):
+        """Add an entry to the log, dropping the oldest one if it is full"""
+        with self.__lock__:
+            self.__entries__.append(Entry(time.time(), severity, text))
+            self.version += 1
+
+    def __iadd__(self, message):
+        """Add an HTML message formatted the legacy way, e.g., for errors"""
+        match = LEGACY_MESSAGE.match(message)
+        if match is None:
+            self.add(message)
+        else:
+            self.add(match.group(2),
+                     COLOR_SEVERITIES.get(match.group(1).lower(), 'info'))
+        return self
+
+    def clear(self):
+        with self.__lock__:
+            if self.__entries__:
+                self.__entries__.clear()
+                self.version += 1
+
+    def entries(self):
+        """Return a list of the entries, oldest first"""
+        with self.__lock__:
+            return list(self.__entries__)
+
+    def to_html(self):
+        """Render the log for the status bar"""
+        return "".join(
+            "<p><font color='{}'><small>{}</small> {}</font></p>".format(
+                SEVERITY_COLORS.get(entry.severity, 'black'),
+                time.strftime("%H:%M:%S", time.localtime(entry.time)),
+                entry.text)
+            for entry in self.entries())
+
+    def __str__(self):
+        return self.to_html()
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the in-memory store holding the data of a run on the
+server.
+
+Every column of the outputs is a preallocated NumPy buffer. Appending rows
+writes them into the buffers, so it costs O(number of new rows) and does not
+allocate; starting a new run only resets the row count. The data are read
+back through views of the buffers (see views()), which do not copy anything,
+e.g., by to_df() and the decimated views. The ColumnDataSource of the outputs
+is not one of those views: it keeps its own copy of the rows as lists, which
+Bokeh extends in place on each stream() patch.
+
+With a rollover, the store keeps only the latest rows and the buffers are
+rings. Each ring is mirrored: a row is written at position i and i + capacity
+of a buffer twice as long, so the latest rows are always contiguous in memory
+and a view of them is still free. Without a rollover, a full buffer doubles
+its capacity, i.e., it is reallocated only a few times per run.
+"""
+
+
+from __future__ import print_function, division
+import numpy as np
+
+
+class OutputStore(object):
+    """Preallocated columnar store of the outputs"""
+
+    def __init__(self, columns, dtypes=None, capacity=100000, rollover=None):
+        """
+        columns are the column names, usually the keys of empty_data. dtypes
+        is a dictionary of the dtypes of some columns; the dtype of the other
+        columns is taken from the first rows appended.
+
+        capacity is the number of rows the buffers are preallocated for. If
+        rollover is given, only the latest rollover rows are kept and the
+        capacity is rollover.
+        """
+        self.columns = list(columns)
+        self.dtypes = dict(dtypes or {})
+        self.rollover = rollover
+        self.capacity = rollover if rollover is not None else capacity
+        self.__buffers__ = {}       # column: buffer, allocated on first use
+        self.__n_total__ = 0        # Number of rows appended in the run
+        for key in self.columns:
+            if key in self.dtypes:
+                self.__allocate__(key, np.dtype(self.dtypes[key]))
+
+    def __len__(self):
+        """Number of rows held"""
+        return min(self.__n_total__, self.capacity)
+
+    @property
+    def n_total(self):
+        """Number of rows appended since the last reset, including evicted"""
+        return self.__n_total__
+
+    def __allocate__(self, key, dtype):
+        length = 2 * self.capacity if self.rollover is not None else \
+                 self.capacity
+        self.__buffers__[key] = np.empty(length, dtype=dtype)
+
+    @staticmethod
+    def __storage_dtype__(values):
+        # Strings go into object buffers, so longer strings are not truncated
+        if values.dtype.kind in 'USO':
+            return np.dtype(object)
+        return values.dtype
+
+    def __check_dtype__(self, key, values):
+        """Allocate the buffer of key, or promote its dtype, to hold values"""
+        buffer = self.__buffers__.get(key)
+        dtype = self.__storage_dtype__(values)
+        if buffer is None:
+            self.__allocate__(key, dtype)
+        elif not np.can_cast(dtype, buffer.dtype, 'same_kind'):
+            # E.g., floats in a column whose first rows were integers. This
+            # happens at most a few times per column
+            new_buffer = np.empty(len(buffer),
+                                  dtype=np.promote_types(buffer.dtype, dtype))
+            new_buffer[:] = buffer
+            self.__buffers__[key] = new_buffer
+
+    def __grow__(self, n_rows):
+        """Double the capacity until n_rows rows fit. No rollover only."""
+        capacity = self.capacity
+        while capacity < n_rows:
+            capacity *= 2
+        for key, buffer in self.__buffers__.items():
+            new_buffer = np.empty(capacity, dtype=buffer.dtype)
+            new_buffer[:self.__n_total__] = buffer[:self.__n_total__]
+            self.__buffers__[key] = new_buffer
+        self.capacity = capacity
+
+    def reset(self):
+        """Forget all rows, keeping the buffers, e.g., when a new run starts"""
+        self.__n_total__ = 0
+
+    def append(self, data):
+        """
+        Append a dictionary of equal-length columns holding every column of
+        the store. Return the rows falling out of the store because of the
+        rollover, as a dictionary of columns, or None if there are none.
+        """
+        if set(data) != set(self.columns):
+            raise ValueError("The columns {} do not match the columns {} of "
+                             "the outputs".format(sorted(data),
+                                                  sorted(self.columns)))
+        data = {key: np.asarray(value) for key, value in data.items()}
+        n_new = len(data[self.columns[0]]) if self.columns else 0
+        if n_new == 0:
+            return
+        for key, values in data.items():
+            self.__check_dtype__(key, values)
+
+        if self.rollover is None:
+            if self.__n_total__ + n_new > self.capacity:
+                self.__grow__(self.__n_total__ + n_new)
+            start = self.__n_total__
+            for key, values in data.items():
+                self.__buffers__[key][start:start + n_new] = values
+            self.__n_total__ += n_new
+            return
+
+        # Ring: copy the rows about to be overwritten first
+        n_drop = len(self) + n_new - self.capacity
+        evicted = None
+        if n_drop > 0:
+            n_drop_live = min(n_drop, len(self))
+            live = self.views()
+            evicted = {key: np.concatenate([live[key][:n_drop_live],
+                                            data[key][:n_drop - n_drop_live]])
+                       for key in self.columns}
+        if n_new > self.capacity:
+            # Only the latest capacity rows of data are kept
+            skip = n_new - self.capacity
+            data = {key: values[skip:] for key, values in data.items()}
+            self.__n_total__ += skip
+            n_new = self.capacity
+        for key, values in data.items():
+            buffer = self.__buffers__[key]
+            position = self.__n_total__ % self.capacity
+            n_first = min(n_new, self.capacity - position)
+            # Each row goes to position i and to its mirror i + capacity
+            for offset in (position, position + self.capacity):
+                buffer[offset:offset + n_first] = values[:n_first]
+            rest = values[n_first:]
+            buffer[:len(rest)] = rest
+            buffer[self.capacity:self.capacity + len(rest)] = rest
+        self.__n_total__ += n_new
+        return evicted
+
+    def views(self, columns=None):
+        """
+        Return the rows held as a dictionary of read-only views of the
+        buffers, oldest row first. Nothing is copied, so the views are only
+        valid until the next append() or reset().
+        """
+        n_rows = len(self)
+        if self.rollover is None:
+            start = 0
+        else:
+            start = (self.__n_total__ - n_rows) % self.capacity
+        data = {}
+        for key in columns if columns is not None else self.columns:
+            buffer = self.__buffers__.get(key)
+            if buffer is None:
+                data[key] = np.array([])    # Dtype not known yet
+                continue
+            view = buffer[start:start + n_rows]
+            view.flags.writeable = False
+            data[key] = view
+        return data
+
+    def to_df(self):
+        """Return the rows held as a pandas DataFrame"""
+        import pandas as pd
+        return pd.DataFrame(self.views(), columns=self.columns)
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the cache used by AcquisitionAPP.parse() to evaluate the
+pythonic strings of the inputs and parameters.
+
+Every string is compiled once and its code object is kept. Strings that are
+side-effect-free expressions, e.g., 'np.linspace(0, 1, 100)' or '[1, 10, 100]',
+are also evaluated only once and their result is kept. The cache is keyed on
+the text of the string, so an edited control simply maps to a new entry; the
+entry of the old text is dropped by invalidate().
+
+The cache is shared by the UI thread, which checks the strings of edited
+controls, and the state machine thread, which evaluates them: its entries
+are only accessed with its lock held.
+"""
+
+
+from __future__ import print_function
+from collections import OrderedDict
+from threading import Lock
+import ast
+import copy
+import numpy as np
+
+
+# Built-in functions without side effects that may appear in cached strings
+PURE_BUILTINS = set(['abs', 'all', 'any', 'bool', 'complex', 'dict', 'divmod',
+                     'enumerate', 'float', 'frozenset', 'int', 'len', 'list',
+                     'max', 'min', 'pow', 'range', 'reversed', 'round', 'set',
+                     'sorted', 'str', 'sum', 'tuple', 'zip', 'True', 'False',
+                     'None'])
+
+# Modules whose functions are side-effect-free, except for the names below
+PURE_MODULES = set(['np', 'numpy', 'math'])
+IMPURE_ATTRIBUTES = set(['random', 'load', 'loadtxt', 'genfromtxt', 'fromfile',
+                         'memmap', 'save', 'savez', 'savez_compressed',
+                         'savetxt', 'tofile', 'seterr', 'set_printoptions'])
+
+# AST nodes allowed in a side-effect-free expression
+PURE_NODES = (ast.Expression, ast.Constant, ast.List, ast.Tuple, ast.Set,
+              ast.Dict, ast.UnaryOp, ast.BinOp, ast.BoolOp, ast.Compare,
+              ast.IfExp, ast.Call, ast.keyword, ast.Name, ast.Attribute,
+              ast.Subscript, ast.Slice, ast.Starred, ast.ListComp,
+              ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.comprehension,
+              ast.Load, ast.Store, ast.operator, ast.unaryop, ast.boolop,
+              ast.cmpop)
+
+
+def is_pure(string):
+    """
+    Return True if string is an expression without side effects, i.e., its
+    value can be computed once and reused.
+    """
+    try:
+        tree = ast.parse(string.strip(), mode='eval')
+    except SyntaxError:
+        return False
+    # Names bound by comprehensions are allowed in the expression
+    local_names = set(node.id for node in ast.walk(tree)
+                      if isinstance(node, ast.Name) and
+                      isinstance(node.ctx, ast.Store))
+    for node in ast.walk(tree):
+        if not isinstance(node, PURE_NODES):
+            return False
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            if node.id not in PURE_BUILTINS | PURE_MODULES | local_names:
+                return False
+        if isinstance(node, ast.Attribute):
+            if node.attr in IMPURE_ATTRIBUTES or node.attr.startswith('_'):
+                return False
+    return True
+
+
+class ParseCache(object):
+    """LRU cache of compiled and evaluated pythonic strings"""
+
+    def __init__(self, namespace, maxsize=256):
+        """
+        namespace is the dictionary of globals the strings are evaluated in.
+        """
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.__entries__ = OrderedDict()    # string: [code, pure, result]
+        self.__lock__ = Lock()
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def __entry__(self, string):
+        with self.__lock__:
+            entry = self.__entries__.get(string)
+            if entry is not None:
+                self.__entries__.move_to_end(string)
+                return entry
+        # exec is more versatile than eval. It accepts multi-line pythonic
+        # strings but has no return
+        code = compile("rlt = " + string, '<pythonic string>', 'exec')
+        pure = is_pure(string)
+        with self.__lock__:
+            # Another thread may have added it meanwhile
+            entry = self.__entries__.setdefault(string, [code, pure, None])
+            while len(self.__entries__) > self.maxsize:
+                self.__entries__.popitem(last=False)
+        return entry
+
+    def compile(self, string):
+        """
+        Compile string and keep its code object. Raise SyntaxError if string
+        is not valid Python.
+        """
+        return self.__entry__(string)[0]
+
+    def evaluate(self, string, local_vars=None):
+        """
+        Return the value of string. Raise the exception raised by the string,
+        if any.
+
+        The value of a side-effect-free string is computed only once. NumPy
+        arrays, lists, sets and dictionaries are then returned as copies, so
+        the caller may modify them without changing the cached value.
+        """
+        entry = self.__entry__(string)
+        code, pure, result = entry
+        if pure and result is not None:
+            self.n_hits += 1
+            return self.__copy_value__(result[0])
+        self.n_misses += 1
+        ldict = dict(local_vars) if local_vars else {}
+        exec(code, self.namespace, ldict)
+        value = ldict['rlt']
+        if pure:
+            entry[2] = (value,)
+            return self.__copy_value__(value)
+        return value
+
+    @staticmethod
+    def __copy_value__(value):
+        if isinstance(value, np.ndarray):
+            return value.copy()
+        if isinstance(value, (list, set, dict)):
+            return copy.copy(value)
+        return value
+
+    def invalidate(self, string):
+        """Drop the entry of string, e.g., after its control was edited"""
+        with self.__lock__:
+            self.__entries__.pop(string, None)
+
+    def clear(self):
+        with self.__lock__:
+            self.__entries__.clear()
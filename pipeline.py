@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the staged pipeline between acquire() and the outputs.
+
+The thread calling acquire() only pushes the raw results into a bounded queue
+and goes back to the instrument. Separate stages take it from there:
+
+    acquisition --> [raw] --> processing --+--> [recorder] --> persistence
+                                           +--> [plot] --> plotting
+
+processing:     Normalizes and validates the results of acquire()
+persistence:    The writer thread of the Recorder, if the run is recorded
+plotting:       Hands the rows to the stream buffer of the outputs
+
+Every queue is a bounded ring with its own backpressure policy for when it is
+full: 'block' waits for room (lossless), 'drop-oldest' discards the oldest
+item, 'drop-newest' discards the new item. Dropped items are counted and
+reported in the status bar. An exception raised while a stage handles an
+item is reported in the status bar too and stops the run, while the stage
+keeps handling the later items, so Stop can still drain the pipeline.
+"""
+
+
+from __future__ import print_function
+from collections import deque
+from threading import Condition, Thread
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+
+class BoundedQueue(object):
+    """Bounded ring queue with a backpressure policy"""
+
+    def __init__(self, maxsize=10000, policy='block'):
+        if policy not in POLICIES:
+            raise ValueError("Unknown backpressure policy '{}'".format(policy))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.n_dropped = 0
+        self.__items__ = deque()
+        self.__n_unfinished__ = 0   # Items put but not marked done yet
+        self.__cond__ = Condition()
+
+    def __len__(self):
+        return len(self.__items__)
+
+    def put(self, item, force=False):
+        """
+        Add item to the queue, applying the policy if it is full. With
+        force=True, item is added regardless (used for control items).
+        """
+        with self.__cond__:
+            if len(self.__items__) >= self.maxsize and not force:
+                if self.policy == 'drop-newest':
+                    self.n_dropped += 1
+                    return
+                elif self.policy == 'drop-oldest':
+                    self.__items__.popleft()
+                    self.__n_unfinished__ -= 1
+                    self.n_dropped += 1
+                else:
+                    self.__cond__.wait_for(
+                            lambda: len(self.__items__) < self.maxsize)
+            self.__items__.append(item)
+            self.__n_unfinished__ += 1
+            self.__cond__.notify_all()
+
+    def get(self, timeout=None):
+        """
+        Remove and return the oldest item. Raise queue.Empty if there is none
+        within timeout seconds.
+        """
+        with self.__cond__:
+            if not self.__cond__.wait_for(lambda: self.__items__, timeout):
+                raise queue.Empty
+            item = self.__items__.popleft()
+            self.__cond__.notify_all()
+            return item
+
+    def task_done(self):
+        """Mark an item returned by get() as processed"""
+        with self.__cond__:
+            self.__n_unfinished__ -= 1
+            self.__cond__.notify_all()
+
+    def join(self, timeout=None):
+        """
+        Block until every item put has been processed. Return False on
+        timeout.
+        """
+        with self.__cond__:
+            return self.__cond__.wait_for(
+                            lambda: self.__n_unfinished__ <= 0, timeout)
+
+
+class Stage(object):
+    """Thread applying func to every item of a queue"""
+
+    def __init__(self, inst_app, name, func, in_queue):
+        self.inst_app = inst_app    # A reference to application class instance
+        self.name = name
+        self.func = func
+        self.queue = in_queue
+        self.__thread__ = Thread(target=self.__loop__, name=name)
+        self.__thread__.daemon = True
+        self.__thread__.start()
+
+    def __loop__(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return      # Stop request, see Pipeline.close()
+                self.func(item)
+            except Exception as e:
+                # Keep the thread alive: Stop waits for the queue to be empty
+                self.inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                                "The {} stage failed: {!r}".format(self.name, e))
+                self.inst_app.__stop_request__ = True   # Escape Run state
+            finally:
+                self.queue.task_done()
+
+
+class Pipeline(object):
+    """Processing and plotting stages of an application"""
+
+    def __init__(self, inst_app, normalize, size=10000, policies=None):
+        """
+        normalize(inst_app, raw) returns the normalized dictionary of columns
+        of a raw acquire() result, or None if it is not valid.
+
+        size is the capacity of each queue and policies a dictionary of the
+        backpressure policies of the 'raw' and 'plot' queues.
+        """
+        policies = policies or {}
+        self.inst_app = inst_app    # A reference to application class instance
+        self.normalize = normalize
+        self.raw = BoundedQueue(size, policies.get('raw', 'block'))
+        self.plot = BoundedQueue(size, policies.get('plot', 'block'))
+        self.stages = [Stage(inst_app, 'processing', self.__process__,
+                             self.raw),
+                       Stage(inst_app, 'plotting', self.__plot__, self.plot)]
+
+    def put(self, raw):
+        """Hand a raw acquire() result over. Called by the acquisition stage."""
+        self.raw.put(raw)
+
+    def __process__(self, raw):
+        metrics = self.inst_app.__metrics__
+        if metrics is None:
+            new_data = self.normalize(self.inst_app, raw)
+        else:
+            t_start = time.perf_counter()
+            new_data = self.normalize(self.inst_app, raw)
+            metrics.record('normalize', time.perf_counter() - t_start)
+            if new_data:
+                metrics.count('acquired', len(next(iter(new_data.values()))))
+        if new_data is None:
+            return
+        if self.inst_app.__recorder__ is not None:
+            self.inst_app.__recorder__.put(new_data)
+            if self.inst_app.headless:
+                return      # Nothing to plot, and the recording has it all
+        self.plot.put(new_data)
+
+    def __plot__(self, new_data):
+        self.inst_app.__stream_buffer__.append(new_data)
+
+    def drain(self, timeout=None):
+        """
+        Block until every result handed over so far reached the stream buffer
+        and the recorder queue. Return False on timeout.
+        """
+        return self.raw.join(timeout) and self.plot.join(timeout)
+
+    def n_dropped(self):
+        """Return the number of dropped items per queue"""
+        dropped = {'processing': self.raw.n_dropped,
+                   'plotting': self.plot.n_dropped}
+        recorder = self.inst_app.__recorder__
+        if recorder is not None:
+            dropped['persistence'] = recorder.n_dropped
+        return dropped
+
+    def reset_counters(self):
+        self.raw.n_dropped = 0
+        self.plot.n_dropped = 0
+
+    def close(self):
+        """Stop the stage threads once the queues are empty"""
+        for stage in self.stages:
+            stage.queue.put(None, force=True)
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the recorder persisting the acquired data during the Run
+state.
+
+The processing stage of the pipeline (pipeline.py) hands the normalized
+dictionaries of columns to the recorder. A background writer thread gathers
+them into chunks and appends each chunk to a ChunkStore on disk, so the data
+of a run is persisted incrementally instead of being serialized at once in save().
+Finalizing a recording only writes the last partial chunk.
+"""
+
+
+from __future__ import print_function, division
+from threading import Thread
+from data_store import ChunkStore
+from stream_buffer import StreamBuffer
+from pipeline import BoundedQueue
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class Recorder(object):
+    """Chunked background writer of the acquired data"""
+
+    __finalize__ = object()     # Queue item requesting the final chunk
+
+    def __init__(self, path, chunk_rows=10000, flush_interval=1.0,
+                 queue_size=10000, policy='block'):
+        """
+        path is the directory of the recording. A chunk is written once
+        chunk_rows rows are waiting, or flush_interval seconds after its first
+        row arrived, whichever comes first.
+
+        queue_size and policy define the bounded queue in front of the writer
+        thread and what happens when it is full (see pipeline.py).
+        """
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.store = ChunkStore(path)
+        self.error = None           # Exception raised by the writer thread
+        self.__queue__ = BoundedQueue(queue_size, policy)
+        self.__thread__ = Thread(target=self.__write_loop__)
+        self.__thread__.daemon = True
+        self.__thread__.start()
+
+    def put(self, new_data):
+        """Queue a normalized dictionary of columns for writing"""
+        self.__queue__.put(new_data)
+
+    @property
+    def n_dropped(self):
+        """Number of dictionaries dropped because the queue was full"""
+        return self.__queue__.n_dropped
+
+    def finalize(self, timeout=None):
+        """
+        Write the remaining rows and stop the writer thread. Blocks until the
+        data are on disk.
+
+        Return False if the writer did not finish within timeout seconds.
+        """
+        self.__queue__.put(self.__finalize__, force=True)
+        self.__thread__.join(timeout)
+        return not self.__thread__.is_alive()
+
+    def __write_loop__(self):
+        chunks = []
+        n_rows = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(
+                                        deadline - time.time(), 0)
+            try:
+                item = self.__queue__.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is self.__finalize__:
+                self.__write__(chunks)
+                return
+            if item:
+                if not chunks:
+                    deadline = time.time() + self.flush_interval
+                chunks.append(item)
+                n_rows += len(next(iter(item.values())))
+            if chunks and (n_rows >= self.chunk_rows or
+                           time.time() >= deadline):
+                self.__write__(chunks)
+                chunks = []
+                n_rows = 0
+                deadline = None
+
+    def __write__(self, chunks):
+        if not chunks or self.error is not None:
+            return
+        try:
+            self.store.append(StreamBuffer.merge(chunks))
+        except Exception as e:
+            self.error = e
@@ -0,0 +1,221 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the replay of a recorded run through the outputs of an
+application.
+
+With self.replay_path set to a recording (see recorder.py), the Run state
+reads the rows of the recording instead of calling acquire(), and streams
+them to the same outputs and figures at self.replay_speed times the speed
+they were acquired at. With replay_speed = None the whole recording is
+shown at once, decimated to fit the outputs.
+
+A recording is a ChunkStore of memory-mapped chunks: opening it only reads
+its index, and only the chunks being replayed are paged in, so multi-GB
+recordings open instantly. The time of a row is found by a binary search
+over the chunks, then within one chunk, so seeking to any point in time
+does not depend on the size of the recording.
+
+Time is taken from a column of the recording (replay_time_column, e.g., a
+time stamp returned by acquire()), or else from the time each chunk was
+written, interpolated linearly within the chunk.
+"""
+
+
+from __future__ import print_function, division
+import os
+import time
+from data_store import ChunkStore
+import numpy as np
+
+
+def minmax_rows(data, step):
+    """
+    Decimate the dictionary of columns data: for every step consecutive rows,
+    keep the rows holding the minimum and the maximum of each numeric column.
+    The order of the rows is kept.
+    """
+    n_rows = len(next(iter(data.values())))
+    if step <= 1 or n_rows <= 2:
+        return data
+    n_buckets = -(-n_rows // step)
+    keep = [np.arange(n_buckets) * step]        # First row of each bucket
+    for value in data.values():
+        if value.dtype.kind not in 'iuf':
+            continue
+        padded = np.empty(n_buckets * step, dtype=float)
+        padded[:n_rows] = value
+        padded[n_rows:] = np.nan
+        padded = padded.reshape(n_buckets, step)
+        with np.errstate(invalid='ignore'):
+            filled = np.where(np.isnan(padded), np.inf, padded)
+            keep.append(np.argmin(filled, axis=1) + keep[0])
+            filled = np.where(np.isnan(padded), -np.inf, padded)
+            keep.append(np.argmax(filled, axis=1) + keep[0])
+    keep = np.unique(np.concatenate(keep))
+    keep = keep[keep < n_rows]
+    return {key: value[keep] for key, value in data.items()}
+
+
+class Replayer(object):
+    """Paced reader of a recorded run"""
+
+    def __init__(self, path, speed=1.0, time_column=None, block_rows=10000,
+                 max_rows=100000, max_wait=0.05):
+        """
+        path is the directory of the recording. speed is the replay speed
+        relative to the acquisition, None to show everything at once.
+        time_column is the column holding the time (s) of each row, None to
+        use the times the chunks were written. Every call to acquire()
+        returns at most block_rows rows. max_rows is the number of rows the
+        outputs can show: rows before the starting point are shown up to
+        that many, and a replay at once is decimated to at most that many.
+        acquire() waits at most max_wait seconds for a row to be due.
+        """
+        if not os.path.isfile(os.path.join(path, 'index.txt')):
+            raise ValueError("'{}' is not a recording".format(path))
+        self.store = ChunkStore(path)   # Only the index is read
+        if len(self.store) == 0:
+            raise ValueError("Recording '{}' is empty".format(path))
+        if time_column is not None and time_column not in self.store.columns:
+            raise ValueError("Recording '{}' has no column '{}'".format(
+                             path, time_column))
+        self.speed = speed
+        self.time_column = time_column
+        self.block_rows = block_rows
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.offsets = self.store.offsets
+        self.__knots__ = self.__time_knots__()
+        self.duration = self.__knots__[-1]
+        self.start_time = 0.0           # Time the next replay starts at
+        self.position = 0               # Next row to replay
+        self.__clock__ = None           # (perf_counter, replay time) at start
+        self.__last_call__ = None
+        self.__history__ = False        # Rows before start_time not shown yet
+
+    def __time_knots__(self):
+        """
+        Return the time (s, from the first row) each chunk starts at, followed
+        by the time of the last row.
+        """
+        store = self.store
+        if self.time_column is not None:
+            times = [store.read_chunk(i, [self.time_column])[self.time_column]
+                     for i in range(store.n_chunks)]
+            knots = np.array([chunk[0] for chunk in times] + [times[-1][-1]],
+                             dtype=float)
+        else:
+            # A chunk is written once its last row has been acquired. The
+            # rows of the first chunk are assumed to come at the rate of the
+            # second one
+            ends = np.asarray(store.chunk_times, dtype=float)
+            rows = np.asarray(store.chunk_rows, dtype=float)
+            if len(ends) > 1:
+                rate = rows[1] / max(ends[1] - ends[0], 1e-9)
+                first = ends[0] - rows[0] / rate
+            else:
+                first = ends[0]
+            knots = np.concatenate([[first], ends])
+        knots = knots - knots[0]
+        return np.maximum.accumulate(knots)     # Guard against clock jumps
+
+    def time_of(self, row):
+        """Return the time (s, from the first row) of row"""
+        row = min(max(row, 0), self.offsets[-1] - 1)
+        if self.time_column is None:
+            return float(np.interp(row, self.offsets, self.__knots__))
+        chunk_idx = self.store.chunk_of(row)
+        times = self.store.read_chunk(chunk_idx,
+                                      [self.time_column])[self.time_column]
+        return float(times[row - self.offsets[chunk_idx]] - times[0] +
+                     self.__knots__[chunk_idx])
+
+    def row_at(self, t):
+        """Return the number of rows acquired up to time t (s)"""
+        if t < 0:
+            return 0
+        if t >= self.duration:
+            return int(self.offsets[-1])
+        chunk_idx = int(np.searchsorted(self.__knots__[:-1], t,
+                                        side='right')) - 1
+        start, stop = self.offsets[chunk_idx], self.offsets[chunk_idx + 1]
+        if self.time_column is None:
+            t_start = self.__knots__[chunk_idx]
+            t_stop = self.__knots__[chunk_idx + 1]
+            if t_stop <= t_start:
+                return int(stop)
+            return int(min(start + np.floor((t - t_start) /
+                                  (t_stop - t_start) * (stop - start)) + 1,
+                           stop))
+        # Binary search within the memory-mapped chunk
+        times = self.store.read_chunk(chunk_idx,
+                                      [self.time_column])[self.time_column]
+        offset = self.__knots__[chunk_idx] - times[0]
+        return int(start + np.searchsorted(times, t - offset, side='right'))
+
+    def seek(self, t):
+        """Start the next replay at time t (s, from the first row)"""
+        self.start_time = min(max(float(t), 0.0), self.duration)
+
+    def start(self):
+        """
+        Rewind to start_time, e.g., when a run starts. A replay at once always
+        starts from the first row.
+        """
+        self.position = 0
+        if self.speed is not None and self.start_time:
+            self.position = self.row_at(self.start_time)
+        self.__clock__ = None
+        self.__last_call__ = None
+        self.__history__ = self.position > 0
+
+    def __elapsed__(self):
+        """Replay time (s) reached now. Pauses are not replayed."""
+        now = time.perf_counter()
+        if self.__clock__ is None:
+            self.__clock__ = (now, self.time_of(self.position))
+        elif now - self.__last_call__ > 10 * self.max_wait:
+            # The replay was paused or held back: resume where it stopped
+            t_wall, t_replay = self.__clock__
+            self.__clock__ = (t_wall + (now - self.__last_call__) -
+                              self.max_wait, t_replay)
+        self.__last_call__ = now
+        t_wall, t_replay = self.__clock__
+        return t_replay + (now - t_wall) * self.speed
+
+    def acquire(self):
+        """
+        Return the next rows of the replay as a dictionary of arrays, an
+        empty dictionary if no row is due yet, or None at the end of the
+        recording.
+        """
+        n_rows = int(self.offsets[-1])
+        if self.position >= n_rows:
+            return None
+        if self.speed is None:
+            # Everything at once, decimated to at most max_rows rows
+            rows_per_step = 2 * len(self.store.columns) + 1
+            step = -(-n_rows * rows_per_step // self.max_rows)
+            chunk_idx = self.store.chunk_of(self.position)
+            self.position = int(self.offsets[chunk_idx + 1])
+            return minmax_rows(self.store.read_chunk(chunk_idx), step)
+        if self.__history__:
+            # What was acquired before the starting point, at once
+            self.__history__ = False
+            return self.store.read(max(self.position - self.max_rows, 0),
+                                   self.position)
+        due = self.row_at(self.__elapsed__())
+        if due <= self.position:
+            # Wait for the next row, briefly so Pause and Stop stay responsive
+            wait = (self.time_of(self.position) - self.__elapsed__()) / \
+                   self.speed
+            time.sleep(min(max(wait, 0.0), self.max_wait))
+            due = self.row_at(self.__elapsed__())
+            if due <= self.position:
+                return {}
+        stop = min(due, self.position + self.block_rows)
+        data = self.store.read(self.position, stop)
+        self.position = stop
+        return data
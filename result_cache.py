@@ -0,0 +1,173 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the result cache of the points of a sweep.
+
+Applications wrapping a deterministic simulation recompute every point of a
+sweep on every run, even when only one parameter changed. With
+self.cache_results set, the results of acquire_point() ('sweep' and
+'adaptive' acquisition modes) are cached, keyed on the application, the
+point and the parsed parameters: '1e-3' and '0.001' are the same parameter.
+Cached points are streamed to the outputs right away; only the missing ones
+are computed.
+
+The cache has two tiers, each with a size limit in bytes and evicting the
+least recently used results first:
+
+memory:     A dictionary of the pickled results
+disk:       One file per result under self.cache_dir, kept across runs and
+            program restarts (None: no disk tier)
+
+Bump self.cache_version when the code computing the points changes, so the
+results of the old code are not used.
+"""
+
+
+from __future__ import print_function, division
+from collections import OrderedDict
+from threading import Lock
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+
+
+def canonical(value):
+    """Return value as JSON-serializable data, equal for equal values"""
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return {'ndarray': canonical(value.tolist()), 'dtype': str(value.dtype)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return repr(value)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+class ResultCache(object):
+    """Two-tier LRU cache of the results of acquire_point()"""
+
+    def __init__(self, memory_size=64 * 2**20, path=None, disk_size=2**30):
+        """
+        memory_size and disk_size are the limits (bytes) of the tiers. path
+        is the directory of the disk tier, None for no disk tier.
+        """
+        self.memory_size = memory_size
+        self.path = path
+        self.disk_size = disk_size
+        self.__lock__ = Lock()
+        self.__memory__ = OrderedDict()     # key: pickled result
+        self.__memory_bytes__ = 0
+        self.__disk__ = OrderedDict()       # key: size of the file
+        self.__disk_bytes__ = 0
+        if path is not None:
+            self.__load_disk__()
+        self.reset_stats()
+
+    def __load_disk__(self):
+        """Index the files of the disk tier, least recently used first"""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for mtime, key, size in sorted(entries):
+            self.__disk__[key] = size
+            self.__disk_bytes__ += size
+
+    def __cache_file__(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def reset_stats(self):
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits (memory)': self.hits_memory,
+                'hits (disk)': self.hits_disk,
+                'misses': self.misses}
+
+    @staticmethod
+    def key(*parts):
+        """Return the key of the canonical form of parts"""
+        text = json.dumps(canonical(parts), sort_keys=True)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached result of key, or None"""
+        with self.__lock__:
+            data = self.__memory__.get(key)
+            if data is not None:
+                self.__memory__.move_to_end(key)
+                self.hits_memory += 1
+                return pickle.loads(data)
+            if key not in self.__disk__:
+                self.misses += 1
+                return
+            try:
+                with open(self.__cache_file__(key), 'rb') as f:
+                    data = f.read()
+                result = pickle.loads(data)
+                os.utime(self.__cache_file__(key))    # Recently used
+            except Exception:
+                # Removed or damaged: compute the point again
+                self.__drop_disk__(key)
+                self.misses += 1
+                return
+            self.__disk__.move_to_end(key)
+            self.__put_memory__(key, data)
+            self.hits_disk += 1
+            return result
+
+    def put(self, key, result):
+        """Cache result under key in both tiers"""
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.__lock__:
+            self.__put_memory__(key, data)
+            if self.path is None or len(data) > self.disk_size:
+                return
+            try:
+                tmp = self.__cache_file__(key) + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, self.__cache_file__(key))
+            except (IOError, OSError):
+                return      # The disk tier is best effort
+            self.__disk_bytes__ += len(data) - self.__disk__.pop(key, 0)
+            self.__disk__[key] = len(data)
+            while self.__disk_bytes__ > self.disk_size:
+                self.__drop_disk__(next(iter(self.__disk__)))
+
+    def __put_memory__(self, key, data):
+        if len(data) > self.memory_size:
+            return
+        self.__memory_bytes__ += len(data) - len(self.__memory__.pop(key, b''))
+        self.__memory__[key] = data
+        while self.__memory_bytes__ > self.memory_size:
+            evicted_key, evicted = self.__memory__.popitem(last=False)
+            self.__memory_bytes__ -= len(evicted)
+
+    def __drop_disk__(self, key):
+        self.__disk_bytes__ -= self.__disk__.pop(key, 0)
+        try:
+            os.remove(self.__cache_file__(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Remove every cached result"""
+        with self.__lock__:
+            self.__memory__.clear()
+            self.__memory_bytes__ = 0
+            for key in list(self.__disk__):
+                self.__drop_disk__(key)
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the fixed-rate scheduler of the Run state.
+
+Calling time.sleep() in acquire() adds the sleep to the time acquire() and
+the state machine take, so the sample rate drifts and jitters. With
+self.sample_period set, the state machine instead calls acquire() at fixed
+deadlines on the monotonic clock: the k-th sample of a run is due at
+start + k * sample_period, whatever the previous samples took. A sample
+running late does not delay the following ones.
+
+A deadline passed by more than one period is missed: no sample is taken
+for it and it is counted, so the samples stay on the grid of deadlines.
+The scheduler sleeps until shortly before a deadline and spins for the rest,
+which keeps the jitter to a few microseconds at kHz rates when acquire() is
+fast. A pause restarts the deadlines from the end of the pause. While it
+sleeps, the scheduler wakes up on the Stop, Pause and Exit requests, so they
+take effect at once even with long sample periods.
+"""
+
+
+from __future__ import print_function, division
+import time
+
+
+def interrupted(flags):
+    """Requests ending the wait for a deadline"""
+    return flags['stop'] or flags['pause'] or flags['exit']
+
+
+class FixedRateScheduler(object):
+    """Monotonic deadlines every period seconds"""
+
+    def __init__(self, period, spin=2e-4, requests=None):
+        """
+        period is the sample period (s). The last spin seconds before a
+        deadline are busy-waited instead of slept, as sleeps overshoot.
+
+        requests are the request flags of the application (see
+        statemachine.Requests), which interrupt the sleeps.
+        """
+        if period <= 0:
+            raise ValueError("The sample period needs to be positive")
+        self.period = period
+        self.spin = spin
+        self.requests = requests
+        self.start()
+
+    def start(self):
+        """Start a new run: the first sample is due now"""
+        self.t_start = time.perf_counter()
+        self.__deadline__ = self.t_start
+        self.n_samples = 0
+        self.n_missed = 0
+        self.max_lateness = 0.0
+
+    def rebase(self):
+        """Restart the deadlines from now, e.g., after a pause"""
+        self.__deadline__ = time.perf_counter()
+
+    def wait(self):
+        """
+        Wait for the next deadline. Return the time of the sample (s since
+        the start of the run) and how late it is (s), or None if a Stop,
+        Pause or Exit request came first; the deadline is then kept for the
+        next call.
+        """
+        deadline = self.__deadline__
+        now = time.perf_counter()
+        if now < deadline:
+            if deadline - now > self.spin:
+                if self.requests is None:
+                    time.sleep(deadline - now - self.spin)
+                elif self.requests.wait(interrupted,
+                                        deadline - now - self.spin):
+                    return
+            while now < deadline:
+                now = time.perf_counter()
+        elif now - deadline >= self.period:
+            # Skip the deadlines passed already, keeping the phase
+            n_missed = int((now - deadline) // self.period)
+            self.n_missed += n_missed
+            deadline += n_missed * self.period
+        lateness = now - deadline
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+        self.__deadline__ = deadline + self.period
+        self.n_samples += 1
+        return now - self.t_start, lateness
+
+    def stats(self):
+        """Return the counters of the current run as a dictionary"""
+        return {'period': self.period,
+                'samples': self.n_samples,
+                'missed deadlines': self.n_missed,
+                'max lateness': self.max_lateness}
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines simulated instruments for examples and benchmarks.
+
+A simulated instrument answers every read after a latency, optionally with a
+random jitter. A read returns one value per channel: a number for a single
+channel instrument, an array otherwise. read_block() returns many samples at
+once, like a buffered acquisition, and pays the latency once per block.
+
+It can be read with a blocking call, read() or read_block(), or from a
+coroutine, read_async().
+"""
+
+
+from __future__ import print_function
+import asyncio
+import time
+import numpy as np
+
+
+class SimulatedInstrument(object):
+    """Instrument answering every read after a latency"""
+
+    def __init__(self, name, latency=0.01, jitter=0.0, channels=1, seed=None):
+        """
+        latency is the mean time (s) each read takes and jitter the standard
+        deviation (s) of a normal random addition to it. channels is the
+        number of values returned per sample. seed makes the jitter
+        reproducible.
+        """
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.channels = channels
+        self.n_reads = 0
+        self.__random__ = np.random.RandomState(seed)
+
+    def __delay__(self):
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self.latency + self.__random__.normal(0, self.jitter))
+
+    def __values__(self, n_samples):
+        """Return n_samples samples, shape (n_samples, channels)"""
+        phase = (self.n_reads + np.arange(n_samples)) * 0.01
+        self.n_reads += n_samples
+        return np.sin(phase[:, None] + np.arange(self.channels)[None, :])
+
+    def __value__(self):
+        values = self.__values__(1)[0]
+        return values[0] if self.channels == 1 else values
+
+    def read(self):
+        """Blocking read of one sample"""
+        time.sleep(self.__delay__())
+        return self.__value__()
+
+    def read_block(self, n_samples):
+        """
+        Blocking read of n_samples samples. Return an array of shape
+        (n_samples, channels).
+        """
+        time.sleep(self.__delay__())
+        return self.__values__(n_samples)
+
+    async def read_async(self):
+        """Non-blocking read, to be awaited in a coroutine"""
+        await asyncio.sleep(self.__delay__())
+        return self.__value__()
@@ -2,15 +2,26 @@
 # Author: Justin
 
 """
-This module asserts two abstract classes for state machine application.
+This module asserts two abstract classes for state machine application, and a
+thread-safe set of request flags the states can block on.
 """
 
+from threading import Condition
+import time
+
+
 class State(object):
     """Template class State"""
     def run(self):
         assert False, "State.run() not implemented!"
     def next(self):
         assert False, "State.next() not implemented!"
+    def ready(self):
+        """
+        Return False if run() would block waiting for a request. Used to
+        share worker threads between state machines, see run_until_blocked().
+        """
+        return True
 
 class StateMachine(object):
     """Template class StateMachine"""
@@ -18,10 +29,77 @@ class StateMachine(object):
         """Initialize a state machine. The initial state is added."""
         print("StateMachine starts running ...")
         self.curr_state = initial_state
+        # Optional observer(state, duration) called after every run() of a
+        # state, e.g., to measure the time spent in each state
+        self.observer = None
+
+    def __step__(self):
+        """Run the current state and move to the next one"""
+        if self.observer is None:
+            self.curr_state.run()
+        else:
+            t_start = time.perf_counter()
+            self.curr_state.run()
+            self.observer(self.curr_state, time.perf_counter() - t_start)
+        self.curr_state = self.curr_state.next()
 
     def runAll(self):
         """Run all states"""
         while self.curr_state is not None:
-            self.curr_state.run()
-            self.curr_state = self.curr_state.next()
+            self.__step__()
         print("StateMachine has terminated.")
+
+    def run_until_blocked(self, time_slice=None):
+        """
+        Run states until the current state is not ready, the state machine
+        has terminated, or time_slice seconds have elapsed.
+
+        Return True if the state machine has not terminated yet.
+        """
+        deadline = None if time_slice is None else time.time() + time_slice
+        while self.curr_state is not None and self.curr_state.ready():
+            self.__step__()
+            if deadline is not None and time.time() >= deadline:
+                break
+        if self.curr_state is None:
+            print("StateMachine has terminated.")
+            return False
+        return True
+
+
+class Requests(object):
+    """
+    Thread-safe set of named request flags.
+
+    The UI thread sets and clears the flags; the state machine thread blocks
+    in wait() until the flags it cares about are set, instead of polling.
+    """
+    def __init__(self, names):
+        self.__cond__ = Condition()
+        self.__flags__ = dict.fromkeys(names, False)
+        self.__listeners__ = []
+
+    def add_listener(self, callback):
+        """Call callback() after every change of a flag"""
+        self.__listeners__.append(callback)
+
+    def get(self, name):
+        """Return the value of flag name"""
+        return self.__flags__[name]
+
+    def set(self, name, value=True):
+        """Set flag name to value and wake up the waiting threads"""
+        with self.__cond__:
+            self.__flags__[name] = bool(value)
+            self.__cond__.notify_all()
+        for callback in self.__listeners__:
+            callback()
+
+    def wait(self, predicate, timeout=None):
+        """
+        Block until predicate(flags) is true, where flags is a dictionary of
+        the flag values. Return the last value of predicate(flags).
+        """
+        with self.__cond__:
+            return self.__cond__.wait_for(lambda: predicate(self.__flags__),
+                                          timeout)
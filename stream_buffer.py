@@ -0,0 +1,203 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines a coalescing stream buffer that sits between the state
+machine thread and the Bokeh document.
+
+Rows returned by many acquire() calls are gathered in the buffer and flushed
+to the application outputs as one columnar stream() patch. A flush happens
+when the flush interval has elapsed or when enough rows are waiting, whichever
+comes first. Counters for flushes, rows per flush and queue depth are kept so
+the buffer can be tuned against a given application.
+"""
+
+
+from __future__ import print_function, division
+from threading import Lock, Event
+import numpy as np
+import time
+
+
+class StreamBuffer(object):
+    """Coalescing buffer for outputs.stream() patches"""
+
+    def __init__(self, inst_app, sink, interval=0.1, max_rows=1000):
+        """
+        inst_app is the application class instance. Its __doc__ is used to
+        schedule the flushes on the Bokeh IO loop. If it has no document, the
+        rows are flushed to the sink right away in the calling thread.
+
+        sink is called with a dictionary of columns for every flush.
+
+        interval is the maximum time (in seconds) a row waits in the buffer;
+        max_rows is the number of waiting rows that triggers an early flush.
+        """
+        self.inst_app = inst_app    # A reference to application class instance
+        self.sink = sink
+        self.interval = interval
+        self.max_rows = max_rows
+
+        self.__lock__ = Lock()
+        self.__chunks__ = []            # Normalized dictionaries of columns
+        self.__n_pending__ = 0          # Number of rows waiting in __chunks__
+        self.__timeout_scheduled__ = False
+        self.__next_tick_scheduled__ = False
+        self.__scheduled_at__ = {}      # Flush callback: perf_counter() due
+        self.__drained__ = Event()
+        self.__drained__.set()
+        self.reset_counters()
+
+    def reset_counters(self):
+        """Reset the flush statistics"""
+        self.n_flushes = 0
+        self.n_rows_flushed = 0
+        self.last_rows_per_flush = 0
+        self.max_rows_per_flush = 0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self):
+        """Number of rows waiting to be flushed"""
+        return self.__n_pending__
+
+    def stats(self):
+        """Return the flush statistics as a dictionary"""
+        mean = self.n_rows_flushed / self.n_flushes if self.n_flushes else 0
+        return {'flushes': self.n_flushes,
+                'rows flushed': self.n_rows_flushed,
+                'rows per flush (last)': self.last_rows_per_flush,
+                'rows per flush (mean)': mean,
+                'rows per flush (max)': self.max_rows_per_flush,
+                'queue depth': self.__n_pending__,
+                'queue depth (max)': self.max_queue_depth}
+
+    def append(self, new_data):
+        """
+        Add a normalized dictionary of columns (as produced by __acquire__)
+        to the buffer and schedule a flush if needed. Called from the state
+        machine thread.
+        """
+        n_rows = len(next(iter(new_data.values()))) if new_data else 0
+        if n_rows == 0:
+            return
+        doc = self.inst_app.__doc__
+        with self.__lock__:
+            self.__chunks__.append(new_data)
+            self.__n_pending__ += n_rows
+            self.__drained__.clear()
+            if self.__n_pending__ > self.max_queue_depth:
+                self.max_queue_depth = self.__n_pending__
+            if doc is None:
+                schedule = None
+            elif (self.__n_pending__ >= self.max_rows and
+                    not self.__next_tick_scheduled__):
+                self.__next_tick_scheduled__ = True
+                schedule = 'next_tick'
+            elif (not self.__timeout_scheduled__ and
+                    not self.__next_tick_scheduled__):
+                self.__timeout_scheduled__ = True
+                schedule = 'timeout'
+            else:
+                schedule = False
+
+        if schedule is None:
+            # No IO loop to hand the rows to: flush in the calling thread
+            if self.__n_pending__ >= self.max_rows:
+                self.flush()
+        elif schedule == 'next_tick':
+            self.__scheduled_at__['next_tick'] = time.perf_counter()
+            doc.add_next_tick_callback(self.__flush_next_tick__)
+        elif schedule == 'timeout':
+            self.__scheduled_at__['timeout'] = time.perf_counter() + \
+                                               self.interval
+            doc.add_timeout_callback(self.__flush_timeout__,
+                                     int(self.interval * 1000))
+
+    def __record_lag__(self, callback):
+        """Record how late a flush callback runs on the IO loop"""
+        metrics = self.inst_app.__metrics__
+        if metrics is not None and callback in self.__scheduled_at__:
+            metrics.record('stream lag', max(0.0, time.perf_counter() -
+                                             self.__scheduled_at__[callback]))
+
+    def __flush_next_tick__(self):
+        with self.__lock__:
+            self.__next_tick_scheduled__ = False
+        self.__record_lag__('next_tick')
+        self.flush()
+
+    def __flush_timeout__(self):
+        with self.__lock__:
+            self.__timeout_scheduled__ = False
+        self.__record_lag__('timeout')
+        self.flush()
+
+    def flush(self):
+        """
+        Merge all waiting rows and send them to the sink as one patch.
+
+        Must run on the Bokeh IO loop when the application has a document.
+        """
+        with self.__lock__:
+            chunks = self.__chunks__
+            n_rows = self.__n_pending__
+            self.__chunks__ = []
+            self.__n_pending__ = 0
+        if n_rows:
+            self.sink(self.merge(chunks))
+            self.n_flushes += 1
+            self.n_rows_flushed += n_rows
+            self.last_rows_per_flush = n_rows
+            if n_rows > self.max_rows_per_flush:
+                self.max_rows_per_flush = n_rows
+        with self.__lock__:
+            if self.__n_pending__ == 0:
+                self.__drained__.set()
+
+    def drain(self, timeout=5):
+        """
+        Flush everything that is waiting and block until the rows reached the
+        sink. Called from the state machine thread, e.g., before save().
+
+        Return False if the rows were not flushed within timeout seconds.
+        """
+        doc = self.inst_app.__doc__
+        if doc is None:
+            self.flush()
+            return True
+        with self.__lock__:
+            if self.__n_pending__ == 0:
+                return True
+            schedule = not self.__next_tick_scheduled__
+            self.__next_tick_scheduled__ = True
+        if schedule:
+            self.__scheduled_at__['next_tick'] = time.perf_counter()
+            doc.add_next_tick_callback(self.__flush_next_tick__)
+        return self.__drained__.wait(timeout)
+
+    def clear(self):
+        """Drop the waiting rows, e.g., when a new run starts"""
+        with self.__lock__:
+            self.__chunks__ = []
+            self.__n_pending__ = 0
+            self.__drained__.set()
+
+    @staticmethod
+    def merge(chunks):
+        """
+        Merge a list of dictionaries of columns into one dictionary of
+        columns. NumPy columns are concatenated, anything else is joined into
+        a list.
+        """
+        merged = {}
+        for key in chunks[0]:
+            values = [chunk[key] for chunk in chunks]
+            if all(isinstance(value, np.ndarray) for value in values):
+                merged[key] = np.concatenate(values)
+            else:
+                column = []
+                for value in values:
+                    column.extend(value)
+                merged[key] = column
+        return merged
@@ -0,0 +1,224 @@
+#!/usr/bin/python
+# Author: Justin
+
+"""
+This module defines the parallel sweep mode of AcquisitionAPP.
+
+Many applications loop over a grid of inputs one point at a time, although
+the points are independent, e.g., simulations or offline computations. In
+sweep mode (self.acquisition_mode = 'sweep'), the application declares the
+swept inputs and a function computing one point, and the framework spreads
+the points across a pool of worker processes:
+
+    self.acquisition_mode = 'sweep'
+    self.sweep_inputs = ['Pulse width (ns)', 'Volt (V)']   # Outermost first
+
+    @staticmethod
+    def acquire_point(point, parameters):
+        # point: {'Pulse width (ns)': 10, 'Volt (V)': -0.5}
+        # parameters: the pythonic strings of self.parameters
+        return {'Error rate': ...}
+
+With self.cache_results set, the points found in the result cache (see
+result_cache.py) are streamed right away instead of being submitted.
+
+acquire_point() runs in another process, so it must be a static method (or a
+module-level function) and its arguments and results must be picklable. The
+rows, i.e., the point merged with the result, are streamed to the outputs in
+completion order, or in grid order if self.sweep_ordered is True.
+
+Only a few points per worker are submitted at a time, so pausing or stopping
+the run leaves little work behind: no new point is submitted, and the
+submitted points that have not started are cancelled (the points already
+handed to a worker process finish). The points of a paused run are submitted
+again when it resumes.
+"""
+
+
+from __future__ import print_function
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from threading import Lock
+import itertools
+import os
+
+
+def sweep_axes(inst_app):
+    """
+    Return the names of the swept inputs of inst_app, outermost first, and
+    the list of the values of each, or None if an input cannot be parsed.
+    """
+    names = inst_app.sweep_inputs
+    if names is None:
+        names = list(inst_app.inputs)
+    values = []
+    for name in names:
+        string = inst_app.inputs.get(name, inst_app.parameters.get(name))
+        if string is None:
+            inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                        "Swept input '{}' is not defined".format(name))
+            return
+        value = inst_app.parse(string)
+        if value is None:
+            return
+        if not hasattr(value, '__iter__') or type(value) is str:
+            value = [value]
+        values.append(value)
+    return names, values
+
+
+class SweepRunner(object):
+    """Process pool running the points of a sweep"""
+
+    def __init__(self, inst_app, max_workers=None, poll_interval=0.1):
+        """
+        max_workers is the number of worker processes (default: the number
+        of CPUs). acquire() waits at most poll_interval seconds for a point,
+        so the state machine stays responsive to the UI events.
+        """
+        self.inst_app = inst_app    # A reference to application class instance
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.poll_interval = poll_interval
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self.__lock__ = Lock()
+        self.__points__ = []
+        self.__futures__ = {}       # future: index of the point
+        self.__keys__ = {}          # index: cache key of the point
+        self.__todo__ = deque()     # Indices of the points to submit
+        self.__done__ = {}          # index: row, waiting to be emitted
+        self.__n_emitted__ = 0
+        inst_app.__requests__.add_listener(self.__on_request__)
+
+    def __on_request__(self):
+        if self.inst_app.__pause_request__ or self.inst_app.__stop_request__:
+            self.cancel()
+
+    def grid(self):
+        """
+        Return the points of the sweep as a list of dictionaries, or None if
+        an input cannot be parsed. The last swept input varies fastest.
+        """
+        axes = sweep_axes(self.inst_app)
+        if axes is None:
+            return
+        names, values = axes
+        points = [dict(zip(names, point))
+                  for point in itertools.product(*values)]
+        if self.inst_app.worker_index is not None:
+            # A worker of a distributed sweep computes its share of the grid
+            points = points[self.inst_app.worker_index::
+                            self.inst_app.worker_count]
+        return points
+
+    def start(self):
+        """Forget the previous sweep and return False if the grid is invalid"""
+        self.cancel()
+        points = self.grid()
+        with self.__lock__:
+            self.__futures__.clear()    # Running points of a stopped sweep
+            self.__keys__.clear()
+            self.__done__.clear()
+            self.__n_emitted__ = 0
+            self.__points__ = points or []
+            self.__todo__ = deque(range(len(self.__points__)))
+        return points is not None
+
+    def __submit__(self):
+        """
+        Keep two points per worker submitted. Cached points are done without
+        being submitted.
+        """
+        parameters = dict(self.inst_app.parameters)
+        cache = self.inst_app.result_cache()
+        with self.__lock__:
+            while self.__todo__ and \
+                    len(self.__futures__) < 2 * self.max_workers:
+                index = self.__todo__.popleft()
+                point = self.__points__[index]
+                if cache is not None:
+                    key = self.inst_app.cache_key(point, parameters)
+                    result = cache.get(key)
+                    if result is not None:
+                        row = dict(point)
+                        row.update(result)
+                        self.__done__[index] = row
+                        continue
+                    self.__keys__[index] = key
+                future = self.executor.submit(self.inst_app.acquire_point,
+                                              point, parameters)
+                self.__futures__[future] = index
+
+    def cancel(self):
+        """
+        Cancel the submitted points that have not started yet. They are
+        submitted again by the next acquire().
+        """
+        with self.__lock__:
+            indices = []
+            for future, index in list(self.__futures__.items()):
+                if future.cancel():
+                    del self.__futures__[future]
+                    indices.append(index)
+            # Back at the front of the queue, in the order they were submitted
+            self.__todo__.extendleft(reversed(indices))
+
+    def acquire(self):
+        """
+        Acquisition cycle of the sweep mode. Return the rows of the points
+        completed so far as a dictionary of lists, or None on errors.
+        """
+        inst_app = self.inst_app
+        if inst_app.__just_started__:
+            if not self.start():
+                return
+            inst_app.__just_started__ = False
+        self.__submit__()
+        with self.__lock__:
+            futures = list(self.__futures__)
+        if futures:
+            wait(futures, timeout=self.poll_interval,
+                 return_when=FIRST_COMPLETED)
+
+        rows = []
+        cache = inst_app.result_cache()
+        with self.__lock__:
+            # Cancelled points go back to the front of the queue, in order
+            cancelled = [self.__futures__.pop(future) for future in futures
+                         if future in self.__futures__ and future.cancelled()]
+            self.__todo__.extendleft(reversed(cancelled))
+            for future in futures:
+                if not future.done() or future not in self.__futures__:
+                    continue
+                index = self.__futures__.pop(future)
+                error = future.exception()
+                if error is not None:
+                    inst_app.__message__ += "<p><font color='red'>Error: {}</font><p>".format(
+                            "Point {} failed: {!r}".format(
+                            self.__points__[index], error))
+                    return
+                key = self.__keys__.pop(index, None)
+                if key is not None and cache is not None:
+                    cache.put(key, future.result())
+                row = dict(self.__points__[index])
+                row.update(future.result())
+                self.__done__[index] = row
+            if inst_app.sweep_ordered:
+                # Emit the completed points that follow the last one emitted
+                while self.__n_emitted__ in self.__done__:
+                    rows.append(self.__done__.pop(self.__n_emitted__))
+                    self.__n_emitted__ += 1
+            else:
+                rows = list(self.__done__.values())
+                self.__n_emitted__ += len(rows)
+                self.__done__.clear()
+            finished = self.__n_emitted__ == len(self.__points__)
+        if finished:
+            inst_app.__stop_request__ = True    # Done with the sweep
+        if not rows:
+            return {}
+        return {key: [row[key] for row in rows] for key in rows[0]}
+
+    def close(self):
+        """Cancel the submitted points and stop the worker processes"""
+        self.cancel()
+        self.executor.shutdown(wait=False)